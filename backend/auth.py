@@ -1,24 +1,98 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Any, Callable, Dict, Optional, Tuple
+import asyncio
 import os
 import jwt
 from passlib.context import CryptContext
 from fastapi import HTTPException, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from models import User, UserInDB, Profile
+from models import User, UserInDB, UserRole, Profile, TokenClaims
 from database import db
+from cache import TTLCache
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password hashing; hashes with a different cost are rehashed on the next login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS
+)
+
+class PasswordHasher:
+    """Runs bcrypt work on a bounded thread pool so it never blocks the event loop
+
+    bcrypt releases the GIL while hashing, so threads run in parallel. Once
+    max_queue calls are waiting for a worker, new calls are rejected with a
+    503 instead of piling up behind a login storm.
+    """
+
+    def __init__(self, workers: int, max_queue: int):
+        self.workers = max(1, workers)
+        self.max_pending = self.workers + max(0, max_queue)
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password")
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Run password work on the pool, or raise 503 when the queue is full"""
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server is busy, please try again",
+                headers={"Retry-After": "1"},
+            )
+
+        self.pending += 1
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+            self.completed += 1
+            return result
+        finally:
+            self.pending -= 1
+
+    def shutdown(self):
+        """Stop the worker threads"""
+        self.executor.shutdown(wait=False)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return pool usage counters"""
+        return {
+            "workers": self.workers,
+            "rounds": BCRYPT_ROUNDS,
+            "pending": self.pending,
+            "queued": max(0, self.pending - self.workers),
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+password_hasher = PasswordHasher(
+    workers=int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1)))),
+    max_queue=int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "32"))
+)
 
 # JWT settings
 SECRET_KEY = os.getenv("JWT_SECRET", "netflix_jwt_secret_key_2025")
 ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_HOURS = int(os.getenv("JWT_EXPIRATION_HOURS", "24"))
 
+# Embed plan, active flag and profile ids in tokens so profile access needs no database read
+TOKEN_CLAIMS_ENABLED = os.getenv("AUTH_TOKEN_CLAIMS", "false").lower() == "true"
+
 # Bearer token
 security = HTTPBearer()
 
+# Validated users by id; writes to a user document must call invalidate_user
+USER_CACHE_ENABLED = os.getenv("AUTH_USER_CACHE_ENABLED", "true").lower() == "true"
+user_cache = TTLCache(
+    max_size=int(os.getenv("AUTH_USER_CACHE_SIZE", "10000")),
+    default_ttl=float(os.getenv("AUTH_USER_CACHE_TTL", "300"))
+)
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash"""
     return pwd_context.verify(plain_password, hashed_password)
@@ -27,6 +101,14 @@ def get_password_hash(password: str) -> str:
     """Hash a password"""
     return pwd_context.hash(password)
 
+async def verify_password_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verify a password off the event loop, returning a replacement hash when the cost changed"""
+    return await password_hasher.run(pwd_context.verify_and_update, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    """Hash a password off the event loop"""
+    return await password_hasher.run(pwd_context.hash, password)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Create a JWT access token"""
     to_encode = data.copy()
@@ -39,6 +121,29 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def claims_for_user(user: User) -> TokenClaims:
+    """Build the authorization claims for a user"""
+    return TokenClaims(
+        sub=user.id,
+        plan=user.subscription_plan,
+        active=user.is_active,
+        profiles=[profile.id for profile in user.profiles],
+        ver=user.token_version
+    )
+
+def user_claims(user: User) -> dict:
+    """Build the data to sign into a user's access token"""
+    if not TOKEN_CLAIMS_ENABLED:
+        return {"sub": user.id}
+    claims = claims_for_user(user)
+    return {
+        "sub": claims.sub,
+        "plan": claims.plan.value,
+        "active": claims.active,
+        "profiles": claims.profiles,
+        "ver": claims.ver
+    }
+
 def verify_token(token: str) -> Optional[dict]:
     """Verify and decode a JWT token"""
     try:
@@ -54,24 +159,70 @@ async def get_user_by_email(email: str) -> Optional[UserInDB]:
         return UserInDB(**user_data)
     return None
 
-async def get_user_by_id(user_id: str) -> Optional[UserInDB]:
-    """Get user by ID from database"""
+async def get_user_by_id(user_id: str, use_cache: bool = True) -> Optional[UserInDB]:
+    """Get user by ID, served from the user cache when possible
+
+    With use_cache=False the document is always read, and the cached copy
+    is replaced with it.
+    """
+    if USER_CACHE_ENABLED and use_cache:
+        user = user_cache.get(user_id)
+        if user is not None:
+            return user
+
     user_data = await db.database.users.find_one({"id": user_id})
     if user_data:
-        return UserInDB(**user_data)
+        user = UserInDB(**user_data)
+        if USER_CACHE_ENABLED:
+            user_cache.set(user_id, user)
+        return user
     return None
 
+def invalidate_user(user_id: str):
+    """Drop a cached user after its document changes"""
+    user_cache.delete(user_id)
+
+# Current token version per user, read from the user document and cached briefly,
+# so tokens issued before a profile change are refused on every worker
+token_versions = TTLCache(
+    max_size=int(os.getenv("AUTH_TOKEN_VERSION_CACHE_SIZE", "100000")),
+    default_ttl=float(os.getenv("AUTH_TOKEN_VERSION_TTL", "30"))
+)
+
+async def get_token_version(user_id: str) -> Optional[int]:
+    """Get a user's current token version, or None for an unknown user"""
+    version = token_versions.get(user_id)
+    if version is not None:
+        return version
+
+    user_data = await db.database.users.find_one({"id": user_id}, {"_id": 0, "token_version": 1})
+    if user_data is None:
+        return None
+    version = user_data.get("token_version", 0)
+    token_versions.set(user_id, version)
+    return version
+
+def bump_token_version(user_id: str, version: int):
+    """Apply a version already written to the user document on this worker without waiting for the TTL"""
+    if version > token_versions.get(user_id, 0):
+        token_versions.set(user_id, version)
+
 async def authenticate_user(email: str, password: str) -> Optional[UserInDB]:
     """Authenticate user with email and password"""
     user = await get_user_by_email(email)
     if not user:
         return None
-    if not verify_password(password, user.hashed_password):
+    valid, new_hash = await verify_password_async(password, user.hashed_password)
+    if not valid:
         return None
+    if new_hash:
+        # Rehash with the configured cost now that we have the plain password
+        await db.database.users.update_one({"id": user.id}, {"$set": {"hashed_password": new_hash}})
+        invalidate_user(user.id)
+        user.hashed_password = new_hash
     return user
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> UserInDB:
-    """Get current authenticated user"""
+async def _token_user(credentials: HTTPAuthorizationCredentials, use_cache: bool) -> UserInDB:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -91,18 +242,91 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     except Exception:
         raise credentials_exception
     
-    user = await get_user_by_id(user_id)
+    user = await get_user_by_id(user_id, use_cache)
     if user is None:
         raise credentials_exception
     
     return user
 
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> UserInDB:
+    """Get current authenticated user"""
+    return await _token_user(credentials, use_cache=True)
+
 async def get_current_active_user(current_user: UserInDB = Depends(get_current_user)) -> UserInDB:
     """Get current active user"""
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
 
+async def get_uncached_active_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> UserInDB:
+    """Get current active user read straight from the user document
+
+    For issuing tokens: another worker may have changed the user, and a
+    cached copy would sign claims that are already out of date.
+    """
+    current_user = await _token_user(credentials, use_cache=False)
+    if not current_user.is_active:
+        raise HTTPException(status_code=400, detail="Inactive user")
+    bump_token_version(current_user.id, current_user.token_version)
+    return current_user
+
+async def get_current_admin_user(current_user: UserInDB = Depends(get_current_active_user)) -> UserInDB:
+    """Get current user, requiring the admin role"""
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+    return current_user
+
+async def get_token_claims(credentials: HTTPAuthorizationCredentials = Depends(security)) -> TokenClaims:
+    """Get the caller's claims from the token, checking only its cached token version
+
+    The full user is loaded only for tokens issued without claims.
+    """
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+    payload = verify_token(credentials.credentials)
+    if payload is None or payload.get("sub") is None:
+        raise credentials_exception
+
+    if "profiles" in payload:
+        try:
+            claims = TokenClaims(**payload)
+        except Exception:
+            raise credentials_exception
+        version = await get_token_version(claims.sub)
+        if version is None:
+            raise credentials_exception
+        if claims.ver < version:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Token is out of date, please refresh it",
+                headers={"WWW-Authenticate": "Bearer", "X-Token-Refresh": "required"},
+            )
+        return claims
+
+    user = await get_user_by_id(payload["sub"])
+    if user is None:
+        raise credentials_exception
+    return claims_for_user(user)
+
+async def get_active_token_claims(claims: TokenClaims = Depends(get_token_claims)) -> TokenClaims:
+    """Get claims for an active user"""
+    if not claims.active:
+        raise HTTPException(status_code=400, detail="Inactive user")
+    return claims
+
+def require_profile_claims(profile_id: str, claims: TokenClaims) -> str:
+    """Require access to a specific profile using token claims only"""
+    if profile_id not in claims.profiles:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profile not found or access denied"
+        )
+    return profile_id
+
 async def get_profile_by_id(profile_id: str, user: UserInDB) -> Optional[Profile]:
     """Get profile by ID for current user"""
     for profile in user.profiles:
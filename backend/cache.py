@@ -0,0 +1,200 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Hashable, List, Optional, Pattern, Tuple
+from urllib.parse import urlencode
+import os
+import re
+import time
+import logging
+
+from database import db
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Bounded in-process LRU cache whose entries expire after a TTL"""
+
+    def __init__(self, max_size: int, default_ttl: Optional[float] = None):
+        self.max_size = max(1, max_size)
+        self.default_ttl = default_ttl
+        self._entries: "OrderedDict[Hashable, Tuple[Optional[float], Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return a live entry and mark it as recently used"""
+        entry = self._entries.get(key, _MISSING)
+        if entry is _MISSING:
+            self.misses += 1
+            return default
+
+        expires_at, value = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return default
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Store an entry, evicting the least recently used one when full"""
+        ttl = self.default_ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key: Hashable) -> bool:
+        """Drop an entry, returning whether it existed"""
+        return self._entries.pop(key, _MISSING) is not _MISSING
+
+    def clear(self):
+        """Drop every entry"""
+        self._entries.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        entry = self._entries.get(key, _MISSING)
+        if entry is _MISSING:
+            return False
+        expires_at, _ = entry
+        return expires_at is None or expires_at > time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss/eviction counters"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class TMDBResponseCache:
+    """Two-tier TTL cache for TMDB responses: in-process LRU (L1) over a Mongo collection (L2)"""
+
+    # (name, endpoint pattern, default TTL in seconds); first match wins
+    DEFAULT_TTL_RULES = [
+        ("trending", r"^/trending/", 600),
+        ("lists", r"^/(movie|tv)/(popular|top_rated|now_playing|upcoming|on_the_air|airing_today)$", 1800),
+        ("discover", r"^/discover/", 1800),
+        ("search", r"^/search/", 3600),
+        ("details", r"^/(movie|tv)/\d+", 86400),
+    ]
+
+    def __init__(self):
+        self.enabled = os.getenv("TMDB_CACHE_ENABLED", "true").lower() == "true"
+        self.l2_enabled = os.getenv("TMDB_CACHE_L2_ENABLED", "true").lower() == "true"
+        self.default_ttl = int(os.getenv("TMDB_CACHE_TTL_DEFAULT", "600"))
+        self.ttl_rules: List[Tuple[str, Pattern, int]] = [
+            (name, re.compile(pattern), int(os.getenv(f"TMDB_CACHE_TTL_{name.upper()}", str(ttl))))
+            for name, pattern, ttl in self.DEFAULT_TTL_RULES
+        ]
+        self.l1 = TTLCache(max_size=int(os.getenv("TMDB_CACHE_MAX_ENTRIES", "5000")))
+        self.l2_hits = 0
+        self.l2_misses = 0
+        self.l2_errors = 0
+
+    @staticmethod
+    def make_key(endpoint: str, params: Optional[Dict[str, Any]] = None) -> str:
+        """Build a cache key from the endpoint and normalized params, excluding the API key"""
+        items = sorted(
+            (str(name), str(value)) for name, value in (params or {}).items()
+            if name != "api_key" and value is not None
+        )
+        return f"{endpoint}?{urlencode(items)}" if items else endpoint
+
+    def ttl_for(self, endpoint: str) -> int:
+        """Return the TTL configured for an endpoint"""
+        for _, pattern, ttl in self.ttl_rules:
+            if pattern.match(endpoint):
+                return ttl
+        return self.default_ttl
+
+    def _collection(self):
+        if not self.l2_enabled or db.database is None:
+            return None
+        return db.database.tmdb_cache
+
+    def get_local(self, key: str) -> Optional[Dict[str, Any]]:
+        """Look a response up in the in-process tier"""
+        if not self.enabled:
+            return None
+        return self.l1.get(key)
+
+    async def get_shared(self, key: str) -> Optional[Dict[str, Any]]:
+        """Look a response up in the Mongo tier, promoting hits into the in-process tier"""
+        collection = self._collection()
+        if not self.enabled or collection is None:
+            return None
+
+        try:
+            entry = await collection.find_one({"key": key}, {"_id": 0, "data": 1, "expires_at": 1})
+        except Exception as e:
+            logger.error(f"Error reading TMDB cache: {str(e)}")
+            self.l2_errors += 1
+            return None
+
+        # The TTL monitor only runs periodically, so expired entries may still be present
+        now = datetime.utcnow()
+        if not entry or entry["expires_at"] <= now:
+            self.l2_misses += 1
+            return None
+
+        self.l2_hits += 1
+        self.l1.set(key, entry["data"], ttl=(entry["expires_at"] - now).total_seconds())
+        return entry["data"]
+
+    async def set(self, key: str, endpoint: str, data: Dict[str, Any]):
+        """Store a response in both tiers"""
+        if not self.enabled:
+            return
+
+        ttl = self.ttl_for(endpoint)
+        self.l1.set(key, data, ttl=ttl)
+
+        collection = self._collection()
+        if collection is None:
+            return
+        try:
+            await collection.update_one(
+                {"key": key},
+                {"$set": {
+                    "data": data,
+                    "endpoint": endpoint,
+                    "expires_at": datetime.utcnow() + timedelta(seconds=ttl)
+                }},
+                upsert=True
+            )
+        except Exception as e:
+            logger.error(f"Error writing TMDB cache: {str(e)}")
+            self.l2_errors += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Return counters for both tiers"""
+        return {
+            "enabled": self.enabled,
+            "l1": self.l1.stats(),
+            "l2": {
+                "enabled": self.l2_enabled,
+                "hits": self.l2_hits,
+                "misses": self.l2_misses,
+                "errors": self.l2_errors,
+            },
+        }
@@ -0,0 +1,132 @@
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Union
+import os
+
+from models import Movie, TVShow, ContentType, ContentResponse
+from cache import TTLCache
+
+
+def card_from_title(title: Union[Movie, TVShow]) -> ContentResponse:
+    """Build a ContentResponse from a Movie or TVShow"""
+    if title.content_type == ContentType.MOVIE:
+        return ContentResponse(
+            id=title.id,
+            tmdb_id=title.tmdb_id,
+            title=title.title,
+            overview=title.overview,
+            poster_path=title.poster_path,
+            backdrop_path=title.backdrop_path,
+            release_date=title.release_date,
+            runtime=title.runtime,
+            vote_average=title.vote_average,
+            popularity=title.popularity,
+            genres=title.genres,
+            videos=title.videos,
+            maturity_rating=title.maturity_rating,
+            content_type=ContentType.MOVIE
+        )
+    return ContentResponse(
+        id=title.id,
+        tmdb_id=title.tmdb_id,
+        title=title.name,
+        overview=title.overview,
+        poster_path=title.poster_path,
+        backdrop_path=title.backdrop_path,
+        release_date=title.first_air_date,
+        runtime=None,
+        vote_average=title.vote_average,
+        popularity=title.popularity,
+        genres=title.genres,
+        videos=title.videos,
+        maturity_rating=title.maturity_rating,
+        content_type=ContentType.TV_SHOW
+    )
+
+
+def card_from_doc(content_type: ContentType, doc: Dict[str, Any]) -> ContentResponse:
+    """Build a ContentResponse from a projected movies or tv_shows document"""
+    is_movie = content_type == ContentType.MOVIE
+    return ContentResponse(
+        id=doc["id"],
+        tmdb_id=doc["tmdb_id"],
+        title=doc["title"] if is_movie else doc["name"],
+        overview=doc["overview"],
+        poster_path=doc.get("poster_path"),
+        backdrop_path=doc.get("backdrop_path"),
+        release_date=doc.get("release_date") if is_movie else doc.get("first_air_date"),
+        runtime=doc.get("runtime") if is_movie else None,
+        vote_average=doc.get("vote_average", 0.0),
+        popularity=doc.get("popularity", 0.0),
+        genres=doc.get("genres", []),
+        videos=doc.get("videos", []),
+        maturity_rating=doc.get("maturity_rating"),
+        content_type=content_type
+    )
+
+
+def stitch_json_list(fragments: Iterable[bytes]) -> bytes:
+    """Join serialized JSON values into a JSON array without re-encoding them"""
+    return b"[" + b",".join(fragments) + b"]"
+
+
+class CardCache:
+    """Per-title cache of serialized ContentResponse JSON
+
+    Entries are tagged with the title's updated_at, so a title refreshed by
+    another process is re-serialized even before it is invalidated here.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("CARD_CACHE_ENABLED", "true").lower() == "true"
+        self.cache = TTLCache(
+            max_size=int(os.getenv("CARD_CACHE_SIZE", "20000")),
+            default_ttl=float(os.getenv("CARD_CACHE_TTL", "86400"))
+        )
+        self.renders = 0
+
+    def _get(self, card_id: str, updated_at: Optional[datetime]) -> Optional[bytes]:
+        if not self.enabled:
+            return None
+        entry = self.cache.get(card_id)
+        if entry is not None and entry[0] == updated_at:
+            return entry[1]
+        return None
+
+    def _render(self, card_id: str, updated_at: Optional[datetime], card: ContentResponse) -> bytes:
+        data = card.model_dump_json().encode()
+        self.renders += 1
+        if self.enabled:
+            self.cache.set(card_id, (updated_at, data))
+        return data
+
+    def title_json(self, title: Union[Movie, TVShow]) -> bytes:
+        """Return the serialized card for a title"""
+        data = self._get(title.id, title.updated_at)
+        if data is None:
+            data = self._render(title.id, title.updated_at, card_from_title(title))
+        return data
+
+    def doc_json(self, content_type: ContentType, doc: Dict[str, Any]) -> bytes:
+        """Return the serialized card for a projected catalog document"""
+        updated_at = doc.get("updated_at")
+        data = self._get(doc["id"], updated_at)
+        if data is None:
+            data = self._render(doc["id"], updated_at, card_from_doc(content_type, doc))
+        return data
+
+    def titles_json(self, titles: List[Union[Movie, TVShow]]) -> bytes:
+        """Return a JSON array of cards for titles"""
+        return stitch_json_list(self.title_json(title) for title in titles)
+
+    def invalidate(self, card_ids: Iterable[str]):
+        """Drop cached cards for updated titles"""
+        for card_id in card_ids:
+            self.cache.delete(card_id)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return cache counters"""
+        return {"enabled": self.enabled, "renders": self.renders, **self.cache.stats()}
+
+
+# Create global card cache instance
+card_cache = CardCache()
@@ -0,0 +1,365 @@
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple, Union
+import asyncio
+import os
+import logging
+
+from pymongo import UpdateMany, UpdateOne
+
+from models import Movie, TVShow, ContentType, ContentResponse, content_id
+from cards import card_cache, card_from_doc
+from database import db
+from pagination import SortKeys, fetch_page
+from tmdb_service import tmdb_service
+
+logger = logging.getLogger(__name__)
+
+TitleKey = Tuple[ContentType, int]
+Title = Union[Movie, TVShow]
+
+# Stored fields needed to build a ContentResponse for either collection
+CARD_PROJECTION = {
+    "_id": 0, "id": 1, "tmdb_id": 1, "title": 1, "name": 1, "overview": 1,
+    "poster_path": 1, "backdrop_path": 1, "release_date": 1, "first_air_date": 1,
+    "runtime": 1, "vote_average": 1, "popularity": 1, "genres": 1, "videos": 1,
+    "maturity_rating": 1, "updated_at": 1
+}
+
+# catalog_versions document bumped by every store_titles, so responses holding cards can revalidate
+TITLES_VERSION = "titles"
+
+# Marker recorded in the migrations collection once legacy ids are rewritten
+CONTENT_ID_MIGRATION = "canonical_content_ids"
+
+# Served by the (popularity, id) index on each collection
+BROWSE_SORT: SortKeys = [("popularity", -1, float), ("id", 1, str)]
+
+
+class Catalog:
+    """Read-through title store backed by the movies and tv_shows collections
+
+    Titles updated within the freshness window are served straight from Mongo.
+    Stale titles are served as-is while a background refresh fetches them from
+    TMDB, and only titles missing from Mongo block on TMDB.
+    """
+
+    def __init__(self):
+        self.read_through = os.getenv("CATALOG_READ_THROUGH", "true").lower() == "true"
+        self.fresh_for = timedelta(seconds=int(os.getenv("CATALOG_FRESH_SECONDS", "86400")))
+        self.max_refreshes = int(os.getenv("CATALOG_MAX_REFRESHES", "50"))
+        self.migrate_ids = os.getenv("CATALOG_MIGRATE_IDS", "true").lower() == "true"
+        self.snapshot_max_age = timedelta(seconds=int(os.getenv("CATALOG_SNAPSHOT_MAX_AGE_SECONDS", "86400")))
+        self._refreshing: Dict[Hashable, asyncio.Task] = {}
+        self._upsert_listeners: List[Callable[[List[Title]], None]] = []
+        self.fresh_hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+        self.snapshot_hits = 0
+        self.snapshot_misses = 0
+
+    def _collection(self, content_type: ContentType):
+        if content_type == ContentType.MOVIE:
+            return db.database.movies
+        return db.database.tv_shows
+
+    @staticmethod
+    def _model(content_type: ContentType):
+        return Movie if content_type == ContentType.MOVIE else TVShow
+
+    async def load_titles(self, items: List[TitleKey]) -> Dict[TitleKey, Title]:
+        """Load stored titles with one query per collection, scheduling refreshes for stale ones"""
+        if db.database is None:
+            return {}
+
+        titles: Dict[TitleKey, Title] = {}
+        now = datetime.utcnow()
+        for content_type in (ContentType.MOVIE, ContentType.TV_SHOW):
+            tmdb_ids = list({tmdb_id for item_type, tmdb_id in items if item_type == content_type})
+            if not tmdb_ids:
+                continue
+
+            model = self._model(content_type)
+            async for doc in self._collection(content_type).find({"tmdb_id": {"$in": tmdb_ids}}, {"_id": 0}):
+                try:
+                    title = model(**doc)
+                except Exception as e:
+                    logger.error(f"Error loading stored {content_type.value} {doc.get('tmdb_id')}: {str(e)}")
+                    continue
+
+                titles[(content_type, title.tmdb_id)] = title
+                if now - title.updated_at <= self.fresh_for:
+                    self.fresh_hits += 1
+                else:
+                    self.stale_hits += 1
+                    self._schedule_refresh(content_type, title.tmdb_id)
+
+        self.misses += len(set(items) - set(titles))
+        return titles
+
+    async def store_titles(self, titles: List[Title]):
+        """Upsert a page of titles with one bulk write per collection
+
+        Identity fields are only written on insert, so a title keeps its
+        canonical id and created_at while its mutable fields are refreshed.
+        The titles version is bumped once the writes land, which changes the
+        ETag of every response serving cards.
+        """
+        if db.database is None:
+            return
+
+        now = datetime.utcnow()
+        operations: Dict[ContentType, List[UpdateOne]] = {ContentType.MOVIE: [], ContentType.TV_SHOW: []}
+        for title in titles:
+            data = title.dict()
+            identity = {
+                "id": content_id(title.content_type, title.tmdb_id),
+                "created_at": data.pop("created_at")
+            }
+            data.pop("id")
+            data["updated_at"] = now
+            operations[title.content_type].append(
+                UpdateOne({"tmdb_id": title.tmdb_id}, {"$set": data, "$setOnInsert": identity}, upsert=True)
+            )
+
+        for content_type, ops in operations.items():
+            if not ops:
+                continue
+            try:
+                await self._collection(content_type).bulk_write(ops, ordered=False)
+            except Exception as e:
+                logger.error(f"Error storing {content_type.value} titles: {str(e)}")
+        try:
+            await db.database.catalog_versions.update_one(
+                {"name": TITLES_VERSION},
+                {"$inc": {"version": 1}, "$set": {"updated_at": now}},
+                upsert=True
+            )
+        except Exception as e:
+            logger.error(f"Error bumping the catalog version: {str(e)}")
+
+        card_cache.invalidate(title.id for title in titles)
+        for listener in self._upsert_listeners:
+            try:
+                listener(titles)
+            except Exception as e:
+                logger.error(f"Error notifying catalog upsert listener: {str(e)}")
+
+    async def version(self) -> Dict[str, Any]:
+        """Current titles version and modification time"""
+        if db.database is None:
+            return {"version": 0, "updated_at": None}
+
+        state = await db.database.catalog_versions.find_one(
+            {"name": TITLES_VERSION}, {"_id": 0, "version": 1, "updated_at": 1}
+        )
+        return state or {"version": 0, "updated_at": None}
+
+    def on_upsert(self, listener: Callable[[List[Title]], None]):
+        """Register a callback run with every page of titles written by store_titles"""
+        self._upsert_listeners.append(listener)
+
+    async def persist_fetched(self, titles: List[Title]):
+        """Persist titles fetched from TMDB unless read-through hydration already stored them"""
+        if tmdb_service.title_source is self:
+            return
+        await self.store_titles(titles)
+
+    async def migrate_content_ids(self):
+        """Rewrite legacy random title ids to their canonical ids, following references
+
+        store_titles only ever inserts canonical ids, so once a pass completes
+        a marker in the migrations collection skips the scan on later startups.
+        """
+        if db.database is None:
+            return
+        if await db.database.migrations.find_one({"name": CONTENT_ID_MIGRATION}):
+            return
+
+        remapped: Dict[str, str] = {}
+        for content_type in (ContentType.MOVIE, ContentType.TV_SHOW):
+            collection = self._collection(content_type)
+            ops = []
+            async for doc in collection.find({}, {"_id": 0, "id": 1, "tmdb_id": 1}):
+                canonical = content_id(content_type, doc["tmdb_id"])
+                if doc.get("id") != canonical:
+                    remapped[doc.get("id")] = canonical
+                    ops.append(UpdateOne({"tmdb_id": doc["tmdb_id"]}, {"$set": {"id": canonical}}))
+            if ops:
+                await collection.bulk_write(ops, ordered=False)
+
+        references = [
+            UpdateMany({"content_id": old_id}, {"$set": {"content_id": new_id}})
+            for old_id, new_id in remapped.items() if old_id
+        ]
+        if references:
+            for collection in (db.database.watchlist, db.database.viewing_history):
+                await collection.bulk_write(references, ordered=False)
+            logger.info(f"Migrated {len(remapped)} catalog ids to canonical ids")
+
+        await db.database.migrations.update_one(
+            {"name": CONTENT_ID_MIGRATION},
+            {"$set": {"completed_at": datetime.utcnow(), "remapped": len(remapped)}},
+            upsert=True
+        )
+
+    async def _load_card_docs(self, refs: List[Tuple[ContentType, str]]) -> Dict[Tuple[ContentType, str], Dict[str, Any]]:
+        """Load projected card documents by content id with one query per collection"""
+        docs: Dict[Tuple[ContentType, str], Dict[str, Any]] = {}
+        if db.database is None:
+            return docs
+
+        for content_type in (ContentType.MOVIE, ContentType.TV_SHOW):
+            ids = list({ref_id for ref_type, ref_id in refs if ref_type == content_type})
+            if not ids:
+                continue
+            async for doc in self._collection(content_type).find({"id": {"$in": ids}}, CARD_PROJECTION):
+                docs[(content_type, doc["id"])] = doc
+        return docs
+
+    async def load_cards(self, refs: List[Tuple[ContentType, str]]) -> List[ContentResponse]:
+        """Load content cards by content id, keeping order"""
+        docs = await self._load_card_docs(refs)
+        cards = []
+        for ref in refs:
+            if ref not in docs:
+                continue
+            try:
+                cards.append(card_from_doc(ref[0], docs[ref]))
+            except Exception as e:
+                logger.error(f"Error loading {ref[0].value} card {ref[1]}: {str(e)}")
+        return cards
+
+    async def load_card_json_map(self, refs: List[Tuple[ContentType, str]]) -> Dict[Tuple[ContentType, str], bytes]:
+        """Load serialized content cards by content id, keyed by reference"""
+        docs = await self._load_card_docs(refs)
+        fragments = {}
+        for ref, doc in docs.items():
+            try:
+                fragments[ref] = card_cache.doc_json(ref[0], doc)
+            except Exception as e:
+                logger.error(f"Error loading {ref[0].value} card {ref[1]}: {str(e)}")
+        return fragments
+
+    async def load_card_json(self, refs: List[Tuple[ContentType, str]]) -> List[bytes]:
+        """Load serialized content cards by content id, keeping order"""
+        fragments = await self.load_card_json_map(refs)
+        return [fragments[ref] for ref in refs if ref in fragments]
+
+    async def browse_json(
+        self,
+        content_type: ContentType,
+        limit: int,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[bytes], Optional[str]]:
+        """One page of serialized cards in popularity order, and the cursor for the next page"""
+        docs, next_cursor = await fetch_page(
+            self._collection(content_type), {}, BROWSE_SORT, limit, cursor, CARD_PROJECTION
+        )
+        fragments = []
+        for doc in docs:
+            try:
+                fragments.append(card_cache.doc_json(content_type, doc))
+            except Exception as e:
+                logger.error(f"Error loading {content_type.value} card {doc.get('id')}: {str(e)}")
+        return fragments, next_cursor
+
+    async def save_snapshot(self, name: str, titles: List[Title]):
+        """Persist the ordered titles of a precomputed list"""
+        if db.database is None:
+            return
+
+        await db.database.catalog_snapshots.update_one(
+            {"name": name},
+            {
+                "$set": {
+                    "items": [
+                        {"content_type": title.content_type.value, "tmdb_id": title.tmdb_id}
+                        for title in titles
+                    ],
+                    "updated_at": datetime.utcnow()
+                },
+                "$inc": {"version": 1}
+            },
+            upsert=True
+        )
+
+    async def snapshot_meta(self, name: str) -> Optional[Dict[str, Any]]:
+        """Return a usable snapshot's version and updated_at without loading its titles"""
+        if db.database is None:
+            return None
+
+        meta = await db.database.catalog_snapshots.find_one(
+            {"name": name}, {"_id": 0, "version": 1, "updated_at": 1}
+        )
+        if not meta or datetime.utcnow() - meta["updated_at"] > self.snapshot_max_age:
+            return None
+        return meta
+
+    async def load_snapshot(self, name: str) -> Optional[List[Title]]:
+        """Load a precomputed list in order, or None when there is no usable snapshot"""
+        if db.database is None:
+            return None
+
+        snapshot = await db.database.catalog_snapshots.find_one({"name": name}, {"_id": 0})
+        if not snapshot or datetime.utcnow() - snapshot["updated_at"] > self.snapshot_max_age:
+            self.snapshot_misses += 1
+            return None
+
+        items = [(ContentType(item["content_type"]), item["tmdb_id"]) for item in snapshot["items"]]
+        titles = await self.load_titles(items)
+        self.snapshot_hits += 1
+        return [titles[item] for item in items if item in titles]
+
+    def _schedule_refresh(self, content_type: ContentType, tmdb_id: int):
+        """Refresh a stale title from TMDB in the background, once per title"""
+        key = (content_type, tmdb_id)
+        if key in self._refreshing or len(self._refreshing) >= self.max_refreshes:
+            return
+
+        task = asyncio.create_task(self._refresh(content_type, tmdb_id))
+        self._refreshing[key] = task
+        task.add_done_callback(lambda _: self._refreshing.pop(key, None))
+
+    async def _refresh(self, content_type: ContentType, tmdb_id: int):
+        # The response cache holds details for as long as a title stays fresh, so a
+        # refresh served from it could restamp a payload a whole window old
+        try:
+            if content_type == ContentType.MOVIE:
+                title = await tmdb_service.get_movie_details(tmdb_id, use_cache=False)
+            else:
+                title = await tmdb_service.get_tv_show_details(tmdb_id, use_cache=False)
+            if title:
+                await self.store_titles([title])
+                self.refreshes += 1
+            else:
+                self.refresh_failures += 1
+        except Exception as e:
+            logger.error(f"Error refreshing {content_type.value} {tmdb_id}: {str(e)}")
+            self.refresh_failures += 1
+
+    async def close(self):
+        """Cancel background refreshes still in flight"""
+        tasks = list(self._refreshing.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return read-through counters"""
+        return {
+            "read_through": self.read_through,
+            "fresh_hits": self.fresh_hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "refreshing": len(self._refreshing),
+            "refreshes": self.refreshes,
+            "refresh_failures": self.refresh_failures,
+            "snapshot_hits": self.snapshot_hits,
+            "snapshot_misses": self.snapshot_misses,
+        }
+
+
+# Create global catalog instance
+catalog = Catalog()
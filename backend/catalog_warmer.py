@@ -0,0 +1,124 @@
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import asyncio
+import os
+import time
+import logging
+
+from catalog import catalog, Title
+from tmdb_service import tmdb_service
+
+logger = logging.getLogger(__name__)
+
+
+def popular_movies_snapshot(page: int) -> str:
+    return f"movies_popular:{page}"
+
+
+def popular_tv_snapshot(page: int) -> str:
+    return f"tv_popular:{page}"
+
+
+def trending_snapshot(time_window: str) -> str:
+    return f"trending_all:{time_window}"
+
+
+def genre_movies_snapshot(genre_id: int, page: int) -> str:
+    return f"movies_genre:{genre_id}:{page}"
+
+
+class CatalogWarmer:
+    """Background worker that precomputes popular, trending and genre lists into Mongo"""
+
+    def __init__(self):
+        self.enabled = os.getenv("CATALOG_WARMER_ENABLED", "true").lower() == "true"
+        self.interval = int(os.getenv("CATALOG_WARM_INTERVAL_SECONDS", "900"))
+        self.pages = max(1, int(os.getenv("CATALOG_WARM_PAGES", "1")))
+        self.genres = [
+            int(genre_id) for genre_id in os.getenv("CATALOG_WARM_GENRES", "28,12,16,35,80,18,27,10749,878").split(",")
+            if genre_id.strip()
+        ]
+        self._task: Optional[asyncio.Task] = None
+        self._warmed_listeners: List[Callable[[], Awaitable[None]]] = []
+        self.runs = 0
+        self.failures = 0
+        self.last_run_at: Optional[datetime] = None
+        self.last_duration: Optional[float] = None
+
+    async def start(self):
+        """Start the warm loop in the background"""
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the warm loop"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.warm_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error warming catalog: {str(e)}")
+                self.failures += 1
+            await asyncio.sleep(self.interval)
+
+    async def _save(self, name: str, titles: List[Title]):
+        await catalog.persist_fetched(titles)
+        if titles:
+            await catalog.save_snapshot(name, titles)
+
+    async def warm_once(self):
+        """Fetch, hydrate and persist every precomputed list once"""
+        started = time.monotonic()
+
+        for page in range(1, self.pages + 1):
+            await self._save(popular_movies_snapshot(page), await tmdb_service.get_popular_movies(page))
+            await self._save(popular_tv_snapshot(page), await tmdb_service.get_popular_tv_shows(page))
+
+        for time_window in ("week", "day"):
+            trending = await tmdb_service.get_trending_content(time_window)
+            await self._save(trending_snapshot(time_window), trending["movies"] + trending["tv_shows"])
+
+        for genre_id in self.genres:
+            for page in range(1, self.pages + 1):
+                await self._save(
+                    genre_movies_snapshot(genre_id, page),
+                    await tmdb_service.get_movies_by_genre(genre_id, page)
+                )
+
+        self.runs += 1
+        self.last_run_at = datetime.utcnow()
+        self.last_duration = round(time.monotonic() - started, 3)
+        logger.info(f"Warmed catalog in {self.last_duration}s")
+
+        for listener in self._warmed_listeners:
+            try:
+                await listener()
+            except Exception as e:
+                logger.error(f"Error running post-warm task: {str(e)}")
+
+    def on_warmed(self, listener: Callable[[], Awaitable[None]]):
+        """Register a coroutine function to run after every warm cycle"""
+        self._warmed_listeners.append(listener)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return warm loop counters"""
+        return {
+            "enabled": self.enabled,
+            "running": self._task is not None and not self._task.done(),
+            "interval_seconds": self.interval,
+            "runs": self.runs,
+            "failures": self.failures,
+            "last_run_at": self.last_run_at,
+            "last_duration_seconds": self.last_duration,
+        }
+
+
+# Create global catalog warmer instance
+catalog_warmer = CatalogWarmer()
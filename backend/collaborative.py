@@ -0,0 +1,386 @@
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+import asyncio
+import os
+import time
+import logging
+
+import numpy as np
+from scipy import sparse
+
+from models import ContentType
+from database import db
+from history import history_store
+
+logger = logging.getLogger(__name__)
+
+# Per-title interaction for a profile: latest time, in watchlist, in viewing history
+Interaction = Tuple[datetime, bool, bool]
+
+# Interactions deduplicated per (profile_id, content_id): content type and Interaction
+InteractionPairs = Dict[Tuple[str, str], Tuple[str, datetime, bool, bool]]
+
+# Everything build() produces, swapped in together once a rebuild finishes
+MODEL_FIELDS = (
+    "title_ids", "title_types", "title_index", "profiles", "cooccurrence",
+    "totals", "overlay", "neighbours", "rows"
+)
+
+
+def merge_interaction(pairs: InteractionPairs, item: Dict[str, Any], at: datetime, source: str):
+    """Fold one watchlist or history row into its (profile, title) pair"""
+    key = (item["profile_id"], item["content_id"])
+    current = pairs.get(key)
+    if current is None:
+        pairs[key] = (item["content_type"], at, source == "added", source == "watched")
+    else:
+        content_type, latest, added, watched = current
+        pairs[key] = (content_type, max(latest, at), added or source == "added", watched or source == "watched")
+
+
+class CoWatchRecommender:
+    """Item-to-item collaborative filtering from watchlist and viewing history co-occurrence
+
+    A binary profile x title matrix is built from both collections, and the
+    title x title co-occurrence counts C = A^T A are computed in row blocks.
+    Similarity is cosine over profiles, C_ij / sqrt(C_ii C_jj), keeping
+    pairs seen together by at least min_cooccurrence profiles; only those
+    pairs are kept in C. Each profile's "Because you added X" rows are
+    precomputed from the neighbours of its most recent titles and fully
+    rebuilt every refresh_interval.
+
+    Between rebuilds, watchlist writes are applied as deltas: the profile's
+    co-occurrence counts are adjusted in an overlay, the changed title's
+    neighbour list is recomputed, its score is updated in the lists of the
+    profile's other recent titles, and that profile's rows are refreshed.
+    Other titles' lists, other profiles' rows, pairs that were below
+    min_cooccurrence at the last build, and titles pushed out of a top_k
+    list by a removal pick up the change at the next rebuild.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("COLLAB_ENABLED", "true").lower() == "true"
+        self.refresh_interval = int(os.getenv("COLLAB_REFRESH_SECONDS", "3600"))
+        self.min_cooccurrence = int(os.getenv("COLLAB_MIN_COOCCURRENCE", "2"))
+        self.top_k = int(os.getenv("COLLAB_TOP_K", "30"))
+        self.seed_count = int(os.getenv("COLLAB_SEEDS", "3"))
+        self.row_size = int(os.getenv("COLLAB_ROW_SIZE", "12"))
+        self.batch_size = int(os.getenv("COLLAB_BATCH_SIZE", "2048"))
+        self.delta_max_titles = int(os.getenv("COLLAB_DELTA_MAX_TITLES", "200"))
+        self.title_ids: List[str] = []
+        self.title_types: List[ContentType] = []
+        self.title_index: Dict[str, int] = {}
+        self.profiles: Dict[str, Dict[int, Interaction]] = {}
+        self.cooccurrence = sparse.csr_matrix((0, 0), dtype=np.int64)
+        # Profiles per title, kept current by deltas
+        self.totals = np.zeros(0, dtype=np.int64)
+        # Off-diagonal count changes since the last build
+        self.overlay: Dict[int, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+        self.neighbours: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+        self.rows: Dict[str, List[Tuple[int, str, List[int]]]] = {}
+        self._deltas: List[Tuple[str, str, Optional[ContentType], bool]] = []
+        self._replay: Optional[List[Tuple[str, str, Optional[ContentType], bool]]] = None
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        # Strong references to queued delta runs, which the event loop only holds weakly
+        self._drains: Set[asyncio.Task] = set()
+        self.ready = False
+        self.rebuilds = 0
+        self.deltas_applied = 0
+        self.last_build_seconds: Optional[float] = None
+        self.last_built_at: Optional[datetime] = None
+        self.last_delta_seconds: Optional[float] = None
+
+    def _column(self, content_id: str, content_type: Optional[ContentType]) -> Optional[int]:
+        column = self.title_index.get(content_id)
+        if column is None and content_type is not None:
+            column = len(self.title_ids)
+            self.title_ids.append(content_id)
+            self.title_types.append(content_type)
+            self.title_index[content_id] = column
+        return column
+
+    def _keep_top(self, rows: np.ndarray, columns: np.ndarray, scores: np.ndarray):
+        # Rank each row's candidates by score, then column, with one lexsort and keep the first top_k per row
+        order = np.lexsort((columns, -scores, rows))
+        rows, columns, scores = rows[order], columns[order], scores[order]
+        starts = np.searchsorted(rows, rows, side="left")
+        keep = np.arange(len(rows)) - starts < self.top_k
+        rows, columns, scores = rows[keep], columns[keep], scores[keep]
+        if not len(rows):
+            return
+        bounds = np.flatnonzero(np.diff(rows)) + 1
+        for row, row_columns, row_scores in zip(rows[np.r_[0, bounds]], np.split(columns, bounds), np.split(scores, bounds)):
+            self.neighbours[int(row)] = (row_columns, row_scores)
+
+    def _scores(self, rows: np.ndarray, columns: np.ndarray, counts: np.ndarray):
+        totals = self.totals
+        keep = (rows != columns) & (counts >= self.min_cooccurrence) & (totals[rows] > 0) & (totals[columns] > 0)
+        rows, columns, counts = rows[keep], columns[keep], counts[keep]
+        return rows, columns, (counts / np.sqrt(totals[rows].astype(np.float64) * totals[columns])).astype(np.float32)
+
+    def build(self, pairs: InteractionPairs):
+        """Rebuild the matrix, neighbour lists and every profile's rows from scratch"""
+        started = time.monotonic()
+        self.title_ids, self.title_types, self.title_index = [], [], {}
+        self.profiles = {}
+        for (profile_id, content_id), (content_type, at, added, watched) in pairs.items():
+            column = self._column(content_id, ContentType(content_type))
+            self.profiles.setdefault(profile_id, {})[column] = (at, added, watched)
+
+        profile_ids = list(self.profiles)
+        profile_rows = np.repeat(np.arange(len(profile_ids)), [len(self.profiles[profile_id]) for profile_id in profile_ids])
+        title_columns = np.fromiter(
+            (column for profile_id in profile_ids for column in self.profiles[profile_id]), dtype=np.int64, count=len(profile_rows)
+        )
+        titles = len(self.title_ids)
+        matrix = sparse.csr_matrix(
+            (np.ones(len(profile_rows), dtype=np.int64), (profile_rows, title_columns)),
+            shape=(len(profile_ids), titles)
+        )
+        transposed = matrix.T.tocsr()
+        # The diagonal of A^T A is each title's profile count
+        self.totals = np.diff(transposed.indptr).astype(np.int64)
+        self.overlay = defaultdict(lambda: defaultdict(int))
+
+        # C = A^T A one block of title rows at a time, keeping only pairs that can be scored
+        self.neighbours = {}
+        blocks = []
+        for start in range(0, titles, self.batch_size):
+            block = (transposed[start:start + self.batch_size] @ matrix).tocoo()
+            keep = (block.data >= self.min_cooccurrence) & (block.row + start != block.col)
+            rows, columns, counts = block.row[keep], block.col[keep], block.data[keep]
+            blocks.append(sparse.csr_matrix((counts, (rows, columns)), shape=block.shape))
+            self._keep_top(*self._scores(rows.astype(np.int64) + start, columns.astype(np.int64), counts))
+        self.cooccurrence = sparse.vstack(blocks, format="csr") if blocks else sparse.csr_matrix((0, 0), dtype=np.int64)
+        self.cooccurrence.sort_indices()
+
+        self.rows = {profile_id: self._profile_rows(profile_titles) for profile_id, profile_titles in self.profiles.items()}
+        self.last_build_seconds = round(time.monotonic() - started, 3)
+
+    def _row_counts(self, column: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Current co-occurrence counts of column with every title it shares profiles with"""
+        columns, counts = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        if column < self.cooccurrence.shape[0]:
+            start, end = self.cooccurrence.indptr[column], self.cooccurrence.indptr[column + 1]
+            columns = self.cooccurrence.indices[start:end].astype(np.int64)
+            counts = self.cooccurrence.data[start:end].astype(np.int64)
+        changes = self.overlay.get(column)
+        if changes:
+            columns = np.concatenate([columns, np.fromiter(changes.keys(), dtype=np.int64, count=len(changes))])
+            counts = np.concatenate([counts, np.fromiter(changes.values(), dtype=np.int64, count=len(changes))])
+            columns, inverse = np.unique(columns, return_inverse=True)
+            counts = np.bincount(inverse, weights=counts).astype(np.int64)
+        return columns, counts
+
+    def _pair_counts(self, column: int, others: np.ndarray) -> np.ndarray:
+        """Current co-occurrence counts of column with each of others"""
+        counts = np.zeros(len(others), dtype=np.int64)
+        if column < self.cooccurrence.shape[0]:
+            start, end = self.cooccurrence.indptr[column], self.cooccurrence.indptr[column + 1]
+            indices = self.cooccurrence.indices[start:end]
+            positions = np.minimum(np.searchsorted(indices, others), max(len(indices) - 1, 0))
+            found = (indices[positions] == others) if len(indices) else np.zeros(len(others), dtype=bool)
+            counts[found] = self.cooccurrence.data[start:end][positions[found]]
+        changes = self.overlay.get(column)
+        if changes:
+            counts += np.array([changes.get(int(other), 0) for other in others], dtype=np.int64)
+        return counts
+
+    def _refresh_neighbours(self, column: int):
+        columns, counts = self._row_counts(column)
+        self.neighbours.pop(column, None)
+        self._keep_top(*self._scores(np.full(len(columns), column, dtype=np.int64), columns, counts))
+
+    def _rescore(self, column: int, others: np.ndarray):
+        """Update column's entry in each of others' neighbour lists"""
+        counts = self._pair_counts(column, others)
+        scored, _, scores = self._scores(others, np.full(len(others), column, dtype=np.int64), counts)
+        new_scores = dict(zip(scored.tolist(), scores.tolist()))
+        for other in others.tolist():
+            current_columns, current_scores = self.neighbours.get(other, (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)))
+            keep = current_columns != column
+            current_columns, current_scores = current_columns[keep], current_scores[keep]
+            if other in new_scores:
+                current_columns = np.append(current_columns, column)
+                current_scores = np.append(current_scores, np.float32(new_scores[other]))
+                order = np.lexsort((current_columns, -current_scores))[:self.top_k]
+                current_columns, current_scores = current_columns[order], current_scores[order]
+            if len(current_columns):
+                self.neighbours[other] = (current_columns, current_scores)
+            else:
+                self.neighbours.pop(other, None)
+
+    def _profile_rows(self, titles: Dict[int, Interaction]) -> List[Tuple[int, str, List[int]]]:
+        rows = []
+        seeds = sorted(titles, key=lambda column: titles[column][0], reverse=True)
+        for seed in seeds:
+            if len(rows) == self.seed_count:
+                break
+            neighbour_columns, _ = self.neighbours.get(seed, (np.empty(0, dtype=np.int64), None))
+            items = [int(column) for column in neighbour_columns if int(column) not in titles][:self.row_size]
+            if items:
+                rows.append((seed, "added" if titles[seed][1] else "watched", items))
+        return rows
+
+    def apply_delta(self, profile_id: str, content_id: str, content_type: Optional[ContentType], added: bool):
+        """Apply one watchlist add or removal to the counts, the titles involved and the profile's rows"""
+        column = self._column(content_id, content_type if added else None)
+        if column is None:
+            return
+        titles = self.profiles.setdefault(profile_id, {})
+        current = titles.get(column)
+
+        if added:
+            if current is not None:
+                titles[column] = (datetime.utcnow(), True, current[2])
+                self.rows[profile_id] = self._profile_rows(titles)
+                return
+            change = 1
+            titles[column] = (datetime.utcnow(), True, False)
+        else:
+            if current is None or not current[1]:
+                return
+            if current[2]:
+                # Still in viewing history, so the co-occurrence counts stand
+                titles[column] = (current[0], False, True)
+                self.rows[profile_id] = self._profile_rows(titles)
+                return
+            change = -1
+            del titles[column]
+
+        started = time.monotonic()
+        recent = [other for other in sorted(titles, key=lambda other: titles[other][0], reverse=True) if other != column]
+        recent = np.array(recent[:self.delta_max_titles], dtype=np.int64)
+        for other in recent.tolist():
+            self.overlay[column][other] += change
+            self.overlay[other][column] += change
+        if column >= len(self.totals):
+            self.totals = np.concatenate([self.totals, np.zeros(column + 1 - len(self.totals), dtype=np.int64)])
+        self.totals[column] += change
+
+        # Only column's total changed, so other lists only need column's entry rescored
+        self._refresh_neighbours(column)
+        self._rescore(column, recent)
+        self.rows[profile_id] = self._profile_rows(titles)
+        self.deltas_applied += 1
+        self.last_delta_seconds = round(time.monotonic() - started, 4)
+
+    def recommendations(self, profile_id: str) -> List[Tuple[Tuple[ContentType, str], str, List[Tuple[ContentType, str]]]]:
+        """Precomputed rows for a profile as (seed, reason, items) content references"""
+        def ref(column: int) -> Tuple[ContentType, str]:
+            return self.title_types[column], self.title_ids[column]
+        return [(ref(seed), reason, [ref(column) for column in items]) for seed, reason, items in self.rows.get(profile_id, [])]
+
+    async def _load(self) -> InteractionPairs:
+        # Folded into one entry per (profile, title) while streaming, so memory follows pairs, not rows
+        pairs: InteractionPairs = {}
+        async for item in db.database.watchlist.find(
+            {}, {"_id": 0, "profile_id": 1, "content_id": 1, "content_type": 1, "added_at": 1}
+        ):
+            merge_interaction(pairs, item, item["added_at"], "added")
+        async for item in history_store.interactions():
+            merge_interaction(pairs, item, item["watched_at"], "watched")
+        return pairs
+
+    async def rebuild(self):
+        """Reload interactions and build a fresh model off the event loop, then swap it in"""
+        # Deltas applied while the reload is in flight are replayed onto the fresh model;
+        # any already reflected in the reload are no-ops, since membership is checked first
+        self._replay = []
+        try:
+            pairs = await self._load()
+            fresh = CoWatchRecommender()
+            await asyncio.to_thread(fresh.build, pairs)
+            async with self._lock:
+                for field in MODEL_FIELDS:
+                    setattr(self, field, getattr(fresh, field))
+                self._deltas = self._replay + self._deltas
+                self.ready = True
+        finally:
+            self._replay = None
+
+        self.rebuilds += 1
+        self.last_build_seconds = fresh.last_build_seconds
+        self.last_built_at = datetime.utcnow()
+        logger.info(
+            f"Built co-watch recommendations for {len(self.profiles)} profiles and "
+            f"{len(self.title_ids)} titles in {self.last_build_seconds}s"
+        )
+        await self._apply_deltas()
+
+    async def _run(self):
+        while True:
+            try:
+                await self.rebuild()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error rebuilding co-watch recommendations: {str(e)}")
+            await asyncio.sleep(self.refresh_interval)
+
+    async def start(self):
+        """Start the periodic rebuild loop"""
+        if self.enabled and db.database is not None and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the rebuild loop and any queued delta runs"""
+        tasks = list(self._drains)
+        if self._task is not None:
+            tasks.append(self._task)
+            self._task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _apply_deltas(self):
+        async with self._lock:
+            if not self.ready:
+                return
+            deltas, self._deltas = self._deltas, []
+            for delta in deltas:
+                try:
+                    await asyncio.to_thread(self.apply_delta, *delta)
+                except Exception as e:
+                    logger.error(f"Error applying watchlist delta: {str(e)}")
+                if self._replay is not None:
+                    self._replay.append(delta)
+
+    def watchlist_added(self, profile_id: str, content_id: str, content_type: ContentType):
+        """Queue a watchlist add for the profile's rows"""
+        self._queue_delta(profile_id, content_id, content_type, True)
+
+    def watchlist_removed(self, profile_id: str, content_id: str):
+        """Queue a watchlist removal for the profile's rows"""
+        self._queue_delta(profile_id, content_id, None, False)
+
+    def _queue_delta(self, profile_id: str, content_id: str, content_type: Optional[ContentType], added: bool):
+        if not self.enabled:
+            return
+        self._deltas.append((profile_id, content_id, content_type, added))
+        if self.ready:
+            task = asyncio.get_running_loop().create_task(self._apply_deltas())
+            self._drains.add(task)
+            task.add_done_callback(self._drains.discard)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return matrix size and rebuild counters"""
+        return {
+            "enabled": self.enabled,
+            "ready": self.ready,
+            "profiles": len(self.profiles),
+            "titles": len(self.title_ids),
+            "cooccurrence_pairs": int(self.cooccurrence.nnz),
+            "rebuilds": self.rebuilds,
+            "last_build_seconds": self.last_build_seconds,
+            "last_built_at": self.last_built_at,
+            "deltas_applied": self.deltas_applied,
+            "last_delta_seconds": self.last_delta_seconds,
+            "pending_deltas": len(self._deltas),
+        }
+
+
+# Create global co-watch recommender instance
+co_watch = CoWatchRecommender()
@@ -1,4 +1,5 @@
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import TEXT
 from typing import Optional
 import os
 from dotenv import load_dotenv
@@ -39,6 +40,12 @@ class Database:
             await self.database.movies.create_index("genres.name")
             await self.database.movies.create_index("vote_average")
             await self.database.movies.create_index("popularity")
+            await self.database.movies.create_index([("popularity", -1), ("id", 1)])
+            await self.database.movies.create_index(
+                [("title", TEXT), ("original_title", TEXT), ("genres.name", TEXT), ("overview", TEXT)],
+                weights={"title": 10, "original_title": 5, "genres.name": 3, "overview": 1},
+                name="movies_text"
+            )
             
             # TV Shows collection indexes
             await self.database.tv_shows.create_index("tmdb_id", unique=True)
@@ -47,15 +54,47 @@ class Database:
             await self.database.tv_shows.create_index("genres.name")
             await self.database.tv_shows.create_index("vote_average")
             await self.database.tv_shows.create_index("popularity")
+            await self.database.tv_shows.create_index([("popularity", -1), ("id", 1)])
+            await self.database.tv_shows.create_index(
+                [("name", TEXT), ("original_name", TEXT), ("genres.name", TEXT), ("overview", TEXT)],
+                weights={"name": 10, "original_name": 5, "genres.name": 3, "overview": 1},
+                name="tv_shows_text"
+            )
             
             # Watchlist collection indexes
             await self.database.watchlist.create_index([("profile_id", 1), ("content_id", 1)], unique=True)
             await self.database.watchlist.create_index("profile_id")
+            await self.database.watchlist.create_index([("profile_id", 1), ("added_at", 1), ("id", 1)])
+            await self.database.watchlist_versions.create_index("profile_id", unique=True)
             
             # Viewing history collection indexes
             await self.database.viewing_history.create_index("profile_id")
             await self.database.viewing_history.create_index("content_id")
             await self.database.viewing_history.create_index("watched_at")
+            await self.database.viewing_history.create_index([("profile_id", 1), ("content_id", 1)], unique=True)
+            await self.database.viewing_history.create_index([("profile_id", 1), ("completed", 1), ("watched_at", -1)])
+            
+            # Bucketed viewing history indexes (HISTORY_STORAGE=bucket)
+            await self.database.viewing_history_buckets.create_index([("profile_id", 1), ("day", -1)], unique=True)
+            await self.database.viewing_history_archive.create_index([("profile_id", 1), ("day", -1)])
+            for collection in (self.database.viewing_history_buckets, self.database.viewing_history_archive):
+                await collection.create_index([("profile_id", 1), ("events.c", 1), ("day", -1)])
+            archive_ttl_days = int(os.getenv("HISTORY_ARCHIVE_TTL_DAYS", "0"))
+            if archive_ttl_days > 0:
+                await self.database.viewing_history_archive.create_index(
+                    "archived_at", expireAfterSeconds=archive_ttl_days * 86400
+                )
+            
+            # TMDB response cache indexes (expired entries are removed by the TTL monitor)
+            await self.database.tmdb_cache.create_index("key", unique=True)
+            await self.database.tmdb_cache.create_index("expires_at", expireAfterSeconds=0)
+            
+            # Catalog list snapshot indexes
+            await self.database.catalog_snapshots.create_index("name", unique=True)
+            await self.database.catalog_versions.create_index("name", unique=True)
+
+            # Completed one-off migration markers
+            await self.database.migrations.create_index("name", unique=True)
             
             # Categories collection indexes
             await self.database.categories.create_index("name", unique=True)
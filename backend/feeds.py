@@ -0,0 +1,215 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import os
+import logging
+
+from models import ContentType
+from database import db
+from cache import TTLCache
+from catalog import catalog
+from catalog_warmer import popular_movies_snapshot, popular_tv_snapshot, trending_snapshot
+from cards import card_cache, stitch_json_list
+from collaborative import co_watch
+from http_cache import make_etag
+from pagination import SortKeys, fetch_page, mongo_sort
+from tmdb_service import tmdb_service
+
+logger = logging.getLogger(__name__)
+
+# Served by the (profile_id, added_at, id) index
+WATCHLIST_SORT: SortKeys = [("added_at", 1, datetime), ("id", 1, str)]
+WATCHLIST_PAGE_SIZE = int(os.getenv("WATCHLIST_PAGE_SIZE", "50"))
+WATCHLIST_PROJECTION = {"_id": 0, "id": 1, "added_at": 1, "content_id": 1, "content_type": 1}
+
+
+async def popular_movies_json(page: int = 1) -> bytes:
+    """Serialized popular movies from the warmed catalog, falling back to TMDB"""
+    movies = await catalog.load_snapshot(popular_movies_snapshot(page))
+    if movies is None:
+        movies = await tmdb_service.get_popular_movies(page)
+        await catalog.persist_fetched(movies)
+    return card_cache.titles_json(movies)
+
+
+async def popular_tv_json(page: int = 1) -> bytes:
+    """Serialized popular TV shows from the warmed catalog, falling back to TMDB"""
+    tv_shows = await catalog.load_snapshot(popular_tv_snapshot(page))
+    if tv_shows is None:
+        tv_shows = await tmdb_service.get_popular_tv_shows(page)
+        await catalog.persist_fetched(tv_shows)
+    return card_cache.titles_json(tv_shows)
+
+
+async def trending_json(time_window: str = "week") -> bytes:
+    """Serialized trending content from the warmed catalog, falling back to TMDB"""
+    titles = await catalog.load_snapshot(trending_snapshot(time_window))
+    if titles is None:
+        trending = await tmdb_service.get_trending_content(time_window)
+        titles = trending["movies"] + trending["tv_shows"]
+        await catalog.persist_fetched(titles)
+    return card_cache.titles_json(titles)
+
+
+async def _watchlist_cards(watchlist_items: List[Dict[str, Any]]) -> bytes:
+    # Load every referenced title with one query per collection
+    fragments = await catalog.load_card_json([
+        (ContentType(item["content_type"]), item["content_id"]) for item in watchlist_items
+    ])
+    return stitch_json_list(fragments)
+
+
+async def watchlist_page(
+    profile_id: str,
+    limit: int = WATCHLIST_PAGE_SIZE,
+    cursor: Optional[str] = None
+) -> Tuple[bytes, Optional[str]]:
+    """One serialized watchlist page for a profile in the order items were added, and the next cursor"""
+    watchlist_items, next_cursor = await fetch_page(
+        db.database.watchlist,
+        {"profile_id": profile_id},
+        WATCHLIST_SORT,
+        limit,
+        cursor,
+        WATCHLIST_PROJECTION
+    )
+    return await _watchlist_cards(watchlist_items), next_cursor
+
+
+async def watchlist_json(profile_id: str) -> bytes:
+    """The whole serialized watchlist for a profile, in the order items were added
+
+    The home feed's watchlist row is the client's copy of My List, so it is
+    never cut to a page.
+    """
+    watchlist_items = await db.database.watchlist.find(
+        {"profile_id": profile_id}, WATCHLIST_PROJECTION
+    ).sort(mongo_sort(WATCHLIST_SORT)).to_list(None)
+    return await _watchlist_cards(watchlist_items)
+
+
+async def recommendations_json(profile_id: str) -> bytes:
+    """Serialized "Because you added X" rows for a profile, hydrated in one card lookup"""
+    rows = co_watch.recommendations(profile_id)
+    cards = await catalog.load_card_json_map([
+        ref for seed, _, items in rows for ref in (seed, *items)
+    ])
+
+    serialized = []
+    for seed, reason, items in rows:
+        fragments = [cards[ref] for ref in items if ref in cards]
+        if seed not in cards or not fragments:
+            continue
+        serialized.append(
+            b'{"reason":"' + reason.encode() + b'","seed":' + cards[seed]
+            + b',"items":' + stitch_json_list(fragments) + b'}'
+        )
+    return stitch_json_list(serialized)
+
+
+def last_modified(*states: Dict[str, Any]) -> Optional[datetime]:
+    """Latest updated_at among version states, ignoring ones never written"""
+    moments = [state["updated_at"] for state in states if state.get("updated_at") is not None]
+    return max(moments) if moments else None
+
+
+async def snapshot_validators(names: List[str]) -> Optional[Tuple[str, datetime]]:
+    """ETag and Last-Modified for rows served from snapshots, or None if any row has no snapshot
+
+    Cards are rewritten without touching the snapshots that list them, so
+    the catalog's titles version is part of the ETag.
+    """
+    titles, *metas = await asyncio.gather(catalog.version(), *(catalog.snapshot_meta(name) for name in names))
+    if any(meta is None for meta in metas):
+        return None
+    etag = make_etag(
+        f"titles:{titles['version']}", *(f"{name}:{meta['version']}" for name, meta in zip(names, metas))
+    )
+    return etag, last_modified(titles, *metas)
+
+
+async def watchlist_version(profile_id: str) -> Dict[str, Any]:
+    """Current watchlist version and modification time for a profile"""
+    state = await db.database.watchlist_versions.find_one(
+        {"profile_id": profile_id}, {"_id": 0, "version": 1, "updated_at": 1}
+    )
+    return state or {"version": 0, "updated_at": None}
+
+
+async def watchlist_changed(profile_id: str):
+    """Record a watchlist write: bump its version and drop cached feeds"""
+    await db.database.watchlist_versions.update_one(
+        {"profile_id": profile_id},
+        {"$inc": {"version": 1}, "$set": {"updated_at": datetime.utcnow()}},
+        upsert=True
+    )
+    home_feed.invalidate(profile_id)
+
+
+class HomeFeed:
+    """Assembles every home page row for a profile in one payload, cached per profile
+
+    A cached body is only reused under the ETag it was rendered for, so a
+    snapshot rotation or a watchlist write seen by another worker renders
+    afresh. Bodies with a failed row are never cached.
+    """
+
+    def __init__(self):
+        self.cache = TTLCache(
+            max_size=int(os.getenv("HOME_FEED_CACHE_SIZE", "10000")),
+            default_ttl=float(os.getenv("HOME_FEED_TTL", "60"))
+        )
+
+    async def _row(self, name: str, loader) -> Optional[bytes]:
+        try:
+            return await loader
+        except Exception as e:
+            logger.error(f"Error building home row {name}: {str(e)}")
+            return None
+
+    async def render(self, profile_id: str, etag: Optional[str] = None) -> Tuple[bytes, bool]:
+        """Return the serialized home feed for a profile and whether every row loaded
+
+        etag is the version ETag the body will be served under; without one
+        the feed is rendered without the cache.
+        """
+        if etag is not None:
+            cached = self.cache.get(profile_id)
+            if cached is not None and cached[0] == etag:
+                return cached[1], True
+
+        rows = await asyncio.gather(
+            self._row("trending", trending_json()),
+            self._row("popular_movies", popular_movies_json()),
+            self._row("popular_tv_shows", popular_tv_json()),
+            self._row("watchlist", watchlist_json(profile_id))
+        )
+        # A failing row renders empty instead of failing the whole page
+        trending, movies, tv_shows, watchlist = (row if row is not None else b"[]" for row in rows)
+        body = (
+            b'{"trending":' + trending
+            + b',"popular_movies":' + movies
+            + b',"popular_tv_shows":' + tv_shows
+            + b',"watchlist":' + watchlist + b'}'
+        )
+        complete = all(row is not None for row in rows)
+        if complete and etag is not None:
+            self.cache.set(profile_id, (etag, body))
+        return body, complete
+
+    @staticmethod
+    def snapshot_names():
+        """Snapshots backing the shared home rows"""
+        return [trending_snapshot("week"), popular_movies_snapshot(1), popular_tv_snapshot(1)]
+
+    def invalidate(self, profile_id: str):
+        """Drop a profile's cached feed after its watchlist changes"""
+        self.cache.delete(profile_id)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return cache counters"""
+        return self.cache.stats()
+
+
+# Create global home feed instance
+home_feed = HomeFeed()
@@ -0,0 +1,424 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import asyncio
+import json
+import os
+import time
+import uuid
+import logging
+
+from fastapi import HTTPException, status
+from pymongo import ReplaceOne, UpdateOne
+
+from models import ViewingHistoryCreate, ResumePosition, ContentType
+from database import db
+from catalog import catalog
+from cards import stitch_json_list
+
+logger = logging.getLogger(__name__)
+
+HistoryKey = Tuple[str, str]
+
+HISTORY_PROJECTION = {
+    "_id": 0, "content_id": 1, "content_type": 1, "progress_seconds": 1, "completed": 1, "watched_at": 1
+}
+
+
+class FlatHistoryStore:
+    """One viewing_history document per (profile_id, content_id) holding its latest progress"""
+
+    name = "flat"
+
+    async def write(self, entries: Dict[HistoryKey, Dict[str, Any]]):
+        """Upsert the latest progress of each stream"""
+        await db.database.viewing_history.bulk_write([
+            UpdateOne(
+                {"profile_id": profile_id, "content_id": content_id},
+                {"$set": event, "$setOnInsert": {"id": str(uuid.uuid4())}},
+                upsert=True
+            )
+            for (profile_id, content_id), event in entries.items()
+        ], ordered=False)
+
+    async def continue_watching(self, profile_id: str, limit: int) -> List[Dict[str, Any]]:
+        """Latest unfinished rows, served by the (profile_id, completed, watched_at) index"""
+        return await db.database.viewing_history.find(
+            {"profile_id": profile_id, "completed": False}, HISTORY_PROJECTION
+        ).sort("watched_at", -1).limit(limit).to_list(limit)
+
+    async def resume(self, profile_id: str, content_id: str) -> Optional[Dict[str, Any]]:
+        """Latest progress for one title, served by the unique (profile_id, content_id) index"""
+        return await db.database.viewing_history.find_one(
+            {"profile_id": profile_id, "content_id": content_id}, HISTORY_PROJECTION
+        )
+
+    async def interactions(self) -> AsyncIterator[Dict[str, Any]]:
+        """Every (profile, title) row with its latest watch time"""
+        async for row in db.database.viewing_history.find(
+            {}, {"_id": 0, "profile_id": 1, "content_id": 1, "content_type": 1, "watched_at": 1}
+        ):
+            yield row
+
+    async def migrate(self):
+        """Nothing to migrate into the flat layout"""
+
+    async def maintain(self):
+        """The flat layout keeps one row per title, so there is nothing to age out"""
+
+    def stats(self) -> Dict[str, Any]:
+        return {"storage": self.name}
+
+
+def _day_start(moment: datetime) -> datetime:
+    return datetime(moment.year, moment.month, moment.day)
+
+
+class BucketHistoryStore:
+    """Per-profile, per-day viewing_history_buckets documents holding compact event arrays
+
+    Each event is {c: content_id, t: content_type, o: milliseconds since
+    the start of the bucket's day, p: progress_seconds, d: completed}, and a
+    bucket keeps only the latest event per title, so it grows with the
+    titles watched that day rather than with heartbeats. The latest event
+    for a title across the newest-first buckets is its current progress.
+
+    Continue-watching scans at most max_scan_buckets live buckets, so it
+    matches the flat layout for titles watched on the profile's most
+    recent active days. Buckets older than archive_after_days move to
+    viewing_history_archive, which resume still falls back to and which can
+    expire on its own TTL.
+    """
+
+    name = "bucket"
+
+    def __init__(self):
+        self.migrate_flat = os.getenv("HISTORY_MIGRATE_FLAT", "true").lower() == "true"
+        self.archive_after_days = int(os.getenv("HISTORY_BUCKET_ARCHIVE_DAYS", "90"))
+        self.migration_batch = int(os.getenv("HISTORY_MIGRATION_BATCH", "1000"))
+        self.max_scan_buckets = int(os.getenv("HISTORY_MAX_SCAN_BUCKETS", "60"))
+        self.migrated = 0
+        self.archived = 0
+        self.buckets_scanned = 0
+
+    @staticmethod
+    def _event(content_id: str, event: Dict[str, Any], day: datetime) -> Dict[str, Any]:
+        return {
+            "c": content_id,
+            "t": event["content_type"],
+            "o": (event["watched_at"] - day) // timedelta(milliseconds=1),
+            "p": event["progress_seconds"],
+            "d": event["completed"],
+        }
+
+    @staticmethod
+    def _row(event: Dict[str, Any], day: datetime) -> Dict[str, Any]:
+        return {
+            "content_id": event["c"],
+            "content_type": event["t"],
+            "progress_seconds": event["p"],
+            "completed": event["d"],
+            "watched_at": day + timedelta(milliseconds=event["o"]),
+        }
+
+    def _replace_operations(self, events: List[Tuple[str, str, Dict[str, Any]]]) -> List[UpdateOne]:
+        """Operations replacing each title's event in its day bucket
+
+        The $pull and $push of a bucket cannot share one update, so they are
+        consecutive operations and the bulk write must run in order.
+        """
+        grouped: Dict[Tuple[str, datetime], Dict[str, Dict[str, Any]]] = defaultdict(dict)
+        for profile_id, content_id, event in events:
+            day = _day_start(event["watched_at"])
+            current = grouped[(profile_id, day)].get(content_id)
+            if current is None or event["watched_at"] >= self._row(current, day)["watched_at"]:
+                grouped[(profile_id, day)][content_id] = self._event(content_id, event, day)
+
+        operations = []
+        for (profile_id, day), bucket_events in grouped.items():
+            bucket = {"profile_id": profile_id, "day": day}
+            operations.append(UpdateOne(bucket, {"$pull": {"events": {"c": {"$in": list(bucket_events)}}}}))
+            operations.append(UpdateOne(bucket, {"$push": {"events": {"$each": list(bucket_events.values())}}}, upsert=True))
+        return operations
+
+    async def write(self, entries: Dict[HistoryKey, Dict[str, Any]]):
+        """Replace each stream's event in its profile's bucket for the day with its latest progress"""
+        await db.database.viewing_history_buckets.bulk_write(self._replace_operations([
+            (profile_id, content_id, event) for (profile_id, content_id), event in entries.items()
+        ]), ordered=True)
+
+    async def _buckets(self, query: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        for collection in (db.database.viewing_history_buckets, db.database.viewing_history_archive):
+            async for bucket in collection.find(query, {"_id": 0, "day": 1, "events": 1}).sort("day", -1):
+                self.buckets_scanned += 1
+                yield bucket
+
+    async def continue_watching(self, profile_id: str, limit: int) -> List[Dict[str, Any]]:
+        """Latest unfinished rows from at most max_scan_buckets live buckets, newest first"""
+        seen = set()
+        rows = []
+        buckets = db.database.viewing_history_buckets.find(
+            {"profile_id": profile_id}, {"_id": 0, "day": 1, "events": 1}
+        ).sort("day", -1).limit(self.max_scan_buckets)
+        async for bucket in buckets:
+            self.buckets_scanned += 1
+            for event in sorted(bucket["events"], key=lambda event: event["o"], reverse=True):
+                if event["c"] in seen:
+                    continue
+                seen.add(event["c"])
+                if not event["d"]:
+                    rows.append(self._row(event, bucket["day"]))
+                    if len(rows) == limit:
+                        return rows
+        return rows
+
+    async def resume(self, profile_id: str, content_id: str) -> Optional[Dict[str, Any]]:
+        """Latest progress for one title from the newest bucket containing it"""
+        async for bucket in self._buckets({"profile_id": profile_id, "events.c": content_id}):
+            latest = max((event for event in bucket["events"] if event["c"] == content_id), key=lambda event: event["o"])
+            return self._row(latest, bucket["day"])
+        return None
+
+    async def interactions(self) -> AsyncIterator[Dict[str, Any]]:
+        """Every event as a (profile, title) row; callers keep the latest per pair"""
+        for collection in (db.database.viewing_history_buckets, db.database.viewing_history_archive):
+            async for bucket in collection.find({}, {"_id": 0, "profile_id": 1, "day": 1, "events": 1}):
+                for event in bucket["events"]:
+                    yield {"profile_id": bucket["profile_id"], **self._row(event, bucket["day"])}
+
+    async def migrate(self):
+        """Move flat viewing_history rows into buckets, deleting each batch once it is written"""
+        if not self.migrate_flat or db.database is None:
+            return
+
+        while True:
+            rows = await db.database.viewing_history.find({}).limit(self.migration_batch).to_list(self.migration_batch)
+            if not rows:
+                break
+            await db.database.viewing_history_buckets.bulk_write(self._replace_operations([
+                (row["profile_id"], row["content_id"], row) for row in rows
+            ]), ordered=True)
+            # Re-running after a crash between these writes only replaces events with themselves
+            await db.database.viewing_history.delete_many({"_id": {"$in": [row["_id"] for row in rows]}})
+            self.migrated += len(rows)
+
+        if self.migrated:
+            logger.info(f"Migrated {self.migrated} viewing history rows into daily buckets")
+
+    async def maintain(self):
+        """Move buckets past the archive age into viewing_history_archive"""
+        if self.archive_after_days <= 0 or db.database is None:
+            return
+
+        cutoff = _day_start(datetime.utcnow()) - timedelta(days=self.archive_after_days)
+        while True:
+            buckets = await db.database.viewing_history_buckets.find(
+                {"day": {"$lt": cutoff}}
+            ).limit(self.migration_batch).to_list(self.migration_batch)
+            if not buckets:
+                break
+            archived_at = datetime.utcnow()
+            await db.database.viewing_history_archive.bulk_write([
+                ReplaceOne({"_id": bucket["_id"]}, {**bucket, "archived_at": archived_at}, upsert=True)
+                for bucket in buckets
+            ], ordered=False)
+            await db.database.viewing_history_buckets.delete_many({"_id": {"$in": [bucket["_id"] for bucket in buckets]}})
+            self.archived += len(buckets)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "storage": self.name,
+            "archive_after_days": self.archive_after_days,
+            "migrated": self.migrated,
+            "archived": self.archived,
+            "buckets_scanned": self.buckets_scanned,
+        }
+
+
+def create_history_store():
+    """Storage layout selected by HISTORY_STORAGE (flat or bucket)"""
+    if os.getenv("HISTORY_STORAGE", "flat").lower() == "bucket":
+        return BucketHistoryStore()
+    return FlatHistoryStore()
+
+
+class HistoryBuffer:
+    """Write-behind buffer for playback progress heartbeats
+
+    Heartbeats are coalesced in memory to the latest progress per
+    (profile_id, content_id) and flushed as one unordered bulk upsert per
+    batch, either on an interval or as soon as a batch fills up. When the
+    buffer holds max_pending distinct streams, new streams are refused with
+    a 503 until a flush drains it; updates to buffered streams are always
+    accepted since they do not grow it.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.flush_interval = float(os.getenv("HISTORY_FLUSH_INTERVAL_SECONDS", "2"))
+        self.maintenance_interval = float(os.getenv("HISTORY_MAINTENANCE_INTERVAL_SECONDS", "3600"))
+        self.flush_batch = int(os.getenv("HISTORY_FLUSH_BATCH", "1000"))
+        self.max_pending = int(os.getenv("HISTORY_BUFFER_MAX", "50000"))
+        self._pending: Dict[HistoryKey, Dict[str, Any]] = {}
+        self._batch_ready = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.received = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self.flushes = 0
+        self.written = 0
+        self.write_failures = 0
+        self.last_flush_seconds: Optional[float] = None
+        self._last_maintenance = time.monotonic()
+
+    def record(self, profile_id: str, heartbeat: ViewingHistoryCreate, watched_at: Optional[datetime] = None):
+        """Buffer a heartbeat, keeping only the latest one per stream"""
+        key = (profile_id, heartbeat.content_id)
+        event = {
+            "content_type": heartbeat.content_type.value,
+            "progress_seconds": heartbeat.progress_seconds,
+            "completed": heartbeat.completed,
+            "watched_at": watched_at or datetime.utcnow(),
+        }
+
+        current = self._pending.get(key)
+        if current is None:
+            if len(self._pending) >= self.max_pending:
+                self.rejected += 1
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Too many pending progress updates, try again shortly",
+                    headers={"Retry-After": str(max(1, round(self.flush_interval)))}
+                )
+            self._pending[key] = event
+            if len(self._pending) >= self.flush_batch:
+                self._batch_ready.set()
+        else:
+            self.coalesced += 1
+            if event["watched_at"] >= current["watched_at"]:
+                self._pending[key] = event
+        self.received += 1
+
+    def pending(self, profile_id: str, content_id: str) -> Optional[Dict[str, Any]]:
+        """Latest buffered heartbeat for a stream that has not been flushed yet"""
+        return self._pending.get((profile_id, content_id))
+
+    def _requeue(self, entries: Dict[HistoryKey, Dict[str, Any]]):
+        # Keep heartbeats that arrived during the failed write, they are newer
+        for key, event in entries.items():
+            self._pending.setdefault(key, event)
+
+    async def flush(self) -> int:
+        """Write every buffered stream, returning how many were written"""
+        async with self._flush_lock:
+            if not self._pending or db.database is None:
+                return 0
+
+            entries, self._pending = self._pending, {}
+            self._batch_ready.clear()
+            started = time.monotonic()
+            items = list(entries.items())
+            written = 0
+            for start in range(0, len(items), self.flush_batch):
+                batch = dict(items[start:start + self.flush_batch])
+                try:
+                    await self.store.write(batch)
+                    written += len(batch)
+                except Exception as e:
+                    logger.error(f"Error flushing {len(batch)} progress updates: {str(e)}")
+                    self.write_failures += 1
+                    self._requeue(batch)
+
+            self.flushes += 1
+            self.written += written
+            self.last_flush_seconds = round(time.monotonic() - started, 4)
+            return written
+
+    async def start(self):
+        """Start the periodic flush loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flush loop and write everything still buffered"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+        if self._pending:
+            logger.error(f"Dropped {len(self._pending)} progress updates that could not be flushed on shutdown")
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._batch_ready.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                # Shielded so stopping the loop never abandons a batch mid-write
+                await asyncio.shield(self.flush())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in history flush loop: {str(e)}")
+
+            if time.monotonic() - self._last_maintenance >= self.maintenance_interval:
+                self._last_maintenance = time.monotonic()
+                try:
+                    await self.store.maintain()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Error maintaining viewing history: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Return buffer and flush counters"""
+        return {
+            "pending": len(self._pending),
+            "max_pending": self.max_pending,
+            "received": self.received,
+            "coalesced": self.coalesced,
+            "rejected": self.rejected,
+            "flushes": self.flushes,
+            "written": self.written,
+            "write_failures": self.write_failures,
+            "last_flush_seconds": self.last_flush_seconds,
+            **self.store.stats(),
+        }
+
+
+# Create global history store and buffer instances
+history_store = create_history_store()
+history_buffer = HistoryBuffer(history_store)
+
+
+async def continue_watching_json(profile_id: str, limit: int) -> bytes:
+    """Serialized unfinished titles for a profile, most recently watched first
+
+    Titles are hydrated with one card query per collection.
+    """
+    rows = await history_store.continue_watching(profile_id, limit)
+
+    cards = await catalog.load_card_json_map([
+        (ContentType(row["content_type"]), row["content_id"]) for row in rows
+    ])
+    items = []
+    for row in rows:
+        card = cards.get((ContentType(row["content_type"]), row["content_id"]))
+        if card is None:
+            continue
+        progress = json.dumps({"progress_seconds": row["progress_seconds"], "watched_at": row["watched_at"].isoformat()})
+        items.append(b'{"content":' + card + b"," + progress[1:].encode())
+    return stitch_json_list(items)
+
+
+async def resume_position(profile_id: str, content_id: str) -> Optional[ResumePosition]:
+    """Resume point for a title, preferring a heartbeat that is still buffered"""
+    row = history_buffer.pending(profile_id, content_id)
+    if row is None:
+        row = await history_store.resume(profile_id, content_id)
+    if row is None:
+        return None
+    return ResumePosition(content_id=content_id, **{field: value for field, value in row.items() if field != "content_id"})
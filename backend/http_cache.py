@@ -0,0 +1,86 @@
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Optional
+import hashlib
+import os
+
+from fastapi import Request, Response
+
+# Catalog data is identical for every user, so shared caches may store it
+SHARED_CACHE_CONTROL = "public, max-age={}, stale-while-revalidate={}".format(
+    int(os.getenv("HTTP_CACHE_MAX_AGE", "60")),
+    int(os.getenv("HTTP_CACHE_STALE_WHILE_REVALIDATE", "600"))
+)
+# Per-profile data may only be kept by the client and must be revalidated
+PRIVATE_CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(*parts: Any) -> str:
+    """Build a strong ETag from version parts or a response body"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode())
+        digest.update(b"\0")
+    return f'"{digest.hexdigest()[:32]}"'
+
+
+def _http_date(value: datetime) -> str:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+
+def _validator_headers(etag: str, cache_control: str, last_modified: Optional[datetime]) -> dict:
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if last_modified is not None:
+        headers["Last-Modified"] = _http_date(last_modified)
+    return headers
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime] = None) -> bool:
+    """Check If-None-Match, or If-Modified-Since when no entity tags were sent"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        # If-None-Match uses the weak comparison, so ignore W/ prefixes
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return etag in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        modified = last_modified if last_modified.tzinfo else last_modified.replace(tzinfo=timezone.utc)
+        return modified.replace(microsecond=0) <= since
+    return False
+
+
+def not_modified_response(
+    request: Request,
+    etag: str,
+    cache_control: str,
+    last_modified: Optional[datetime] = None
+) -> Optional[Response]:
+    """Return a 304 when the client's copy is current, otherwise None"""
+    if is_not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=_validator_headers(etag, cache_control, last_modified))
+    return None
+
+
+def json_response(
+    body: bytes,
+    etag: str,
+    cache_control: str,
+    last_modified: Optional[datetime] = None
+) -> Response:
+    """Return serialized JSON with validators and cache headers"""
+    return Response(
+        content=body,
+        media_type="application/json",
+        headers=_validator_headers(etag, cache_control, last_modified)
+    )
@@ -17,6 +17,13 @@ class ContentType(str, Enum):
     MOVIE = "movie"
     TV_SHOW = "tv"
 
+# Namespace for deterministic content ids derived from (content_type, tmdb_id)
+CONTENT_ID_NAMESPACE = uuid.UUID("6f1c2a4e-8d3b-5e7a-9c0f-2b4d6e8a1c3f")
+
+def content_id(content_type: ContentType, tmdb_id: int) -> str:
+    """Return the stable catalog id for a TMDB title"""
+    return str(uuid.uuid5(CONTENT_ID_NAMESPACE, f"{content_type.value}:{tmdb_id}"))
+
 class MaturityRating(str, Enum):
     G = "G"
     PG = "PG"
@@ -63,6 +70,7 @@ class User(BaseModel):
     is_active: bool = True
     created_at: datetime = Field(default_factory=datetime.utcnow)
     profiles: List[Profile] = Field(default_factory=list)
+    token_version: int = 0
 
 class UserInDB(User):
     hashed_password: str
@@ -170,6 +178,13 @@ class ViewingHistoryCreate(BaseModel):
     progress_seconds: int = 0
     completed: bool = False
 
+class ResumePosition(BaseModel):
+    content_id: str
+    content_type: ContentType
+    progress_seconds: int = 0
+    completed: bool = False
+    watched_at: Optional[datetime] = None
+
 # Search Models
 class SearchResult(BaseModel):
     movies: List[Movie] = Field(default_factory=list)
@@ -191,6 +206,13 @@ class Token(BaseModel):
     token_type: str = "bearer"
     expires_in: int
 
+class TokenClaims(BaseModel):
+    sub: str
+    plan: SubscriptionPlan
+    active: bool = True
+    profiles: List[str] = Field(default_factory=list)
+    ver: int = 0
+
 class ProfileResponse(BaseModel):
     id: str
     name: str
@@ -225,6 +247,31 @@ class ContentResponse(BaseModel):
     maturity_rating: Optional[MaturityRating]
     content_type: ContentType
 
+class HomeFeedResponse(BaseModel):
+    trending: List[ContentResponse] = Field(default_factory=list)
+    popular_movies: List[ContentResponse] = Field(default_factory=list)
+    popular_tv_shows: List[ContentResponse] = Field(default_factory=list)
+    watchlist: List[ContentResponse] = Field(default_factory=list)
+
+class ContinueWatchingItem(BaseModel):
+    content: ContentResponse
+    progress_seconds: int
+    watched_at: datetime
+
+class RecommendationRow(BaseModel):
+    reason: str
+    seed: ContentResponse
+    items: List[ContentResponse]
+
+class Suggestion(BaseModel):
+    id: str
+    tmdb_id: int
+    title: str
+    content_type: ContentType
+    popularity: float
+    poster_path: Optional[str] = None
+    year: Optional[str] = None
+
 # Error Models
 class ErrorResponse(BaseModel):
     error: str
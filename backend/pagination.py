@@ -0,0 +1,97 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+import base64
+import json
+
+from fastapi import HTTPException, status
+
+# Sort keys as (field, direction, type) triples, using pymongo's 1 / -1 directions;
+# the type is what a cursor value for that field must decode to
+SortKeys = List[Tuple[str, int, type]]
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"$date": value.isoformat()}
+    return value
+
+
+def _decode_value(value: Any) -> Any:
+    if isinstance(value, dict) and "$date" in value:
+        return datetime.fromisoformat(value["$date"])
+    return value
+
+
+def _has_type(value: Any, expected: type) -> bool:
+    # bool is an int subclass, and JSON may turn a whole float into an int
+    if isinstance(value, bool):
+        return expected is bool
+    if expected is float:
+        return isinstance(value, (int, float))
+    return isinstance(value, expected)
+
+
+def mongo_sort(sort: SortKeys) -> List[Tuple[str, int]]:
+    """(field, direction) pairs for pymongo's sort()"""
+    return [(field, direction) for field, direction, _ in sort]
+
+
+def encode_cursor(sort: SortKeys, doc: Dict[str, Any]) -> str:
+    """Opaque cursor pointing just past doc in the given sort order"""
+    payload = [_encode_value(doc.get(field)) for field, _, _ in sort]
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(sort: SortKeys, cursor: str) -> List[Any]:
+    """Sort key values from a cursor, rejecting anything this sort could not have produced"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = [_decode_value(value) for value in json.loads(raw)]
+    except (ValueError, TypeError):
+        values = None
+    # Only scalars of each key's type may reach the query, never operators or documents
+    if (
+        not isinstance(values, list)
+        or len(values) != len(sort)
+        or not all(_has_type(value, expected) for value, (_, _, expected) in zip(values, sort))
+    ):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    return values
+
+
+def keyset_filter(sort: SortKeys, values: List[Any]) -> Dict[str, Any]:
+    """Filter for documents strictly after values in sort order
+
+    Matches on an equal prefix of the sort keys and a strictly later value
+    for the next key, so a compound index on the sort keys serves every page
+    with a bounded range scan instead of skipping over earlier pages.
+    """
+    branches = []
+    for position, (field, direction, _) in enumerate(sort):
+        branch = {prefix_field: values[index] for index, (prefix_field, _, _) in enumerate(sort[:position])}
+        branch[field] = {"$gt" if direction == 1 else "$lt": values[position]}
+        branches.append(branch)
+    return branches[0] if len(branches) == 1 else {"$or": branches}
+
+
+async def fetch_page(
+    collection,
+    query: Dict[str, Any],
+    sort: SortKeys,
+    limit: int,
+    cursor: Optional[str] = None,
+    projection: Optional[Dict[str, Any]] = None
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Read one keyset page and the cursor for the next one, or None on the last page"""
+    if cursor:
+        query = {"$and": [query, keyset_filter(sort, decode_cursor(sort, cursor))]}
+
+    # One extra document tells whether another page follows
+    docs = await collection.find(query, projection).sort(mongo_sort(sort)).limit(limit + 1).to_list(limit + 1)
+    if len(docs) <= limit:
+        return docs, None
+    docs = docs[:limit]
+    return docs, encode_cursor(sort, docs[-1])
@@ -0,0 +1,169 @@
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, List, Optional
+import asyncio
+import hashlib
+import random
+import time
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at a fixed rate"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available(self, now: float) -> float:
+        """Return the tokens available right now"""
+        self._refill(now)
+        return self.tokens
+
+    def take(self, now: float) -> bool:
+        """Take one token if available"""
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def wait_time(self, now: float) -> float:
+        """Return seconds until one token is available"""
+        self._refill(now)
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class KeyState:
+    """Budget and usage counters for one API key"""
+
+    def __init__(self, key: str, rate: float, burst: float):
+        self.key = key
+        self.bucket = TokenBucket(rate, burst)
+        self.blocked_until = 0.0
+        self.requests = 0
+        self.throttled = 0
+
+    def wait_time(self, now: float) -> float:
+        if self.blocked_until > now:
+            return self.blocked_until - now
+        return self.bucket.wait_time(now)
+
+
+class RateGovernor:
+    """Spread requests across API keys with per-key token buckets and adaptive backoff
+
+    Callers wait in acquire() while every key is out of budget or cooling
+    down after a 429, and only give up once they have waited max_wait.
+    """
+
+    def __init__(
+        self,
+        keys: List[str],
+        rate: float,
+        burst: float,
+        max_wait: float,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30.0
+    ):
+        self.keys = [KeyState(key, rate, burst) for key in keys]
+        self.max_wait = max_wait
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.waiting = 0
+        self.waits = 0
+        self.exhausted = 0
+
+    async def acquire(self) -> Optional[str]:
+        """Wait for a key with budget, or return None once max_wait has passed"""
+        if not self.keys:
+            return None
+
+        deadline = time.monotonic() + self.max_wait
+        waited = False
+        while True:
+            now = time.monotonic()
+            # Prefer the ready key with the most budget left so load spreads evenly
+            ready = [state for state in self.keys if state.blocked_until <= now and state.bucket.available(now) >= 1]
+            if ready:
+                state = max(ready, key=lambda s: s.bucket.tokens)
+                state.bucket.take(now)
+                state.requests += 1
+                return state.key
+
+            remaining = deadline - now
+            if remaining <= 0:
+                self.exhausted += 1
+                return None
+            # Cooldowns longer than max_wait are still waited on until the deadline
+            delay = min(min(state.wait_time(now) for state in self.keys), remaining)
+
+            if not waited:
+                waited = True
+                self.waits += 1
+            self.waiting += 1
+            try:
+                # Jitter wakeups so queued callers do not stampede the same key
+                await asyncio.sleep(delay + random.uniform(0, min(delay, 0.05)))
+            finally:
+                self.waiting -= 1
+
+    def backoff(self, attempt: int) -> float:
+        """Return a full-jitter exponential backoff delay"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def throttle(self, key: str, retry_after: Optional[float], attempt: int) -> float:
+        """Cool a key down after a 429, honoring Retry-After when the server sent one"""
+        delay = retry_after if retry_after is not None else self.backoff(attempt)
+        for state in self.keys:
+            if state.key == key:
+                state.throttled += 1
+                state.blocked_until = max(state.blocked_until, time.monotonic() + delay)
+        return delay
+
+    @staticmethod
+    def parse_retry_after(value: Optional[str]) -> Optional[float]:
+        """Parse a Retry-After header given in seconds or as an HTTP date"""
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+    @staticmethod
+    def _fingerprint(key: str) -> str:
+        # Enough to tell keys apart across deploys without revealing any of their characters
+        return hashlib.sha256(key.encode()).hexdigest()[:8]
+
+    def stats(self) -> Dict[str, Any]:
+        """Return per-key usage and throttle counters"""
+        now = time.monotonic()
+        return {
+            "waiting": self.waiting,
+            "waits": self.waits,
+            "exhausted": self.exhausted,
+            "keys": [
+                {
+                    "index": index,
+                    "fingerprint": self._fingerprint(state.key),
+                    "requests": state.requests,
+                    "throttled": state.throttled,
+                    "tokens": round(state.bucket.available(now), 2),
+                    "cooling_down_for": round(max(0.0, state.blocked_until - now), 2),
+                }
+                for index, state in enumerate(self.keys)
+            ],
+        }
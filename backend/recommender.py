@@ -0,0 +1,310 @@
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
+import asyncio
+import math
+import os
+import time
+import zlib
+import logging
+
+import numpy as np
+
+from models import Movie, TVShow, ContentType
+from database import db
+
+logger = logging.getLogger(__name__)
+
+# Stored fields the feature vector is built from
+FEATURE_FIELDS = {
+    "id", "content_type", "genres", "original_language", "spoken_languages",
+    "production_companies", "vote_average", "popularity"
+}
+FEATURE_PROJECTION = {"_id": 0, **{field: 1 for field in FEATURE_FIELDS}}
+
+CONTENT_TYPES = [ContentType.MOVIE, ContentType.TV_SHOW]
+
+# Everything build() produces, swapped in together once a rebuild finishes
+MODEL_FIELDS = ("matrix", "neighbours", "scores", "size", "ids", "types", "rows", "build_seconds")
+
+
+class SimilarTitles:
+    """Content-based "More Like This" table over the whole catalog
+
+    Every title becomes an L2-normalized float32 row: hashed genre, language,
+    spoken language, company and content type tokens, plus its scaled rating
+    and log popularity. Cosine top-k neighbours for every row are computed
+    with batched matrix products and kept in a table, so serving is a row
+    lookup.
+
+    Upserted titles update their own rows and neighbour lists, and are merged
+    into every other title's list in one vectorized pass. A title whose
+    features change is dropped from lists it no longer belongs in, but a
+    replacement for it is only found at the next full build, which runs
+    every refresh_interval.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("RECOMMENDER_ENABLED", "true").lower() == "true"
+        self.dimensions = int(os.getenv("RECOMMENDER_DIMENSIONS", "128"))
+        self.top_k = int(os.getenv("RECOMMENDER_TOP_K", "20"))
+        self.batch_size = int(os.getenv("RECOMMENDER_BATCH_SIZE", "128"))
+        self.refresh_interval = int(os.getenv("RECOMMENDER_REFRESH_SECONDS", "86400"))
+        self.retry_interval = int(os.getenv("RECOMMENDER_RETRY_SECONDS", "60"))
+        self.weights = {
+            "genre": 1.0, "language": 0.5, "spoken": 0.3, "company": 0.5,
+            "type": 0.5, "rating": 0.4, "popularity": 0.4,
+        }
+        self.width = self.dimensions + 2
+        self.matrix = np.zeros((0, self.width), dtype=np.float32)
+        self.neighbours = np.zeros((0, self.top_k), dtype=np.int32)
+        self.scores = np.zeros((0, self.top_k), dtype=np.float32)
+        self.size = 0
+        self.ids: List[str] = []
+        self.types = np.zeros(0, dtype=np.int8)
+        self.rows: Dict[str, int] = {}
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._replay: Optional[Dict[str, Dict[str, Any]]] = None
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        # Strong references to queued patches, which the event loop only holds weakly
+        self._patches: Set[asyncio.Task] = set()
+        self.ready = False
+        self.rebuilds = 0
+        self.failures = 0
+        self.build_seconds: Optional[float] = None
+        self.updates = 0
+        self.last_update_seconds: Optional[float] = None
+
+    def _token_slot(self, token: str) -> int:
+        return zlib.crc32(token.encode()) % self.dimensions
+
+    def vector(self, doc: Dict[str, Any]) -> np.ndarray:
+        """Feature row for a stored title document"""
+        row = np.zeros(self.width, dtype=np.float32)
+        groups = [
+            ("genre", [f"g:{genre['id']}" for genre in doc.get("genres") or []]),
+            ("language", [f"l:{doc['original_language']}"] if doc.get("original_language") else []),
+            ("spoken", [f"s:{language['iso_639_1']}" for language in doc.get("spoken_languages") or []]),
+            ("company", [f"c:{company['id']}" for company in doc.get("production_companies") or []]),
+            ("type", [f"t:{ContentType(doc['content_type']).value}"]),
+        ]
+        for group, tokens in groups:
+            if not tokens:
+                continue
+            # Share each group's weight across its tokens so long company lists do not dominate
+            weight = self.weights[group] / math.sqrt(len(tokens))
+            for token in tokens:
+                row[self._token_slot(token)] += weight
+        row[self.dimensions] = self.weights["rating"] * float(doc.get("vote_average") or 0.0) / 10.0
+        row[self.dimensions + 1] = self.weights["popularity"] * min(math.log1p(float(doc.get("popularity") or 0.0)) / 10.0, 1.0)
+        norm = np.linalg.norm(row)
+        return row / norm if norm else row
+
+    def _top_k(self, similarities: np.ndarray, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # Exclude each row's own column, then keep the k best columns in score order
+        similarities[np.arange(len(rows)), rows] = -np.inf
+        k = min(self.top_k, similarities.shape[1])
+        neighbours = np.full((len(rows), self.top_k), -1, dtype=np.int32)
+        scores = np.full((len(rows), self.top_k), -np.inf, dtype=np.float32)
+        if k == 0:
+            return neighbours, scores
+        # Partitioning towards the end avoids a negated copy of the whole block
+        columns = similarities.shape[1]
+        best = np.argpartition(similarities, columns - k, axis=1)[:, columns - k:]
+        best_scores = np.take_along_axis(similarities, best, axis=1)
+        order = np.argsort(-best_scores, axis=1)
+        neighbours[:, :k] = np.take_along_axis(best, order, axis=1)
+        scores[:, :k] = np.take_along_axis(best_scores, order, axis=1)
+        scores[neighbours < 0] = -np.inf
+        neighbours[~np.isfinite(scores)] = -1
+        return neighbours, scores
+
+    def _ensure_capacity(self, size: int):
+        capacity = len(self.matrix)
+        if size <= capacity:
+            return
+        capacity = max(size, capacity * 2, 1024)
+        for name, shape, fill in (
+            ("matrix", (capacity, self.width), 0),
+            ("neighbours", (capacity, self.top_k), -1),
+            ("scores", (capacity, self.top_k), -np.inf),
+            ("types", (capacity,), 0),
+        ):
+            current = getattr(self, name)
+            grown = np.full(shape, fill, dtype=current.dtype)
+            grown[:len(current)] = current
+            setattr(self, name, grown)
+
+    def build(self, docs: List[Dict[str, Any]]):
+        """Replace the table with one built from scratch over docs"""
+        started = time.monotonic()
+        self.matrix = np.zeros((0, self.width), dtype=np.float32)
+        self.neighbours = np.zeros((0, self.top_k), dtype=np.int32)
+        self.scores = np.zeros((0, self.top_k), dtype=np.float32)
+        self.types = np.zeros(0, dtype=np.int8)
+        self.size = 0
+        self.ids, self.rows = [], {}
+        self._ensure_capacity(len(docs))
+        for doc in docs:
+            self._place(doc)
+
+        live = self.matrix[:self.size]
+        # One similarity block is reused for every batch to bound peak memory
+        block = np.empty((min(self.batch_size, self.size), self.size), dtype=np.float32)
+        for start in range(0, self.size, self.batch_size):
+            rows = np.arange(start, min(start + self.batch_size, self.size))
+            similarities = block[:len(rows)]
+            np.matmul(live[rows], live.T, out=similarities)
+            self.neighbours[rows], self.scores[rows] = self._top_k(similarities, rows)
+        self.build_seconds = round(time.monotonic() - started, 3)
+
+    def _place(self, doc: Dict[str, Any]) -> int:
+        row = self.rows.get(doc["id"])
+        if row is None:
+            row = self.size
+            self.size += 1
+            self.ids.append(doc["id"])
+            self.rows[doc["id"]] = row
+        self.matrix[row] = self.vector(doc)
+        self.types[row] = CONTENT_TYPES.index(ContentType(doc["content_type"]))
+        return row
+
+    def update(self, docs: List[Dict[str, Any]]):
+        """Add or refresh titles, patching neighbour lists instead of rebuilding"""
+        started = time.monotonic()
+        self._ensure_capacity(self.size + len(docs))
+        changed = np.array(sorted({self._place(doc) for doc in docs}), dtype=np.int32)
+        if len(changed) == 0:
+            return
+
+        live = self.matrix[:self.size]
+        similarities = live[changed] @ live.T
+
+        # Everyone else: forget stale scores for changed titles, then merge in their new ones
+        others = np.setdiff1d(np.arange(self.size, dtype=np.int32), changed)
+        neighbours, scores = self.neighbours[others], self.scores[others]
+        scores[np.isin(neighbours, changed)] = -np.inf
+        candidates = np.concatenate([scores, similarities[:, others].T], axis=1)
+        candidate_rows = np.concatenate([neighbours, np.broadcast_to(changed, (len(others), len(changed)))], axis=1)
+        k = min(self.top_k, candidates.shape[1])
+        best = np.argpartition(-candidates, k - 1, axis=1)[:, :k]
+        best_scores = np.take_along_axis(candidates, best, axis=1)
+        order = np.argsort(-best_scores, axis=1)
+        merged_scores = np.take_along_axis(best_scores, order, axis=1)
+        merged_neighbours = np.take_along_axis(np.take_along_axis(candidate_rows, best, axis=1), order, axis=1)
+        merged_neighbours[~np.isfinite(merged_scores)] = -1
+        self.scores[others, :k] = merged_scores
+        self.neighbours[others, :k] = merged_neighbours
+
+        # The changed titles themselves get exact lists
+        self.neighbours[changed], self.scores[changed] = self._top_k(similarities, changed)
+        self.updates += 1
+        self.last_update_seconds = round(time.monotonic() - started, 4)
+
+    def similar(self, content_id: str, limit: int) -> Optional[List[Tuple[ContentType, str]]]:
+        """Most similar titles as (content_type, content_id), or None for an unknown title"""
+        row = self.rows.get(content_id)
+        if row is None:
+            return None
+        return [
+            (CONTENT_TYPES[self.types[neighbour]], self.ids[neighbour])
+            for neighbour in self.neighbours[row][:limit] if neighbour >= 0
+        ]
+
+    async def _load(self) -> List[Dict[str, Any]]:
+        docs = []
+        for collection in (db.database.movies, db.database.tv_shows):
+            async for doc in collection.find({}, FEATURE_PROJECTION):
+                if doc.get("id") and doc.get("content_type"):
+                    docs.append(doc)
+        return docs
+
+    async def rebuild(self):
+        """Reload the catalog and build a fresh table off the event loop, then swap it in"""
+        # Upserts patched in while the reload is in flight are replayed onto the fresh table
+        self._replay = {}
+        try:
+            docs = await self._load()
+            fresh = SimilarTitles()
+            await asyncio.to_thread(fresh.build, docs)
+            async with self._lock:
+                for field in MODEL_FIELDS:
+                    setattr(self, field, getattr(fresh, field))
+                self._pending = {**self._replay, **self._pending}
+                self.ready = True
+        finally:
+            self._replay = None
+
+        self.rebuilds += 1
+        logger.info(f"Built similar titles for {self.size} titles in {self.build_seconds}s")
+        await self._apply_pending()
+
+    async def _run(self):
+        while True:
+            try:
+                await self.rebuild()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error building similar titles: {str(e)}")
+                self.failures += 1
+                await asyncio.sleep(self.retry_interval)
+                continue
+            await asyncio.sleep(self.refresh_interval)
+
+    async def start(self):
+        """Build the table in the background and rebuild it every refresh_interval"""
+        if self.enabled and db.database is not None and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the rebuild loop and any queued patches"""
+        tasks = list(self._patches)
+        if self._task is not None:
+            tasks.append(self._task)
+            self._task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _apply_pending(self):
+        async with self._lock:
+            if not self._pending or not self.ready:
+                return
+            pending, self._pending = self._pending, {}
+            try:
+                await asyncio.to_thread(self.update, list(pending.values()))
+            except Exception as e:
+                logger.error(f"Error updating similar titles: {str(e)}")
+            if self._replay is not None:
+                self._replay.update(pending)
+
+    def add_titles(self, titles: List[Union[Movie, TVShow]]):
+        """Queue catalog upserts and patch the table off the event loop"""
+        if not self.enabled:
+            return
+        for title in titles:
+            self._pending[title.id] = title.dict(include=FEATURE_FIELDS)
+        if self.ready:
+            task = asyncio.get_running_loop().create_task(self._apply_pending())
+            self._patches.add(task)
+            task.add_done_callback(self._patches.discard)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return table size and timing"""
+        return {
+            "enabled": self.enabled,
+            "ready": self.ready,
+            "titles": self.size,
+            "top_k": self.top_k,
+            "matrix_bytes": self.matrix.nbytes + self.neighbours.nbytes + self.scores.nbytes,
+            "build_seconds": self.build_seconds,
+            "rebuilds": self.rebuilds,
+            "failures": self.failures,
+            "updates": self.updates,
+            "last_update_seconds": self.last_update_seconds,
+            "pending": len(self._pending),
+        }
+
+
+# Create global recommender instance
+similar_titles = SimilarTitles()
@@ -0,0 +1,155 @@
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import os
+import unicodedata
+import logging
+
+from models import Movie, TVShow, ContentType
+from database import db
+from cache import TTLCache
+from catalog import catalog
+from tmdb_service import tmdb_service
+
+logger = logging.getLogger(__name__)
+
+RESULT_KINDS = (("movies", ContentType.MOVIE), ("tv_shows", ContentType.TV_SHOW))
+
+
+def canonical_query(query: str) -> str:
+    """Canonical form of a search query: NFKC-normalized, case-folded, single-spaced"""
+    return " ".join(unicodedata.normalize("NFKC", query).casefold().split())
+
+
+class CatalogSearch:
+    """Relevance-ranked search over the Mongo catalog, querying TMDB only when it falls short
+
+    Ranking uses the weighted text indexes from database.create_indexes
+    (title, then original title, then genre names, then overview), with
+    popularity breaking ties. Results are cached per canonical query and
+    page as ordered TMDB ids, and rehydrated from the catalog on a hit.
+    """
+
+    def __init__(self):
+        self.min_local_results = int(os.getenv("SEARCH_LOCAL_MIN_RESULTS", "5"))
+        self.page_size = int(os.getenv("SEARCH_PAGE_SIZE", "10"))
+        self.results = TTLCache(
+            max_size=int(os.getenv("SEARCH_CACHE_SIZE", "5000")),
+            default_ttl=float(os.getenv("SEARCH_CACHE_TTL", "900"))
+        )
+        self.precompute_count = int(os.getenv("SEARCH_PRECOMPUTE_QUERIES", "50"))
+        self.max_tracked_queries = int(os.getenv("SEARCH_MAX_TRACKED_QUERIES", "10000"))
+        self.query_counts: Counter = Counter()
+        self.local_answers = 0
+        self.fallbacks = 0
+        self.cache_rehydrations = 0
+        self.precomputed = 0
+
+    async def _search_collection(self, content_type: ContentType, query: str, page: int) -> List[Any]:
+        collection = db.database.movies if content_type == ContentType.MOVIE else db.database.tv_shows
+        model = Movie if content_type == ContentType.MOVIE else TVShow
+        cursor = collection.find(
+            {"$text": {"$search": query}},
+            {"_id": 0, "score": {"$meta": "textScore"}}
+        ).sort([("score", {"$meta": "textScore"}), ("popularity", -1)]).skip(
+            (page - 1) * self.page_size
+        ).limit(self.page_size)
+
+        titles = []
+        async for doc in cursor:
+            try:
+                titles.append(model(**doc))
+            except Exception as e:
+                logger.error(f"Error loading search hit {doc.get('tmdb_id')}: {str(e)}")
+        return titles
+
+    async def search_local(self, query: str, page: int = 1) -> Dict[str, Any]:
+        """Search the catalog's text indexes"""
+        movies, tv_shows = await asyncio.gather(
+            self._search_collection(ContentType.MOVIE, query, page),
+            self._search_collection(ContentType.TV_SHOW, query, page)
+        )
+        return {"movies": movies, "tv_shows": tv_shows, "total_results": len(movies) + len(tv_shows)}
+
+    async def _execute(self, query: str, page: int) -> Dict[str, Any]:
+        local = await self.search_local(query, page)
+        if local["total_results"] >= self.min_local_results:
+            self.local_answers += 1
+            return local
+
+        self.fallbacks += 1
+        remote = await tmdb_service.search_content(query, page)
+        # Upserting the hits adds them to the text indexes for the next query
+        await catalog.persist_fetched(remote["movies"] + remote["tv_shows"])
+
+        results = {}
+        for kind in ("movies", "tv_shows"):
+            seen = {title.tmdb_id for title in local[kind]}
+            merged = local[kind] + [title for title in remote[kind] if title.tmdb_id not in seen]
+            results[kind] = merged[:self.page_size]
+        results["total_results"] = len(results["movies"]) + len(results["tv_shows"])
+        return results
+
+    async def _rehydrate(self, key: Tuple[str, int]) -> Optional[Dict[str, Any]]:
+        refs = self.results.get(key)
+        if refs is None:
+            return None
+
+        stored = await catalog.load_titles([
+            (content_type, tmdb_id) for kind, content_type in RESULT_KINDS for tmdb_id in refs[kind]
+        ])
+        results = {}
+        for kind, content_type in RESULT_KINDS:
+            titles = [stored.get((content_type, tmdb_id)) for tmdb_id in refs[kind]]
+            if any(title is None for title in titles):
+                # A title has left the catalog, so the cached page is no longer complete
+                self.results.delete(key)
+                return None
+            results[kind] = titles
+        results["total_results"] = len(results["movies"]) + len(results["tv_shows"])
+        self.cache_rehydrations += 1
+        return results
+
+    async def _execute_and_cache(self, key: Tuple[str, int]) -> Dict[str, Any]:
+        results = await self._execute(*key)
+        self.results.set(key, {kind: [title.tmdb_id for title in results[kind]] for kind, _ in RESULT_KINDS})
+        return results
+
+    def _track(self, key: Tuple[str, int]):
+        self.query_counts[key] += 1
+        if len(self.query_counts) > self.max_tracked_queries:
+            self.query_counts = Counter(dict(self.query_counts.most_common(self.max_tracked_queries // 2)))
+
+    async def search(self, query: str, page: int = 1) -> Dict[str, Any]:
+        """Search locally, topping up from TMDB when local results are below the threshold"""
+        key = (canonical_query(query), page)
+        self._track(key)
+        return await self._rehydrate(key) or await self._execute_and_cache(key)
+
+    async def precompute_popular(self):
+        """Re-run the most frequent queries so they are cached against the freshly warmed catalog"""
+        for key, _ in self.query_counts.most_common(self.precompute_count):
+            try:
+                await self._execute_and_cache(key)
+                self.precomputed += 1
+            except Exception as e:
+                logger.error(f"Error precomputing search {key[0]!r} page {key[1]}: {str(e)}")
+
+        # Halve the counts so popularity follows recent traffic
+        self.query_counts = Counter({key: count // 2 for key, count in self.query_counts.items() if count > 1})
+
+    def stats(self) -> Dict[str, Any]:
+        """Return local/fallback and result cache counters"""
+        return {
+            "min_local_results": self.min_local_results,
+            "local_answers": self.local_answers,
+            "fallbacks": self.fallbacks,
+            "cache": self.results.stats(),
+            "cache_rehydrations": self.cache_rehydrations,
+            "tracked_queries": len(self.query_counts),
+            "precomputed": self.precomputed,
+        }
+
+
+# Create global catalog search instance
+catalog_search = CatalogSearch()
@@ -5,11 +5,13 @@ from pathlib import Path
 # Add current directory to Python path
 sys.path.insert(0, str(Path(__file__).parent))
 
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, Query
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer
 from contextlib import asynccontextmanager
+from pymongo import ReturnDocument
 from typing import List, Optional
+import asyncio
 import logging
 from datetime import timedelta
 
@@ -17,7 +19,21 @@ from datetime import timedelta
 from models import *
 from database import db
 from auth import *
-from tmdb_service import tmdb_service
+from tmdb_service import tmdb_service, track_upstream_calls
+from catalog import catalog
+from cards import card_cache, stitch_json_list
+from catalog_warmer import catalog_warmer, popular_movies_snapshot, popular_tv_snapshot, trending_snapshot
+from feeds import (
+    home_feed, popular_movies_json, popular_tv_json, trending_json, watchlist_page,
+    snapshot_validators, watchlist_version, watchlist_changed, recommendations_json, last_modified
+)
+from search import catalog_search
+from suggest import suggest_index
+from recommender import similar_titles
+from collaborative import co_watch
+from history import history_store, history_buffer, continue_watching_json, resume_position
+from http_cache import make_etag, not_modified_response, json_response, SHARED_CACHE_CONTROL, PRIVATE_CACHE_CONTROL
+from pagination import NEXT_CURSOR_HEADER
 
 # Configure logging
 logging.basicConfig(
@@ -31,11 +47,40 @@ async def lifespan(app: FastAPI):
     # Startup
     await db.connect_to_mongo()
     logger.info("Connected to MongoDB")
+    if catalog.migrate_ids:
+        await catalog.migrate_content_ids()
+    await history_store.migrate()
+    await suggest_index.load()
+    await tmdb_service.start()
+    logger.info("Opened TMDB connection pool")
+    await catalog_warmer.start()
+    await history_buffer.start()
+    await similar_titles.start()
+    await co_watch.start()
     yield
     # Shutdown
+    await co_watch.stop()
+    await similar_titles.stop()
+    await history_buffer.stop()
+    logger.info("Flushed viewing history buffer")
+    await catalog_warmer.stop()
+    await catalog.close()
+    await tmdb_service.close()
+    logger.info("Closed TMDB connection pool")
+    password_hasher.shutdown()
     await db.close_mongo_connection()
     logger.info("Disconnected from MongoDB")
 
+# Serve title details from the Mongo catalog before going to TMDB
+if catalog.read_through:
+    tmdb_service.set_title_source(catalog)
+
+# Keep search-as-you-type suggestions in step with catalog upserts
+catalog.on_upsert(suggest_index.add_titles)
+catalog.on_upsert(similar_titles.add_titles)
+# Re-run popular searches once each warm cycle has refreshed the catalog
+catalog_warmer.on_warmed(catalog_search.precompute_popular)
+
 # Create FastAPI app with lifespan
 app = FastAPI(
     title="Netflix Clone API",
@@ -54,8 +99,18 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
+# Count TMDB calls made while serving each request
+@app.middleware("http")
+async def count_upstream_calls(request: Request, call_next):
+    counter = track_upstream_calls()
+    response = await call_next(request)
+    tmdb_service.record_upstream_calls(counter)
+    response.headers["X-TMDB-Upstream-Calls"] = str(counter.count)
+    return response
+
 # Security
 security = HTTPBearer()
 
@@ -64,6 +119,32 @@ security = HTTPBearer()
 async def health_check():
     return {"status": "healthy", "service": "Netflix Clone API"}
 
+@api_router.get("/stats")
+async def get_stats(admin: UserInDB = Depends(get_current_admin_user)):
+    """Get internal service statistics (admins only)"""
+    return {
+        "tmdb": {
+            "pool": tmdb_service.get_pool_stats(),
+            "upstream_calls": tmdb_service.get_upstream_call_stats(),
+            "cache": tmdb_service.cache.stats(),
+            "single_flight": tmdb_service.inflight.stats(),
+            "rate_governor": tmdb_service.governor.stats()
+        },
+        "auth": {
+            "user_cache": user_cache.stats(),
+            "password_hasher": password_hasher.stats()
+        },
+        "catalog": catalog.stats(),
+        "card_cache": card_cache.stats(),
+        "home_feed": home_feed.stats(),
+        "search": catalog_search.stats(),
+        "suggest": suggest_index.stats(),
+        "history": history_buffer.stats(),
+        "similar_titles": similar_titles.stats(),
+        "co_watch": co_watch.stats(),
+        "catalog_warmer": catalog_warmer.stats()
+    }
+
 # Authentication endpoints
 @api_router.post("/auth/register", response_model=UserResponse)
 async def register_user(user_data: UserCreate):
@@ -77,7 +158,7 @@ async def register_user(user_data: UserCreate):
         )
     
     # Create user
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await get_password_hash_async(user_data.password)
     user = UserInDB(
         email=user_data.email,
         first_name=user_data.first_name,
@@ -115,7 +196,21 @@ async def login_user(user_credentials: UserLogin):
     
     access_token_expires = timedelta(hours=ACCESS_TOKEN_EXPIRE_HOURS)
     access_token = create_access_token(
-        data={"sub": user.id}, expires_delta=access_token_expires
+        data=user_claims(user), expires_delta=access_token_expires
+    )
+    
+    return Token(
+        access_token=access_token,
+        token_type="bearer",
+        expires_in=ACCESS_TOKEN_EXPIRE_HOURS * 3600
+    )
+
+@api_router.post("/auth/refresh", response_model=Token)
+async def refresh_token(current_user: UserInDB = Depends(get_uncached_active_user)):
+    """Issue a new access token carrying the user's current claims"""
+    access_token_expires = timedelta(hours=ACCESS_TOKEN_EXPIRE_HOURS)
+    access_token = create_access_token(
+        data=user_claims(current_user), expires_delta=access_token_expires
     )
     
     return Token(
@@ -170,11 +265,16 @@ async def create_profile(
         language=profile_data.language
     )
     
-    # Add to user's profiles
-    await db.database.users.update_one(
+    # Add to user's profiles, bumping the token version so older tokens get refreshed
+    updated = await db.database.users.find_one_and_update(
         {"id": current_user.id},
-        {"$push": {"profiles": profile.dict()}}
+        {"$push": {"profiles": profile.dict()}, "$inc": {"token_version": 1}},
+        projection={"_id": 0, "token_version": 1},
+        return_document=ReturnDocument.AFTER
     )
+    invalidate_user(current_user.id)
+    if updated:
+        bump_token_version(current_user.id, updated["token_version"])
     
     return ProfileResponse(
         id=profile.id,
@@ -200,181 +300,157 @@ async def get_profiles(current_user: UserInDB = Depends(get_current_active_user)
     ]
 
 # Content endpoints
+async def snapshot_response(request: Request, snapshot_names: List[str], build) -> Response:
+    """Serve a shared catalog row with validators, answering 304 without building the body when possible"""
+    validators = await snapshot_validators(snapshot_names)
+    if validators:
+        etag, last_modified = validators
+        not_modified = not_modified_response(request, etag, SHARED_CACHE_CONTROL, last_modified)
+        if not_modified:
+            return not_modified
+    
+    # Stitch pre-serialized cards instead of re-validating the response model
+    body = await build()
+    if not validators:
+        etag, last_modified = make_etag(body), None
+    return not_modified_response(request, etag, SHARED_CACHE_CONTROL, last_modified) or json_response(
+        body, etag, SHARED_CACHE_CONTROL, last_modified
+    )
+
 @api_router.get("/movies/popular", response_model=List[ContentResponse])
 async def get_popular_movies(
+    request: Request,
     page: int = Query(1, ge=1, le=10),
     current_user: UserInDB = Depends(get_current_active_user)
 ):
-    """Get popular movies from TMDB"""
+    """Get popular movies from the warmed catalog, falling back to TMDB"""
     try:
-        movies = await tmdb_service.get_popular_movies(page)
-        
-        # Save to database if not exists
-        for movie in movies:
-            existing = await db.database.movies.find_one({"tmdb_id": movie.tmdb_id})
-            if not existing:
-                await db.database.movies.insert_one(movie.dict())
-        
-        return [
-            ContentResponse(
-                id=movie.id,
-                tmdb_id=movie.tmdb_id,
-                title=movie.title,
-                overview=movie.overview,
-                poster_path=movie.poster_path,
-                backdrop_path=movie.backdrop_path,
-                release_date=movie.release_date,
-                runtime=movie.runtime,
-                vote_average=movie.vote_average,
-                popularity=movie.popularity,
-                genres=movie.genres,
-                videos=movie.videos,
-                maturity_rating=movie.maturity_rating,
-                content_type=ContentType.MOVIE
-            ) for movie in movies
-        ]
+        return await snapshot_response(request, [popular_movies_snapshot(page)], lambda: popular_movies_json(page))
     except Exception as e:
         logger.error(f"Error fetching popular movies: {str(e)}")
         raise HTTPException(status_code=500, detail="Error fetching movies")
 
 @api_router.get("/tv/popular", response_model=List[ContentResponse])
 async def get_popular_tv_shows(
+    request: Request,
     page: int = Query(1, ge=1, le=10),
     current_user: UserInDB = Depends(get_current_active_user)
 ):
-    """Get popular TV shows from TMDB"""
+    """Get popular TV shows from the warmed catalog, falling back to TMDB"""
     try:
-        tv_shows = await tmdb_service.get_popular_tv_shows(page)
-        
-        # Save to database if not exists
-        for tv_show in tv_shows:
-            existing = await db.database.tv_shows.find_one({"tmdb_id": tv_show.tmdb_id})
-            if not existing:
-                await db.database.tv_shows.insert_one(tv_show.dict())
-        
-        return [
-            ContentResponse(
-                id=tv_show.id,
-                tmdb_id=tv_show.tmdb_id,
-                title=tv_show.name,
-                overview=tv_show.overview,
-                poster_path=tv_show.poster_path,
-                backdrop_path=tv_show.backdrop_path,
-                release_date=tv_show.first_air_date,
-                runtime=None,
-                vote_average=tv_show.vote_average,
-                popularity=tv_show.popularity,
-                genres=tv_show.genres,
-                videos=tv_show.videos,
-                maturity_rating=tv_show.maturity_rating,
-                content_type=ContentType.TV_SHOW
-            ) for tv_show in tv_shows
-        ]
+        return await snapshot_response(request, [popular_tv_snapshot(page)], lambda: popular_tv_json(page))
     except Exception as e:
         logger.error(f"Error fetching popular TV shows: {str(e)}")
         raise HTTPException(status_code=500, detail="Error fetching TV shows")
 
 @api_router.get("/content/trending", response_model=List[ContentResponse])
 async def get_trending_content(
+    request: Request,
     current_user: UserInDB = Depends(get_current_active_user)
 ):
-    """Get trending content"""
+    """Get trending content from the warmed catalog, falling back to TMDB"""
     try:
-        trending = await tmdb_service.get_trending_content()
-        
-        content_responses = []
-        
-        # Process movies
-        for movie in trending["movies"]:
-            existing = await db.database.movies.find_one({"tmdb_id": movie.tmdb_id})
-            if not existing:
-                await db.database.movies.insert_one(movie.dict())
-            
-            content_responses.append(ContentResponse(
-                id=movie.id,
-                tmdb_id=movie.tmdb_id,
-                title=movie.title,
-                overview=movie.overview,
-                poster_path=movie.poster_path,
-                backdrop_path=movie.backdrop_path,
-                release_date=movie.release_date,
-                runtime=movie.runtime,
-                vote_average=movie.vote_average,
-                popularity=movie.popularity,
-                genres=movie.genres,
-                videos=movie.videos,
-                maturity_rating=movie.maturity_rating,
-                content_type=ContentType.MOVIE
-            ))
-        
-        # Process TV shows
-        for tv_show in trending["tv_shows"]:
-            existing = await db.database.tv_shows.find_one({"tmdb_id": tv_show.tmdb_id})
-            if not existing:
-                await db.database.tv_shows.insert_one(tv_show.dict())
-            
-            content_responses.append(ContentResponse(
-                id=tv_show.id,
-                tmdb_id=tv_show.tmdb_id,
-                title=tv_show.name,
-                overview=tv_show.overview,
-                poster_path=tv_show.poster_path,
-                backdrop_path=tv_show.backdrop_path,
-                release_date=tv_show.first_air_date,
-                runtime=None,
-                vote_average=tv_show.vote_average,
-                popularity=tv_show.popularity,
-                genres=tv_show.genres,
-                videos=tv_show.videos,
-                maturity_rating=tv_show.maturity_rating,
-                content_type=ContentType.TV_SHOW
-            ))
-        
-        return content_responses
+        return await snapshot_response(request, [trending_snapshot("week")], trending_json)
     except Exception as e:
         logger.error(f"Error fetching trending content: {str(e)}")
         raise HTTPException(status_code=500, detail="Error fetching trending content")
 
+@api_router.get("/catalog/{content_type}", response_model=List[ContentResponse])
+async def browse_catalog(
+    request: Request,
+    content_type: ContentType,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    current_user: UserInDB = Depends(get_current_active_user)
+):
+    """Browse stored titles by popularity; the next page's cursor is sent in X-Next-Cursor"""
+    try:
+        fragments, next_cursor = await catalog.browse_json(content_type, limit, cursor)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error browsing catalog: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error browsing catalog")
+    
+    body = stitch_json_list(fragments)
+    etag = make_etag(body, next_cursor or "")
+    response = not_modified_response(request, etag, SHARED_CACHE_CONTROL) or json_response(
+        body, etag, SHARED_CACHE_CONTROL
+    )
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return response
+
 @api_router.get("/content/search", response_model=SearchResult)
 async def search_content(
+    request: Request,
     q: str = Query(..., min_length=1),
     page: int = Query(1, ge=1, le=10),
     current_user: UserInDB = Depends(get_current_active_user)
 ):
-    """Search for movies and TV shows"""
+    """Search for movies and TV shows in the catalog, then TMDB"""
     try:
-        search_results = await tmdb_service.search_content(q, page)
-        
-        # Save new content to database
-        for movie in search_results["movies"]:
-            existing = await db.database.movies.find_one({"tmdb_id": movie.tmdb_id})
-            if not existing:
-                await db.database.movies.insert_one(movie.dict())
-        
-        for tv_show in search_results["tv_shows"]:
-            existing = await db.database.tv_shows.find_one({"tmdb_id": tv_show.tmdb_id})
-            if not existing:
-                await db.database.tv_shows.insert_one(tv_show.dict())
+        # Answer from the result cache or the catalog's text indexes, falling back to TMDB on a miss
+        search_results = await catalog_search.search(q, page)
         
-        return SearchResult(
+        body = SearchResult(
             movies=search_results["movies"],
             tv_shows=search_results["tv_shows"],
             total_results=search_results["total_results"]
+        ).model_dump_json().encode()
+        
+        # Search results have no snapshot version, so validate against the body itself
+        etag = make_etag(body)
+        return not_modified_response(request, etag, SHARED_CACHE_CONTROL) or json_response(
+            body, etag, SHARED_CACHE_CONTROL
         )
     except Exception as e:
         logger.error(f"Error searching content: {str(e)}")
         raise HTTPException(status_code=500, detail="Error searching content")
 
+@api_router.get("/content/suggest", response_model=List[Suggestion])
+async def suggest_content(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(8, ge=1, le=20),
+    current_user: UserInDB = Depends(get_current_active_user)
+):
+    """Suggest titles for a partial query from the in-memory index"""
+    return suggest_index.suggest(q, limit)
+
+@api_router.get("/content/{content_id}/similar", response_model=List[ContentResponse])
+async def get_similar_content(
+    request: Request,
+    content_id: str,
+    limit: int = Query(12, ge=1, le=50),
+    current_user: UserInDB = Depends(get_current_active_user)
+):
+    """Get titles similar to a catalog title from the precomputed neighbour table"""
+    if not similar_titles.ready:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Similar titles are still being computed",
+            headers={"Retry-After": "30"}
+        )
+    refs = similar_titles.similar(content_id, limit)
+    if refs is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Content not found")
+    
+    body = stitch_json_list(await catalog.load_card_json(refs))
+    etag = make_etag(body)
+    return not_modified_response(request, etag, SHARED_CACHE_CONTROL) or json_response(
+        body, etag, SHARED_CACHE_CONTROL
+    )
+
 # Watchlist endpoints
 @api_router.post("/watchlist/{profile_id}")
 async def add_to_watchlist(
     profile_id: str,
     item: WatchlistCreate,
-    current_user: UserInDB = Depends(get_current_active_user)
+    claims: TokenClaims = Depends(get_active_token_claims)
 ):
     """Add content to profile's watchlist"""
     # Verify profile access
-    profile = await require_profile_access(profile_id, current_user)
+    require_profile_claims(profile_id, claims)
     
     # Check if already in watchlist
     existing = await db.database.watchlist.find_one({
@@ -396,6 +472,8 @@ async def add_to_watchlist(
     )
     
     await db.database.watchlist.insert_one(watchlist_item.dict())
+    await watchlist_changed(profile_id)
+    co_watch.watchlist_added(profile_id, item.content_id, item.content_type)
     
     return {"message": "Added to watchlist successfully"}
 
@@ -403,11 +481,11 @@ async def add_to_watchlist(
 async def remove_from_watchlist(
     profile_id: str,
     content_id: str,
-    current_user: UserInDB = Depends(get_current_active_user)
+    claims: TokenClaims = Depends(get_active_token_claims)
 ):
     """Remove content from profile's watchlist"""
     # Verify profile access
-    profile = await require_profile_access(profile_id, current_user)
+    require_profile_claims(profile_id, claims)
     
     # Remove from watchlist
     result = await db.database.watchlist.delete_one({
@@ -420,66 +498,133 @@ async def remove_from_watchlist(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Item not found in watchlist"
         )
+    await watchlist_changed(profile_id)
+    co_watch.watchlist_removed(profile_id, content_id)
     
     return {"message": "Removed from watchlist successfully"}
 
 @api_router.get("/watchlist/{profile_id}", response_model=List[ContentResponse])
 async def get_watchlist(
+    request: Request,
     profile_id: str,
-    current_user: UserInDB = Depends(get_current_active_user)
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    claims: TokenClaims = Depends(get_active_token_claims)
+):
+    """Get a page of the profile's watchlist; the next page's cursor is sent in X-Next-Cursor"""
+    # Verify profile access
+    require_profile_claims(profile_id, claims)
+    
+    # Cards change with the catalog as well as with the watchlist itself
+    state, titles = await asyncio.gather(watchlist_version(profile_id), catalog.version())
+    etag = make_etag("watchlist", profile_id, state["version"], titles["version"], limit, cursor or "")
+    modified = last_modified(state, titles)
+    not_modified = not_modified_response(request, etag, PRIVATE_CACHE_CONTROL, modified)
+    if not_modified:
+        return not_modified
+    
+    body, next_cursor = await watchlist_page(profile_id, limit, cursor)
+    response = json_response(body, etag, PRIVATE_CACHE_CONTROL, modified)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return response
+
+# Viewing history endpoints
+@api_router.post("/history/{profile_id}", status_code=status.HTTP_202_ACCEPTED)
+async def record_progress(
+    profile_id: str,
+    heartbeat: ViewingHistoryCreate,
+    claims: TokenClaims = Depends(get_active_token_claims)
+):
+    """Record a playback progress heartbeat; it is written to viewing history in the background"""
+    # Verify profile access
+    require_profile_claims(profile_id, claims)
+    
+    history_buffer.record(profile_id, heartbeat)
+    return {"message": "Progress recorded"}
+
+@api_router.get("/history/{profile_id}/continue-watching", response_model=List[ContinueWatchingItem])
+async def get_continue_watching(
+    request: Request,
+    profile_id: str,
+    limit: int = Query(20, ge=1, le=50),
+    claims: TokenClaims = Depends(get_active_token_claims)
 ):
-    """Get profile's watchlist"""
+    """Get the profile's unfinished titles, most recently watched first"""
     # Verify profile access
-    profile = await require_profile_access(profile_id, current_user)
+    require_profile_claims(profile_id, claims)
     
-    # Get watchlist items
-    watchlist_items = await db.database.watchlist.find({"profile_id": profile_id}).to_list(1000)
+    body = await continue_watching_json(profile_id, limit)
+    etag = make_etag(body)
+    return not_modified_response(request, etag, PRIVATE_CACHE_CONTROL) or json_response(
+        body, etag, PRIVATE_CACHE_CONTROL
+    )
+
+@api_router.get("/history/{profile_id}/{content_id}/resume", response_model=ResumePosition)
+async def get_resume_position(
+    profile_id: str,
+    content_id: str,
+    claims: TokenClaims = Depends(get_active_token_claims)
+):
+    """Get where the profile left off in a title"""
+    # Verify profile access
+    require_profile_claims(profile_id, claims)
     
-    content_responses = []
+    position = await resume_position(profile_id, content_id)
+    if position is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No progress recorded for this title"
+        )
+    return position
+
+# Recommendation endpoints
+@api_router.get("/recommendations/{profile_id}", response_model=List[RecommendationRow])
+async def get_recommendations(
+    request: Request,
+    profile_id: str,
+    claims: TokenClaims = Depends(get_active_token_claims)
+):
+    """Get the profile's "Because you added X" rows"""
+    # Verify profile access
+    require_profile_claims(profile_id, claims)
+    
+    body = await recommendations_json(profile_id)
+    etag = make_etag(body)
+    return not_modified_response(request, etag, PRIVATE_CACHE_CONTROL) or json_response(
+        body, etag, PRIVATE_CACHE_CONTROL
+    )
+
+# Home feed endpoint
+@api_router.get("/home/{profile_id}", response_model=HomeFeedResponse)
+async def get_home_feed(
+    request: Request,
+    profile_id: str,
+    claims: TokenClaims = Depends(get_active_token_claims)
+):
+    """Get every home page row for a profile in one response"""
+    # Verify profile access
+    require_profile_claims(profile_id, claims)
     
-    for item in watchlist_items:
-        if item["content_type"] == ContentType.MOVIE:
-            content = await db.database.movies.find_one({"id": item["content_id"]})
-            if content:
-                movie = Movie(**content)
-                content_responses.append(ContentResponse(
-                    id=movie.id,
-                    tmdb_id=movie.tmdb_id,
-                    title=movie.title,
-                    overview=movie.overview,
-                    poster_path=movie.poster_path,
-                    backdrop_path=movie.backdrop_path,
-                    release_date=movie.release_date,
-                    runtime=movie.runtime,
-                    vote_average=movie.vote_average,
-                    popularity=movie.popularity,
-                    genres=movie.genres,
-                    videos=movie.videos,
-                    maturity_rating=movie.maturity_rating,
-                    content_type=ContentType.MOVIE
-                ))
-        else:  # TV Show
-            content = await db.database.tv_shows.find_one({"id": item["content_id"]})
-            if content:
-                tv_show = TVShow(**content)
-                content_responses.append(ContentResponse(
-                    id=tv_show.id,
-                    tmdb_id=tv_show.tmdb_id,
-                    title=tv_show.name,
-                    overview=tv_show.overview,
-                    poster_path=tv_show.poster_path,
-                    backdrop_path=tv_show.backdrop_path,
-                    release_date=tv_show.first_air_date,
-                    runtime=None,
-                    vote_average=tv_show.vote_average,
-                    popularity=tv_show.popularity,
-                    genres=tv_show.genres,
-                    videos=tv_show.videos,
-                    maturity_rating=tv_show.maturity_rating,
-                    content_type=ContentType.TV_SHOW
-                ))
+    validators, state = await asyncio.gather(
+        snapshot_validators(home_feed.snapshot_names()),
+        watchlist_version(profile_id)
+    )
+    etag = None
+    if validators:
+        # The snapshot validators already carry the catalog's titles version
+        etag = make_etag(validators[0], profile_id, state["version"])
+        not_modified = not_modified_response(request, etag, PRIVATE_CACHE_CONTROL)
+        if not_modified:
+            return not_modified
     
-    return content_responses
+    body, complete = await home_feed.render(profile_id, etag)
+    if etag is None or not complete:
+        # Without version validators, or with a row missing, the ETag must follow the body
+        etag = make_etag(body)
+    return not_modified_response(request, etag, PRIVATE_CACHE_CONTROL) or json_response(
+        body, etag, PRIVATE_CACHE_CONTROL
+    )
 
 # Include router in main app
 app.include_router(api_router)
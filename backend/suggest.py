@@ -0,0 +1,262 @@
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from itertools import islice
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
+import heapq
+import os
+import re
+import time
+import unicodedata
+import logging
+
+from models import Movie, TVShow, ContentType
+from database import db
+
+logger = logging.getLogger(__name__)
+
+_NON_WORD = re.compile(r"[^\w]+")
+
+
+def normalize_title(text: str) -> str:
+    """Case-fold, strip accents and punctuation, and collapse whitespace"""
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return " ".join(_NON_WORD.sub(" ", stripped.casefold()).split())
+
+
+def _trigram_counts(text: str) -> Counter:
+    padded = f"  {text} "
+    return Counter(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def _trigrams(text: str) -> Set[str]:
+    return set(_trigram_counts(text))
+
+
+def _prefix_distance(query: str, text: str, max_distance: int) -> Optional[int]:
+    """Levenshtein distance from query to the closest of text's prefixes one character
+    shorter, as long, or one longer than query, if it is at most max_distance"""
+    target = text[:len(query) + 1]
+    ends = {min(len(target), len(query) + delta) for delta in (-1, 0, 1) if len(query) + delta > 0}
+    previous = list(range(len(target) + 1))
+    for i, char_a in enumerate(query, 1):
+        current = [i]
+        for j, char_b in enumerate(target, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > max_distance:
+            return None
+        previous = current
+    distance = min(previous[end] for end in ends)
+    return distance if distance <= max_distance else None
+
+
+class SuggestIndex:
+    """In-memory prefix and trigram index over catalog titles for search-as-you-type
+
+    Every query token must prefix a title token; when that yields too few
+    titles, trigram candidates are checked for a small edit distance
+    against the start of the title or of any title word. Candidates are
+    bounded per posting list and by shared trigram count, so a fuzzy lookup
+    never scans most of the catalog.
+    """
+
+    def __init__(self):
+        self.max_typos = int(os.getenv("SUGGEST_MAX_TYPOS", "2"))
+        self.short_prefix = int(os.getenv("SUGGEST_SHORT_PREFIX", "2"))
+        self.max_posting_candidates = int(os.getenv("SUGGEST_MAX_POSTING_CANDIDATES", "1000"))
+        self.max_fuzzy_checks = int(os.getenv("SUGGEST_MAX_FUZZY_CHECKS", "200"))
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._titles: Dict[str, str] = {}
+        # Appended unsorted and sorted once before the next lookup, so bulk loads stay O(n log n)
+        self._tokens: List[Tuple[str, str]] = []
+        self._tokens_sorted = True
+        self._trigrams: Dict[str, Set[str]] = defaultdict(set)
+        # One or two letters match a large slice of the catalog, so their rankings
+        # are memoized until the next change to the index
+        self._short_results: Dict[Tuple[str, int], List[str]] = {}
+        self.lookups = 0
+        self.fuzzy_lookups = 0
+        self.lookup_seconds = 0.0
+
+    def add(
+        self,
+        entry_id: str,
+        tmdb_id: int,
+        title: str,
+        content_type: ContentType,
+        popularity: float,
+        poster_path: Optional[str],
+        date: Optional[str]
+    ):
+        """Index a title, replacing any previous entry for it"""
+        normalized = normalize_title(title)
+        if entry_id in self._entries:
+            if self._titles[entry_id] == normalized:
+                entry = self._entries[entry_id]
+                if entry["popularity"] != popularity:
+                    self._short_results.clear()
+                entry.update(popularity=popularity, poster_path=poster_path)
+                return
+            self.remove(entry_id)
+        if not normalized:
+            return
+        self._short_results.clear()
+
+        self._entries[entry_id] = {
+            "id": entry_id,
+            "tmdb_id": tmdb_id,
+            "title": title,
+            "content_type": content_type.value,
+            "popularity": popularity,
+            "poster_path": poster_path,
+            "year": date[:4] if date else None,
+        }
+        self._titles[entry_id] = normalized
+        self._tokens.extend((token, entry_id) for token in set(normalized.split()))
+        self._tokens_sorted = False
+        for gram in _trigrams(normalized):
+            self._trigrams[gram].add(entry_id)
+
+    def add_titles(self, titles: List[Union[Movie, TVShow]]):
+        """Index titles as the catalog upserts them"""
+        for title in titles:
+            is_movie = title.content_type == ContentType.MOVIE
+            self.add(
+                title.id,
+                title.tmdb_id,
+                title.title if is_movie else title.name,
+                title.content_type,
+                title.popularity,
+                title.poster_path,
+                title.release_date if is_movie else title.first_air_date
+            )
+
+    def remove(self, entry_id: str):
+        """Drop a title from the index"""
+        normalized = self._titles.pop(entry_id, None)
+        self._entries.pop(entry_id, None)
+        if normalized is None:
+            return
+        self._short_results.clear()
+        self._sort_tokens()
+        for token in set(normalized.split()):
+            position = bisect_left(self._tokens, (token, entry_id))
+            if position < len(self._tokens) and self._tokens[position] == (token, entry_id):
+                del self._tokens[position]
+        for gram in _trigrams(normalized):
+            ids = self._trigrams.get(gram)
+            if ids is not None:
+                ids.discard(entry_id)
+                if not ids:
+                    del self._trigrams[gram]
+
+    async def load(self):
+        """Build the index from the catalog collections"""
+        if db.database is None:
+            return
+
+        started = time.monotonic()
+        sources = [
+            (ContentType.MOVIE, db.database.movies, "title", "release_date"),
+            (ContentType.TV_SHOW, db.database.tv_shows, "name", "first_air_date"),
+        ]
+        for content_type, collection, title_field, date_field in sources:
+            projection = {"_id": 0, "id": 1, "tmdb_id": 1, title_field: 1, "popularity": 1, "poster_path": 1, date_field: 1}
+            async for doc in collection.find({}, projection):
+                if doc.get(title_field):
+                    self.add(
+                        doc["id"], doc["tmdb_id"], doc[title_field], content_type,
+                        doc.get("popularity", 0.0), doc.get("poster_path"), doc.get(date_field)
+                    )
+        self._sort_tokens()
+        logger.info(f"Loaded {len(self._entries)} titles into the suggest index in {time.monotonic() - started:.2f}s")
+
+    def _sort_tokens(self):
+        if not self._tokens_sorted:
+            self._tokens.sort()
+            self._tokens_sorted = True
+
+    def _prefix_ids(self, prefix: str) -> Set[str]:
+        self._sort_tokens()
+        start = bisect_left(self._tokens, (prefix, ""))
+        end = bisect_left(self._tokens, (prefix + "\U0010ffff", ""), start)
+        return {entry_id for _, entry_id in self._tokens[start:end]}
+
+    def _typo_budget(self, query: str) -> int:
+        if len(query) < 5:
+            return 0
+        return min(self.max_typos, 1 if len(query) < 9 else 2)
+
+    def _fuzzy(self, query: str, exclude: Set[str], limit: int) -> List[str]:
+        budget = self._typo_budget(query)
+        if budget == 0:
+            return []
+
+        counts = _trigram_counts(query)
+        postings = sorted((self._trigrams.get(gram, set()) for gram in counts), key=len)
+        # Each edit breaks at most three trigram positions, counting repeats, so closer titles
+        # keep this many; repeated-letter queries have few distinct trigrams, so cap it there
+        needed = min(len(postings), max(1, sum(counts.values()) - 3 * budget))
+        # Any such title is in one of the rarest len - needed + 1 posting sets, and common
+        # trigrams only contribute a bounded slice so one query never scans most of the catalog
+        candidates = set().union(*(
+            islice(ids, self.max_posting_candidates) for ids in postings[:len(postings) - needed + 1]
+        ))
+
+        # Only the candidates sharing the most trigrams get the edit distance check
+        shared = [(sum(entry_id in ids for ids in postings), entry_id) for entry_id in candidates - exclude]
+        shared = heapq.nlargest(self.max_fuzzy_checks, (item for item in shared if item[0] >= needed))
+
+        matches = []
+        for _, entry_id in shared:
+            words = self._titles[entry_id].split()
+            distances = [
+                _prefix_distance(query, " ".join(words[i:]), budget) for i in range(len(words))
+            ]
+            distances = [distance for distance in distances if distance is not None]
+            if distances:
+                matches.append((min(distances), -self._entries[entry_id]["popularity"], entry_id))
+
+        return [entry_id for _, _, entry_id in heapq.nsmallest(limit, matches)]
+
+    def suggest(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Suggest titles for a partial query, most popular first"""
+        started = time.perf_counter()
+        normalized = normalize_title(query)
+        if not normalized:
+            return []
+
+        ranked = self._short_results.get((normalized, limit))
+        if ranked is None:
+            tokens = normalized.split()
+            candidates = self._prefix_ids(tokens[0])
+            for token in tokens[1:]:
+                if not candidates:
+                    break
+                candidates &= self._prefix_ids(token)
+
+            ranked = heapq.nlargest(limit, candidates, key=lambda entry_id: self._entries[entry_id]["popularity"])
+            if len(ranked) < limit:
+                self.fuzzy_lookups += 1
+                ranked += self._fuzzy(normalized, set(ranked), limit - len(ranked))
+            if len(normalized) <= self.short_prefix:
+                self._short_results[(normalized, limit)] = ranked
+
+        self.lookups += 1
+        self.lookup_seconds += time.perf_counter() - started
+        return [self._entries[entry_id] for entry_id in ranked]
+
+    def stats(self) -> Dict[str, Any]:
+        """Return index size and lookup counters"""
+        return {
+            "titles": len(self._entries),
+            "tokens": len(self._tokens),
+            "trigrams": len(self._trigrams),
+            "lookups": self.lookups,
+            "fuzzy_lookups": self.fuzzy_lookups,
+            "avg_lookup_ms": round(self.lookup_seconds / self.lookups * 1000, 3) if self.lookups else 0.0,
+        }
+
+
+# Create global suggest index instance
+suggest_index = SuggestIndex()
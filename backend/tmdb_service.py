@@ -1,12 +1,34 @@
 import httpx
 import os
-from typing import List, Optional, Dict, Any
-from models import Movie, TVShow, Genre, ProductionCompany, SpokenLanguage, Video, ContentType, MaturityRating
+from typing import List, Optional, Dict, Any, Tuple, Union
+from cache import TMDBResponseCache
+from rate_governor import RateGovernor
+from singleflight import SingleFlight
+from models import Movie, TVShow, Genre, ProductionCompany, SpokenLanguage, Video, ContentType, MaturityRating, content_id
 import asyncio
 import logging
+from contextvars import ContextVar
 
 logger = logging.getLogger(__name__)
 
+
+class UpstreamCallCounter:
+    """Counts TMDB calls made on behalf of a single API request"""
+
+    def __init__(self):
+        self.count = 0
+
+
+_upstream_calls: ContextVar[Optional[UpstreamCallCounter]] = ContextVar("tmdb_upstream_calls", default=None)
+
+
+def track_upstream_calls() -> UpstreamCallCounter:
+    """Start counting TMDB calls for the current request context"""
+    counter = UpstreamCallCounter()
+    _upstream_calls.set(counter)
+    return counter
+
+
 class TMDBService:
     def __init__(self):
         self.api_key = os.getenv("TMDB_API_KEY")
@@ -14,40 +36,234 @@ class TMDBService:
         self.base_url = "https://api.themoviedb.org/3"
         self.image_base_url = "https://image.tmdb.org/t/p/w500"
         self.backdrop_base_url = "https://image.tmdb.org/t/p/w1280"
-        self.current_key = self.api_key
-        
-    async def _make_request(self, endpoint: str, params: Dict[str, Any] = None) -> Optional[Dict[str, Any]]:
-        """Make a request to TMDB API with fallback to backup key"""
-        if params is None:
-            params = {}
-        
-        params["api_key"] = self.current_key
-        
-        async with httpx.AsyncClient() as client:
+
+        # Spread requests across every configured key with per-key token buckets
+        api_keys = [key.strip() for key in os.getenv("TMDB_API_KEYS", "").split(",")]
+        api_keys += [self.api_key, self.api_key_backup]
+        self.governor = RateGovernor(
+            keys=list(dict.fromkeys(key for key in api_keys if key)),
+            rate=float(os.getenv("TMDB_RATE_PER_KEY", "40")),
+            burst=float(os.getenv("TMDB_RATE_BURST", "40")),
+            max_wait=float(os.getenv("TMDB_RATE_MAX_WAIT", "10")),
+            backoff_base=float(os.getenv("TMDB_BACKOFF_BASE", "0.5")),
+            backoff_max=float(os.getenv("TMDB_BACKOFF_MAX", "30"))
+        )
+        self.max_retries = int(os.getenv("TMDB_MAX_RETRIES", "3"))
+
+        # Connection pool settings
+        self.http2 = os.getenv("TMDB_HTTP2", "false").lower() == "true"
+        self.max_connections = int(os.getenv("TMDB_MAX_CONNECTIONS", "50"))
+        self.max_keepalive_connections = int(os.getenv("TMDB_MAX_KEEPALIVE_CONNECTIONS", "20"))
+        self.keepalive_expiry = float(os.getenv("TMDB_KEEPALIVE_EXPIRY", "30"))
+        self.timeout = float(os.getenv("TMDB_TIMEOUT", "10"))
+        self.connect_timeout = float(os.getenv("TMDB_CONNECT_TIMEOUT", "5"))
+        self.pool_timeout = float(os.getenv("TMDB_POOL_TIMEOUT", "10"))
+
+        # Sub-resources fetched alongside title details via append_to_response
+        self.detail_append_to_response = [
+            part.strip() for part in os.getenv("TMDB_APPEND_TO_RESPONSE", "videos").split(",") if part.strip()
+        ]
+        if "videos" not in self.detail_append_to_response:
+            self.detail_append_to_response.insert(0, "videos")
+
+        # Maximum detail hydrations in flight per list page (1 keeps the old serial behaviour)
+        self.fanout_concurrency = max(1, int(os.getenv("TMDB_FANOUT_CONCURRENCY", "8")))
+
+        # Optional read-through store consulted before TMDB when hydrating list pages
+        self.title_source = None
+
+        self.client: Optional[httpx.AsyncClient] = None
+        self.cache = TMDBResponseCache()
+        self.inflight = SingleFlight()
+        self.requests_total = 0
+        self.requests_failed = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+        # Upstream calls attributed to API requests
+        self.tracked_requests = 0
+        self.tracked_upstream_calls = 0
+        self.max_upstream_calls_per_request = 0
+
+    def _create_client(self) -> httpx.AsyncClient:
+        """Create the shared HTTP client backing the connection pool"""
+        http2 = self.http2
+        if http2:
             try:
-                response = await client.get(f"{self.base_url}{endpoint}", params=params)
-                
-                if response.status_code == 429:  # Rate limit
-                    # Switch to backup key
-                    if self.current_key == self.api_key:
-                        self.current_key = self.api_key_backup
-                        params["api_key"] = self.current_key
-                        await asyncio.sleep(1)  # Brief delay
-                        response = await client.get(f"{self.base_url}{endpoint}", params=params)
-                    else:
-                        logger.warning("Rate limited on both API keys")
-                        return None
-                
-                if response.status_code == 200:
-                    return response.json()
-                else:
-                    logger.error(f"TMDB API error: {response.status_code} - {response.text}")
-                    return None
-                    
+                import h2  # noqa: F401
+            except ImportError:
+                logger.warning("TMDB_HTTP2 is enabled but the h2 package is not installed, using HTTP/1.1")
+                http2 = False
+
+        return httpx.AsyncClient(
+            base_url=self.base_url,
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive_connections,
+                keepalive_expiry=self.keepalive_expiry
+            ),
+            timeout=httpx.Timeout(
+                self.timeout,
+                connect=self.connect_timeout,
+                pool=self.pool_timeout
+            )
+        )
+
+    async def start(self):
+        """Open the shared HTTP client"""
+        if self.client is None or self.client.is_closed:
+            self.client = self._create_client()
+
+    async def close(self):
+        """Close the shared HTTP client and its pooled connections"""
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """Return the shared HTTP client, opening it lazily outside the app lifespan"""
+        if self.client is None or self.client.is_closed:
+            self.client = self._create_client()
+        return self.client
+
+    def get_pool_stats(self) -> Dict[str, Any]:
+        """Return connection pool usage for sizing under load"""
+        stats = {
+            "open": self.client is not None and not self.client.is_closed,
+            "http2": self.http2,
+            "max_connections": self.max_connections,
+            "max_keepalive_connections": self.max_keepalive_connections,
+            "requests_total": self.requests_total,
+            "requests_failed": self.requests_failed,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "connections": 0,
+            "active_connections": 0,
+            "idle_connections": 0,
+        }
+        # httpx does not expose pool internals publicly, so read them from the httpcore pool
+        pool = getattr(getattr(self.client, "_transport", None), "_pool", None)
+        connections = list(getattr(pool, "connections", []) or [])
+        stats["connections"] = len(connections)
+        for connection in connections:
+            if connection.is_idle():
+                stats["idle_connections"] += 1
+            else:
+                stats["active_connections"] += 1
+        return stats
+
+    def record_upstream_calls(self, counter: UpstreamCallCounter):
+        """Record how many TMDB calls a finished API request made"""
+        self.tracked_requests += 1
+        self.tracked_upstream_calls += counter.count
+        self.max_upstream_calls_per_request = max(self.max_upstream_calls_per_request, counter.count)
+
+    def get_upstream_call_stats(self) -> Dict[str, Any]:
+        """Return TMDB calls per API request"""
+        return {
+            "requests": self.tracked_requests,
+            "upstream_calls": self.tracked_upstream_calls,
+            "avg_per_request": (
+                round(self.tracked_upstream_calls / self.tracked_requests, 2) if self.tracked_requests else 0.0
+            ),
+            "max_per_request": self.max_upstream_calls_per_request,
+        }
+
+    async def _make_request(
+        self,
+        endpoint: str,
+        params: Dict[str, Any] = None,
+        use_cache: bool = True
+    ) -> Optional[Dict[str, Any]]:
+        """Make a cached request to TMDB API
+
+        With use_cache=False both cache tiers are skipped and TMDB is always
+        asked, and the fresh response replaces whatever was cached.
+        """
+        params = dict(params or {})
+        key = self.cache.make_key(endpoint, params)
+
+        if use_cache:
+            data = self.cache.get_local(key)
+            if data is not None:
+                return data
+
+        # Concurrent callers for the same endpoint and params share one load
+        inflight_key = key if use_cache else f"fresh:{key}"
+        return await self.inflight.do(inflight_key, lambda: self._load(key, endpoint, params, use_cache))
+
+    async def _load(
+        self,
+        key: str,
+        endpoint: str,
+        params: Dict[str, Any],
+        use_cache: bool = True
+    ) -> Optional[Dict[str, Any]]:
+        """Load a response from the shared cache tier or TMDB, caching what TMDB returns"""
+        if use_cache:
+            data = await self.cache.get_shared(key)
+            if data is not None:
+                return data
+
+        data = await self._fetch(endpoint, params)
+        if data is not None:
+            await self.cache.set(key, endpoint, data)
+        return data
+
+    async def _fetch(self, endpoint: str, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Make a request to TMDB API through the rate governor, retrying throttled and failed calls"""
+        client = self._get_client()
+        counter = _upstream_calls.get()
+
+        for attempt in range(self.max_retries + 1):
+            key = await self.governor.acquire()
+            if key is None:
+                logger.warning(f"TMDB rate budget exhausted for {endpoint}")
+                self.requests_failed += 1
+                return None
+
+            self.requests_total += 1
+            if counter is not None:
+                counter.count += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            try:
+                response = await client.get(endpoint, params={**params, "api_key": key})
             except Exception as e:
                 logger.error(f"Error making TMDB request: {str(e)}")
+                await asyncio.sleep(self.governor.backoff(attempt))
+                continue
+            finally:
+                self.in_flight -= 1
+
+            if response.status_code == 429:  # Rate limit
+                retry_after = self.governor.parse_retry_after(response.headers.get("Retry-After"))
+                delay = self.governor.throttle(key, retry_after, attempt)
+                logger.warning(f"TMDB rate limited, cooling key down for {delay:.2f}s")
+                continue
+
+            if response.status_code >= 500:
+                logger.warning(f"TMDB API error: {response.status_code}, retrying")
+                await asyncio.sleep(self.governor.backoff(attempt))
+                continue
+
+            if response.status_code == 200:
+                try:
+                    return response.json()
+                except Exception as e:
+                    logger.error(f"Error decoding TMDB response for {endpoint}: {str(e)}")
+                    self.requests_failed += 1
+                    return None
+            else:
+                logger.error(f"TMDB API error: {response.status_code} - {response.text}")
+                self.requests_failed += 1
                 return None
 
+        logger.error(f"Giving up on TMDB request for {endpoint} after {self.max_retries + 1} attempts")
+        self.requests_failed += 1
+        return None
+
     def _process_poster_path(self, poster_path: Optional[str]) -> Optional[str]:
         """Process poster path to full URL"""
         if poster_path:
@@ -60,6 +276,28 @@ class TMDBService:
             return f"{self.backdrop_base_url}{backdrop_path}"
         return None
 
+    def _detail_params(self) -> Dict[str, Any]:
+        """Build params that fold sub-resources into a single details request"""
+        if not self.detail_append_to_response:
+            return {}
+        return {"append_to_response": ",".join(self.detail_append_to_response)}
+
+    def _process_videos(self, videos_data: Optional[Dict[str, Any]]) -> List[Video]:
+        """Process an appended videos payload into YouTube videos"""
+        videos = []
+        if videos_data and "results" in videos_data:
+            for video_data in videos_data["results"]:
+                if video_data.get("site") == "YouTube":
+                    videos.append(Video(
+                        id=video_data["id"],
+                        key=video_data["key"],
+                        name=video_data["name"],
+                        site=video_data["site"],
+                        type=video_data["type"],
+                        official=video_data.get("official", False)
+                    ))
+        return videos
+
     def _get_maturity_rating(self, adult: bool, vote_average: float) -> MaturityRating:
         """Determine maturity rating based on content"""
         if adult:
@@ -71,48 +309,67 @@ class TMDBService:
         else:
             return MaturityRating.G
 
+    def set_title_source(self, source):
+        """Serve list hydration from a read-through store before falling back to TMDB"""
+        self.title_source = source
+
+    async def _hydrate_titles(self, items: List[Tuple[ContentType, int]]) -> List[Optional[Union[Movie, TVShow]]]:
+        """Hydrate (content_type, tmdb_id) pairs concurrently, keeping input order"""
+        stored = {}
+        if self.title_source is not None:
+            try:
+                stored = await self.title_source.load_titles(items)
+            except Exception as e:
+                logger.error(f"Error loading stored titles: {str(e)}")
+
+        semaphore = asyncio.Semaphore(self.fanout_concurrency)
+
+        async def hydrate(content_type: ContentType, tmdb_id: int) -> Optional[Union[Movie, TVShow]]:
+            async with semaphore:
+                try:
+                    if content_type == ContentType.MOVIE:
+                        return await self.get_movie_details(tmdb_id)
+                    return await self.get_tv_show_details(tmdb_id)
+                except Exception as e:
+                    logger.error(f"Error processing {content_type.value} {tmdb_id}: {str(e)}")
+                    return None
+
+        missing = [item for item in dict.fromkeys(items) if item not in stored]
+        fetched = await asyncio.gather(*(hydrate(content_type, tmdb_id) for content_type, tmdb_id in missing))
+
+        if self.title_source is not None:
+            await self.title_source.store_titles([title for title in fetched if title])
+
+        titles = dict(stored)
+        titles.update(zip(missing, fetched))
+        return [titles.get(item) for item in items]
+
     async def get_popular_movies(self, page: int = 1) -> List[Movie]:
         """Get popular movies from TMDB"""
         data = await self._make_request("/movie/popular", {"page": page})
         if not data or "results" not in data:
             return []
 
-        movies = []
-        for movie_data in data["results"]:
-            try:
-                # Get detailed movie information including videos
-                detailed_movie = await self.get_movie_details(movie_data["id"])
-                if detailed_movie:
-                    movies.append(detailed_movie)
-            except Exception as e:
-                logger.error(f"Error processing movie {movie_data.get('id')}: {str(e)}")
-                
-        return movies
+        # Get detailed movie information including videos
+        movies = await self._hydrate_titles([
+            (ContentType.MOVIE, movie_data["id"]) for movie_data in data["results"] if "id" in movie_data
+        ])
+        return [movie for movie in movies if movie]
 
-    async def get_movie_details(self, tmdb_id: int) -> Optional[Movie]:
+    async def get_movie_details(self, tmdb_id: int, use_cache: bool = True) -> Optional[Movie]:
         """Get detailed movie information"""
-        # Get movie details
-        movie_data = await self._make_request(f"/movie/{tmdb_id}")
+        # Get movie details with videos and other sub-resources in one request
+        movie_data = await self._make_request(f"/movie/{tmdb_id}", self._detail_params(), use_cache)
         if not movie_data:
             return None
 
-        # Get movie videos
-        videos_data = await self._make_request(f"/movie/{tmdb_id}/videos")
-        videos = []
-        if videos_data and "results" in videos_data:
-            for video_data in videos_data["results"]:
-                if video_data.get("site") == "YouTube":
-                    videos.append(Video(
-                        id=video_data["id"],
-                        key=video_data["key"],
-                        name=video_data["name"],
-                        site=video_data["site"],
-                        type=video_data["type"],
-                        official=video_data.get("official", False)
-                    ))
+        return self._build_movie(movie_data)
 
+    def _build_movie(self, movie_data: Dict[str, Any]) -> Optional[Movie]:
+        """Build a Movie from a combined TMDB details payload"""
         try:
             movie = Movie(
+                id=content_id(ContentType.MOVIE, movie_data["id"]),
                 tmdb_id=movie_data["id"],
                 title=movie_data["title"],
                 overview=movie_data["overview"],
@@ -138,7 +395,7 @@ class TMDBService:
                     SpokenLanguage(iso_639_1=sl["iso_639_1"], name=sl["name"])
                     for sl in movie_data.get("spoken_languages", [])
                 ],
-                videos=videos,
+                videos=self._process_videos(movie_data.get("videos")),
                 maturity_rating=self._get_maturity_rating(
                     movie_data.get("adult", False),
                     movie_data.get("vote_average", 0.0)
@@ -155,42 +412,26 @@ class TMDBService:
         if not data or "results" not in data:
             return []
 
-        tv_shows = []
-        for tv_data in data["results"]:
-            try:
-                # Get detailed TV show information
-                detailed_tv = await self.get_tv_show_details(tv_data["id"])
-                if detailed_tv:
-                    tv_shows.append(detailed_tv)
-            except Exception as e:
-                logger.error(f"Error processing TV show {tv_data.get('id')}: {str(e)}")
-                
-        return tv_shows
+        # Get detailed TV show information
+        tv_shows = await self._hydrate_titles([
+            (ContentType.TV_SHOW, tv_data["id"]) for tv_data in data["results"] if "id" in tv_data
+        ])
+        return [tv_show for tv_show in tv_shows if tv_show]
 
-    async def get_tv_show_details(self, tmdb_id: int) -> Optional[TVShow]:
+    async def get_tv_show_details(self, tmdb_id: int, use_cache: bool = True) -> Optional[TVShow]:
         """Get detailed TV show information"""
-        # Get TV show details
-        tv_data = await self._make_request(f"/tv/{tmdb_id}")
+        # Get TV show details with videos and other sub-resources in one request
+        tv_data = await self._make_request(f"/tv/{tmdb_id}", self._detail_params(), use_cache)
         if not tv_data:
             return None
 
-        # Get TV show videos
-        videos_data = await self._make_request(f"/tv/{tmdb_id}/videos")
-        videos = []
-        if videos_data and "results" in videos_data:
-            for video_data in videos_data["results"]:
-                if video_data.get("site") == "YouTube":
-                    videos.append(Video(
-                        id=video_data["id"],
-                        key=video_data["key"],
-                        name=video_data["name"],
-                        site=video_data["site"],
-                        type=video_data["type"],
-                        official=video_data.get("official", False)
-                    ))
+        return self._build_tv_show(tv_data)
 
+    def _build_tv_show(self, tv_data: Dict[str, Any]) -> Optional[TVShow]:
+        """Build a TVShow from a combined TMDB details payload"""
         try:
             tv_show = TVShow(
+                id=content_id(ContentType.TV_SHOW, tv_data["id"]),
                 tmdb_id=tv_data["id"],
                 name=tv_data["name"],
                 overview=tv_data["overview"],
@@ -217,7 +458,7 @@ class TMDBService:
                     SpokenLanguage(iso_639_1=sl["iso_639_1"], name=sl["name"])
                     for sl in tv_data.get("spoken_languages", [])
                 ],
-                videos=videos,
+                videos=self._process_videos(tv_data.get("videos")),
                 maturity_rating=self._get_maturity_rating(
                     False,  # TV shows don't have adult flag
                     tv_data.get("vote_average", 0.0)
@@ -230,25 +471,21 @@ class TMDBService:
 
     async def search_content(self, query: str, page: int = 1) -> Dict[str, Any]:
         """Search for movies and TV shows"""
-        # Search movies
-        movie_data = await self._make_request("/search/movie", {"query": query, "page": page})
-        # Search TV shows
-        tv_data = await self._make_request("/search/tv", {"query": query, "page": page})
-
-        movies = []
-        tv_shows = []
+        # Search movies and TV shows
+        movie_data, tv_data = await asyncio.gather(
+            self._make_request("/search/movie", {"query": query, "page": page}),
+            self._make_request("/search/tv", {"query": query, "page": page})
+        )
 
+        items = []
         if movie_data and "results" in movie_data:
-            for movie in movie_data["results"][:10]:  # Limit to 10 results
-                detailed_movie = await self.get_movie_details(movie["id"])
-                if detailed_movie:
-                    movies.append(detailed_movie)
-
+            items.extend((ContentType.MOVIE, movie["id"]) for movie in movie_data["results"][:10] if "id" in movie)  # Limit to 10 results
         if tv_data and "results" in tv_data:
-            for tv in tv_data["results"][:10]:  # Limit to 10 results
-                detailed_tv = await self.get_tv_show_details(tv["id"])
-                if detailed_tv:
-                    tv_shows.append(detailed_tv)
+            items.extend((ContentType.TV_SHOW, tv["id"]) for tv in tv_data["results"][:10] if "id" in tv)  # Limit to 10 results
+
+        titles = await self._hydrate_titles(items)
+        movies = [title for title in titles if isinstance(title, Movie)]
+        tv_shows = [title for title in titles if isinstance(title, TVShow)]
 
         return {
             "movies": movies,
@@ -262,21 +499,18 @@ class TMDBService:
         if not data or "results" not in data:
             return {"movies": [], "tv_shows": []}
 
-        movies = []
-        tv_shows = []
-
+        items = []
         for item in data["results"]:
-            try:
-                if item.get("media_type") == "movie":
-                    movie = await self.get_movie_details(item["id"])
-                    if movie:
-                        movies.append(movie)
-                elif item.get("media_type") == "tv":
-                    tv_show = await self.get_tv_show_details(item["id"])
-                    if tv_show:
-                        tv_shows.append(tv_show)
-            except Exception as e:
-                logger.error(f"Error processing trending item: {str(e)}")
+            if "id" not in item:
+                continue
+            if item.get("media_type") == "movie":
+                items.append((ContentType.MOVIE, item["id"]))
+            elif item.get("media_type") == "tv":
+                items.append((ContentType.TV_SHOW, item["id"]))
+
+        titles = await self._hydrate_titles(items)
+        movies = [title for title in titles if isinstance(title, Movie)]
+        tv_shows = [title for title in titles if isinstance(title, TVShow)]
 
         return {"movies": movies, "tv_shows": tv_shows}
 
@@ -291,16 +525,10 @@ class TMDBService:
         if not data or "results" not in data:
             return []
 
-        movies = []
-        for movie_data in data["results"]:
-            try:
-                movie = await self.get_movie_details(movie_data["id"])
-                if movie:
-                    movies.append(movie)
-            except Exception as e:
-                logger.error(f"Error processing genre movie: {str(e)}")
-
-        return movies
+        movies = await self._hydrate_titles([
+            (ContentType.MOVIE, movie_data["id"]) for movie_data in data["results"] if "id" in movie_data
+        ])
+        return [movie for movie in movies if movie]
 
 # Create global TMDB service instance
 tmdb_service = TMDBService()
\ No newline at end of file
@@ -0,0 +1,82 @@
+"""Benchmark serialization CPU for a home page of content cards.
+
+Compares the previous path (build ContentResponse models, re-validate them
+against List[ContentResponse] and encode to JSON the way FastAPI does) with
+stitching pre-serialized cards from the card cache.
+
+Usage: python benchmarks/bench_card_serialization.py [cards] [iterations]
+"""
+import json
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from pydantic import TypeAdapter
+
+from models import Movie, Genre, Video, ContentResponse, ContentType, MaturityRating, content_id
+from cards import CardCache, card_from_title
+
+
+def make_titles(count: int) -> List[Movie]:
+    return [
+        Movie(
+            id=content_id(ContentType.MOVIE, tmdb_id),
+            tmdb_id=tmdb_id,
+            title=f"Movie {tmdb_id}",
+            overview="A long enough overview to look like a real TMDB synopsis. " * 4,
+            poster_path=f"https://image.tmdb.org/t/p/w500/poster{tmdb_id}.jpg",
+            backdrop_path=f"https://image.tmdb.org/t/p/w1280/backdrop{tmdb_id}.jpg",
+            release_date="2024-05-01",
+            runtime=120,
+            vote_average=7.4,
+            popularity=1234.5,
+            original_language="en",
+            original_title=f"Movie {tmdb_id}",
+            genres=[Genre(id=28, name="Action"), Genre(id=12, name="Adventure"), Genre(id=878, name="Science Fiction")],
+            videos=[
+                Video(id=f"v{tmdb_id}{n}", key=f"key{n}", name=f"Trailer {n}", site="YouTube", type="Trailer")
+                for n in range(3)
+            ],
+            maturity_rating=MaturityRating.PG13
+        )
+        for tmdb_id in range(1, count + 1)
+    ]
+
+
+def previous_path(titles: List[Movie], adapter: TypeAdapter) -> bytes:
+    cards = [card_from_title(title) for title in titles]
+    validated = adapter.validate_python(cards, from_attributes=True)
+    content = adapter.dump_python(validated, mode="json")
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode()
+
+
+def measure(label: str, fn, iterations: int) -> float:
+    started = time.process_time()
+    for _ in range(iterations):
+        fn()
+    per_call = (time.process_time() - started) / iterations * 1000
+    print(f"{label:<28} {per_call:8.3f} ms CPU per response")
+    return per_call
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    titles = make_titles(count)
+    adapter = TypeAdapter(List[ContentResponse])
+    card_cache = CardCache()
+
+    assert json.loads(previous_path(titles, adapter)) == json.loads(card_cache.titles_json(titles))
+
+    print(f"{count} cards, {iterations} iterations")
+    before = measure("build + validate + encode", lambda: previous_path(titles, adapter), iterations)
+    card_cache.titles_json(titles)
+    after = measure("stitch cached cards", lambda: card_cache.titles_json(titles), iterations)
+    print(f"speedup: {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
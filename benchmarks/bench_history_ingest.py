@@ -0,0 +1,81 @@
+"""Benchmark sustained progress heartbeat ingestion through the history buffer.
+
+Simulates concurrent streams each sending a heartbeat per tick while the
+buffer's flush loop runs, and reports accepted heartbeats per second and how
+many write operations reached the collection. The collection is an
+in-process sink that charges a fixed latency per bulk_write round trip, so
+the numbers measure the buffer and coalescing rather than a particular
+Mongo deployment.
+
+Each run goes through the flat layout and then the bucketed layout, whose
+writes carry a $pull and a $push per bucket.
+
+Usage: python benchmarks/bench_history_ingest.py [streams] [ticks] [write_latency_ms]
+"""
+import asyncio
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from models import ViewingHistoryCreate, ContentType
+from database import db
+from history import HistoryBuffer, FlatHistoryStore, BucketHistoryStore
+
+
+class LatencySink:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.round_trips = 0
+        self.operations = 0
+
+    async def bulk_write(self, operations, ordered=True):
+        self.round_trips += 1
+        self.operations += len(operations)
+        await asyncio.sleep(self.latency)
+
+
+async def run(store, streams: int, ticks: int, latency: float):
+    sink = LatencySink(latency)
+    db.database = SimpleNamespace(viewing_history=sink, viewing_history_buckets=sink)
+    buffer = HistoryBuffer(store)
+    buffer.max_pending = streams * 2
+    await buffer.start()
+
+    heartbeats = [
+        (f"profile-{n}", ViewingHistoryCreate(content_id=f"content-{n % 5000}", content_type=ContentType.MOVIE))
+        for n in range(streams)
+    ]
+    started = time.perf_counter()
+    for tick in range(ticks):
+        for profile_id, heartbeat in heartbeats:
+            heartbeat.progress_seconds = tick * 10
+            buffer.record(profile_id, heartbeat)
+        # Let the flush loop run between ticks, as it would between requests
+        await asyncio.sleep(0)
+    ingest_seconds = time.perf_counter() - started
+    await buffer.stop()
+    total_seconds = time.perf_counter() - started
+
+    received = streams * ticks
+    print(f"{store.name}: {streams} streams x {ticks} heartbeats, {latency * 1000:.1f} ms per bulk_write")
+    print(f"accepted:       {received / ingest_seconds:12,.0f} heartbeats/s")
+    print(f"drained:        {received / total_seconds:12,.0f} heartbeats/s including the final flush")
+    print(f"write ops:      {sink.operations:12,} ({sink.operations / received:.1%} of heartbeats)")
+    print(f"round trips:    {sink.round_trips:12,}")
+    print(f"rejected:       {buffer.rejected:12,}")
+
+
+def main():
+    streams = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    ticks = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    latency = float(sys.argv[3]) / 1000 if len(sys.argv) > 3 else 0.005
+    for store in (FlatHistoryStore(), BucketHistoryStore()):
+        asyncio.run(run(store, streams, ticks, latency))
+        print()
+
+
+if __name__ == "__main__":
+    main()
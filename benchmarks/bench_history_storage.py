@@ -0,0 +1,235 @@
+"""Compare the flat and bucketed viewing history layouts for one heavy viewer.
+
+Replays a viewer's heartbeats at production density (one every two
+seconds, each flushed on its own as the buffer does every two seconds)
+through both history stores. It checks that continue-watching and resume
+return identical rows, and reports:
+
+* storage: documents, BSON bytes, index entries and the largest bucket
+  for the flat latest-per-title layout and for daily buckets
+* reads: documents and bytes read, and BSON decode time, for
+  continue-watching and for a 30-day history range scan
+
+Collections are in-process stand-ins holding BSON-encoded documents, so
+sizes are exact document sizes while index entries are counted from each
+layout's index definitions rather than measured on a server.
+
+Usage: python benchmarks/bench_history_storage.py [days] [hours_per_day] [titles]
+"""
+import asyncio
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import bson
+
+from database import db
+from history import FlatHistoryStore, BucketHistoryStore, _day_start
+
+PROFILE_ID = str(uuid.uuid4())
+HEARTBEAT_SECONDS = 2
+
+
+def _matches(doc, query):
+    for field, expected in query.items():
+        if field == "events.c":
+            if not any(event["c"] == expected for event in doc.get("events", [])):
+                return False
+        elif isinstance(expected, dict) and "$lt" in expected:
+            if not doc.get(field) < expected["$lt"]:
+                return False
+        elif isinstance(expected, dict) and "$gte" in expected:
+            if not doc.get(field) >= expected["$gte"]:
+                return False
+        elif doc.get(field) != expected:
+            return False
+    return True
+
+
+def _project(doc, projection):
+    if not projection:
+        return doc
+    included = {field for field, value in projection.items() if value == 1}
+    if included:
+        return {field: value for field, value in doc.items() if field in included}
+    return {field: value for field, value in doc.items() if projection.get(field, 1) != 0}
+
+
+class MemoryCursor:
+    def __init__(self, collection, docs):
+        self.collection = collection
+        self.docs = docs
+
+    def sort(self, field, direction=1):
+        self.docs.sort(key=lambda raw: bson.decode(raw)[field], reverse=direction == -1)
+        return self
+
+    def limit(self, count):
+        self.docs = self.docs[:count]
+        return self
+
+    def _read(self):
+        # Only documents the query returns count as read
+        self.collection.reads += len(self.docs)
+        self.collection.bytes_read += sum(map(len, self.docs))
+        return [_project(bson.decode(raw), self.projection) for raw in self.docs]
+
+    async def to_list(self, length):
+        return self._read()[:length]
+
+    def __aiter__(self):
+        self._iter = iter(self._read())
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class MemoryCollection:
+    """Just enough of a Motor collection for the history stores, storing BSON
+
+    Upserts are keyed by their equality filter, so each write costs the
+    same however many documents the collection holds.
+    """
+
+    def __init__(self):
+        self.docs = {}
+        self.reads = 0
+        self.bytes_read = 0
+
+    @staticmethod
+    def _key(query):
+        return tuple(sorted(query.items()))
+
+    def find(self, query, projection=None):
+        cursor = MemoryCursor(self, [raw for raw in self.docs.values() if _matches(bson.decode(raw), query)])
+        cursor.projection = projection
+        return cursor
+
+    async def find_one(self, query, projection=None):
+        found = await self.find(query, projection).limit(1).to_list(1)
+        return found[0] if found else None
+
+    async def bulk_write(self, operations, ordered=True):
+        for operation in operations:
+            key = self._key(operation._filter)
+            raw = self.docs.get(key)
+            if raw is None and not operation._upsert:
+                continue
+            doc = bson.decode(raw) if raw is not None else {"_id": bson.ObjectId(), **operation._filter}
+            update = operation._doc
+            if raw is None:
+                doc.update(update.get("$setOnInsert", {}))
+            doc.update(update.get("$set", {}))
+            for field, value in update.get("$pull", {}).items():
+                pulled = set(value["c"]["$in"])
+                doc[field] = [event for event in doc.get(field, []) if event["c"] not in pulled]
+            for field, value in update.get("$push", {}).items():
+                doc.setdefault(field, []).extend(value["$each"])
+            self.docs[key] = bson.encode(doc)
+
+
+def make_heartbeats(days: int, hours: float, titles: int):
+    """One viewer's heartbeats: an evening session a day across a few titles"""
+    random.seed(7)
+    content_ids = [str(uuid.uuid4()) for _ in range(titles)]
+    start = _day_start(datetime.utcnow()) - timedelta(days=days)
+    per_day = int(hours * 3600 / HEARTBEAT_SECONDS)
+    heartbeats = []
+    for day in range(days):
+        watching = random.sample(content_ids, 3)
+        moment = start + timedelta(days=day, hours=19)
+        for n in range(per_day):
+            moment += timedelta(seconds=HEARTBEAT_SECONDS)
+            title = n * len(watching) // per_day
+            # The first two titles of each evening are finished, the last one is left part-way
+            finished = title < len(watching) - 1 and n == (title + 1) * per_day // len(watching) - 1
+            heartbeats.append((watching[title], {
+                "content_type": "movie",
+                "progress_seconds": (n - title * per_day // len(watching)) * HEARTBEAT_SECONDS,
+                "completed": finished,
+                "watched_at": moment.replace(microsecond=0),
+            }))
+    return content_ids, heartbeats
+
+
+async def replay(store, heartbeats):
+    # The buffer flushes every two seconds, so each heartbeat is its own write
+    for content_id, event in heartbeats:
+        await store.write({(PROFILE_ID, content_id): event})
+
+
+def describe(label, raws, index_entries, events=None):
+    size = sum(map(len, raws))
+    largest = f" {max(events):>6,} events max" if events else ""
+    print(f"{label:<22} {len(raws):>6,} docs {size:>10,} bytes {index_entries:>7,} index entries{largest}")
+
+
+async def timed_read(label, collection, read, iterations=20):
+    collection.reads = collection.bytes_read = 0
+    started = time.perf_counter()
+    for _ in range(iterations):
+        await read()
+    per_read = (time.perf_counter() - started) / iterations * 1000
+    print(
+        f"{label:<22} {collection.reads // iterations:>6,} docs "
+        f"{collection.bytes_read // iterations:>10,} bytes {per_read:9.2f} ms decode"
+    )
+
+
+async def main():
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    hours = float(sys.argv[2]) if len(sys.argv) > 2 else 2.0
+    titles = int(sys.argv[3]) if len(sys.argv) > 3 else 500
+    content_ids, heartbeats = make_heartbeats(days, hours, titles)
+
+    flat, buckets = MemoryCollection(), MemoryCollection()
+    db.database = SimpleNamespace(
+        viewing_history=flat, viewing_history_buckets=buckets, viewing_history_archive=MemoryCollection()
+    )
+    flat_store, bucket_store = FlatHistoryStore(), BucketHistoryStore()
+    started = time.perf_counter()
+    await replay(flat_store, heartbeats)
+    await replay(bucket_store, heartbeats)
+    print(f"{len(heartbeats):,} heartbeats over {days} days replayed in {time.perf_counter() - started:.1f}s")
+
+    assert await flat_store.continue_watching(PROFILE_ID, 20) == await bucket_store.continue_watching(PROFILE_ID, 20)
+    for content_id in random.sample(content_ids, 50):
+        assert await flat_store.resume(PROFILE_ID, content_id) == await bucket_store.resume(PROFILE_ID, content_id)
+    print("both layouts return identical continue-watching and resume rows\n")
+
+    flat_docs = list(flat.docs.values())
+    bucket_docs = list(buckets.docs.values())
+    bucket_events = [len(bson.decode(raw)["events"]) for raw in bucket_docs]
+    # _id, profile_id, content_id, watched_at and the two compound indexes
+    describe("flat latest-per-title", flat_docs, len(flat_docs) * 6)
+    # _id, (profile_id, day) and the multikey (profile_id, events.c, day)
+    describe("daily buckets", bucket_docs, len(bucket_docs) * 2 + sum(bucket_events), bucket_events)
+
+    print("\ncontinue-watching (20 titles)")
+    await timed_read("flat latest-per-title", flat, lambda: flat_store.continue_watching(PROFILE_ID, 20))
+    await timed_read("daily buckets", buckets, lambda: bucket_store.continue_watching(PROFILE_ID, 20))
+
+    print("\n30-day history range scan")
+    cutoff = _day_start(datetime.utcnow()) - timedelta(days=30)
+    await timed_read(
+        "flat latest-per-title", flat,
+        lambda: flat.find({"profile_id": PROFILE_ID, "watched_at": {"$gte": cutoff}}).to_list(None)
+    )
+    await timed_read(
+        "daily buckets", buckets,
+        lambda: buckets.find({"profile_id": PROFILE_ID, "day": {"$gte": cutoff}}).to_list(None)
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
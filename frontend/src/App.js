@@ -117,6 +117,14 @@ const AuthProvider = ({ children }) => {
         headers: { Authorization: `Bearer ${token}` }
       });
       
+      // Refresh the token so it carries the new profile
+      const tokenResponse = await axios.post(`${API_BASE}/auth/refresh`, null, {
+        headers: { Authorization: `Bearer ${token}` }
+      });
+      const { access_token } = tokenResponse.data;
+      localStorage.setItem('netflix_token', access_token);
+      setToken(access_token);
+      
       // Refresh user data
       await fetchUser();
       return { success: true, profile: response.data };
@@ -473,22 +481,17 @@ const NetflixApp = () => {
     
     setLoading(true);
     try {
-      const [trendingRes, moviesRes, tvRes] = await Promise.all([
-        apiCall('/content/trending'),
-        apiCall('/movies/popular'),
-        apiCall('/tv/popular')
-      ]);
+      // Every home row, including the watchlist, comes back in one request
+      const homeRes = await apiCall(`/home/${currentProfile.id}`);
+      const home = homeRes.data || {};
 
       setContent({
-        trending: trendingRes.data || [],
-        movies: moviesRes.data || [],
-        tvShows: tvRes.data || [],
+        trending: home.trending || [],
+        movies: home.popular_movies || [],
+        tvShows: home.popular_tv_shows || [],
         searchResults: []
       });
-
-      // Fetch watchlist
-      const watchlistRes = await apiCall(`/watchlist/${currentProfile.id}`);
-      setMyList(watchlistRes.data || []);
+      setMyList(home.watchlist || []);
     } catch (error) {
       console.error('Error fetching content:', error);
     } finally {
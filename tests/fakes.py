@@ -0,0 +1,243 @@
+"""In-memory stand-ins for the Motor collections the backend talks to.
+
+Only the query and update operators the backend uses are supported, with
+Mongo's semantics for them: dotted paths match any element of an array,
+and bulk writes apply UpdateOne, UpdateMany and ReplaceOne in order.
+"""
+import copy
+from types import SimpleNamespace
+
+import bson
+from pymongo import ReplaceOne, UpdateMany, UpdateOne
+
+
+def _values(doc, path):
+    """Every value at a dotted path, descending into arrays"""
+    values = [doc]
+    for part in path.split("."):
+        found = []
+        for value in values:
+            if isinstance(value, list):
+                found.extend(item[part] for item in value if isinstance(item, dict) and part in item)
+            elif isinstance(value, dict) and part in value:
+                found.append(value[part])
+        values = found
+    expanded = []
+    for value in values:
+        expanded.extend(value if isinstance(value, list) else [value])
+    return expanded + [value for value in values if isinstance(value, list)]
+
+
+def _compare(value, operator, operand):
+    if operator == "$eq":
+        return value == operand
+    if operator == "$ne":
+        return value != operand
+    if operator == "$in":
+        return value in operand
+    if operator == "$nin":
+        return value not in operand
+    try:
+        if operator == "$gt":
+            return value > operand
+        if operator == "$gte":
+            return value >= operand
+        if operator == "$lt":
+            return value < operand
+        if operator == "$lte":
+            return value <= operand
+    except TypeError:
+        return False
+    raise NotImplementedError(operator)
+
+
+def matches(doc, query):
+    for field, condition in query.items():
+        if field == "$and":
+            if not all(matches(doc, branch) for branch in condition):
+                return False
+            continue
+        if field == "$or":
+            if not any(matches(doc, branch) for branch in condition):
+                return False
+            continue
+
+        values = _values(doc, field)
+        if isinstance(condition, dict) and condition and all(key.startswith("$") for key in condition):
+            for operator, operand in condition.items():
+                if operator == "$exists":
+                    if bool(values) != operand:
+                        return False
+                elif operator in ("$ne", "$nin"):
+                    if not all(_compare(value, operator, operand) for value in values):
+                        return False
+                elif not any(_compare(value, operator, operand) for value in values):
+                    return False
+        elif condition is None:
+            if values and not any(value is None for value in values):
+                return False
+        elif not any(value == condition for value in values):
+            return False
+    return True
+
+
+def _project(doc, projection):
+    if not projection:
+        return copy.deepcopy(doc)
+    included = {field for field, value in projection.items() if value == 1}
+    if included:
+        projected = {field: value for field, value in doc.items() if field in included}
+        if projection.get("_id", 1) != 0 and "_id" in doc:
+            projected["_id"] = doc["_id"]
+        return copy.deepcopy(projected)
+    return copy.deepcopy({field: value for field, value in doc.items() if projection.get(field, 1) != 0})
+
+
+def _set_path(doc, path, value):
+    *parents, last = path.split(".")
+    for part in parents:
+        doc = doc.setdefault(part, {})
+    doc[last] = value
+
+
+def _get_path(doc, path, default=None):
+    for part in path.split("."):
+        if not isinstance(doc, dict) or part not in doc:
+            return default
+        doc = doc[part]
+    return doc
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, key, direction=1):
+        keys = [(key, direction)] if isinstance(key, str) else list(key)
+        for field, field_direction in reversed(keys):
+            self.docs.sort(key=lambda doc: _get_path(doc, field), reverse=field_direction == -1)
+        return self
+
+    def skip(self, count):
+        self.docs = self.docs[count:]
+        return self
+
+    def limit(self, count):
+        if count:
+            self.docs = self.docs[:count]
+        return self
+
+    async def to_list(self, length):
+        return self.docs if length is None else self.docs[:length]
+
+    def __aiter__(self):
+        self._iter = iter(self.docs)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class FakeCollection:
+    """A Motor collection held in a list, counting the calls made against it"""
+
+    def __init__(self, docs=None):
+        self.docs = []
+        self.calls = []
+        for doc in docs or []:
+            self._insert(doc)
+
+    def _insert(self, doc):
+        doc = copy.deepcopy(doc)
+        doc.setdefault("_id", bson.ObjectId())
+        self.docs.append(doc)
+        return doc
+
+    def find(self, query=None, projection=None):
+        self.calls.append(("find", query))
+        return FakeCursor([_project(doc, projection) for doc in self.docs if matches(doc, query or {})])
+
+    async def find_one(self, query=None, projection=None):
+        self.calls.append(("find_one", query))
+        for doc in self.docs:
+            if matches(doc, query or {}):
+                return _project(doc, projection)
+        return None
+
+    async def insert_one(self, doc):
+        self._insert(doc)
+
+    async def count_documents(self, query):
+        return sum(1 for doc in self.docs if matches(doc, query))
+
+    async def delete_many(self, query):
+        before = len(self.docs)
+        self.docs = [doc for doc in self.docs if not matches(doc, query)]
+        return SimpleNamespace(deleted_count=before - len(self.docs))
+
+    async def update_one(self, query, update, upsert=False):
+        self._update(query, update, upsert, many=False)
+
+    async def bulk_write(self, operations, ordered=True):
+        self.calls.append(("bulk_write", len(operations)))
+        for operation in operations:
+            upsert = bool(operation._upsert)
+            if isinstance(operation, ReplaceOne):
+                self._replace(operation._filter, operation._doc, upsert)
+            elif isinstance(operation, (UpdateOne, UpdateMany)):
+                self._update(operation._filter, operation._doc, upsert, isinstance(operation, UpdateMany))
+            else:
+                raise NotImplementedError(type(operation).__name__)
+
+    def _replace(self, query, replacement, upsert):
+        for index, doc in enumerate(self.docs):
+            if matches(doc, query):
+                self.docs[index] = {"_id": doc["_id"], **copy.deepcopy(replacement)}
+                return
+        if upsert:
+            self._insert(replacement)
+
+    def _update(self, query, update, upsert, many):
+        matched = [doc for doc in self.docs if matches(doc, query)]
+        if not matched:
+            if not upsert:
+                return
+            seed = {field: value for field, value in query.items() if not field.startswith("$") and not isinstance(value, dict)}
+            doc = self._insert(seed)
+            for path, value in update.get("$setOnInsert", {}).items():
+                _set_path(doc, path, copy.deepcopy(value))
+            matched = [doc]
+        for doc in matched if many else matched[:1]:
+            self._apply(doc, update)
+
+    @staticmethod
+    def _apply(doc, update):
+        for operator, fields in update.items():
+            for path, value in fields.items():
+                if operator == "$set":
+                    _set_path(doc, path, copy.deepcopy(value))
+                elif operator == "$inc":
+                    _set_path(doc, path, _get_path(doc, path, 0) + value)
+                elif operator == "$max":
+                    current = _get_path(doc, path)
+                    _set_path(doc, path, value if current is None else max(current, value))
+                elif operator == "$push":
+                    items = value["$each"] if isinstance(value, dict) and "$each" in value else [value]
+                    _set_path(doc, path, _get_path(doc, path, []) + copy.deepcopy(items))
+                elif operator == "$pull":
+                    current = _get_path(doc, path, [])
+                    if isinstance(value, dict):
+                        kept = [item for item in current if not matches(item, value)]
+                    else:
+                        kept = [item for item in current if item != value]
+                    _set_path(doc, path, kept)
+                elif operator != "$setOnInsert":
+                    raise NotImplementedError(operator)
+
+
+def fake_database(*names):
+    """A namespace of empty fake collections, for assigning to db.database"""
+    return SimpleNamespace(**{name: FakeCollection() for name in names})
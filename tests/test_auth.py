@@ -0,0 +1,29 @@
+import asyncio
+
+from fastapi.security import HTTPAuthorizationCredentials
+
+import auth
+from models import SubscriptionPlan, UserInDB
+from tests.fakes import fake_database
+
+
+def test_refresh_reads_the_user_past_a_stale_worker_cache(monkeypatch):
+    database = fake_database("users")
+    monkeypatch.setattr(auth.db, "database", database)
+    monkeypatch.setattr(auth, "user_cache", auth.TTLCache(max_size=10, default_ttl=300))
+    monkeypatch.setattr(auth, "token_versions", auth.TTLCache(max_size=10, default_ttl=30))
+    user = UserInDB(
+        email="a@example.com", first_name="A", last_name="B",
+        subscription_plan=SubscriptionPlan.BASIC, hashed_password="x"
+    )
+    auth.user_cache.set(user.id, user)
+    # Another worker added a profile and bumped the version after this worker cached the user
+    database.users.docs.append({**user.dict(), "token_version": 1})
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=auth.create_access_token({"sub": user.id}))
+
+    assert asyncio.run(auth.get_current_user(credentials)).token_version == 0
+    fresh = asyncio.run(auth.get_uncached_active_user(credentials))
+    assert fresh.token_version == 1
+    assert auth.user_claims(fresh).get("ver", 1) == 1
+    assert auth.user_cache.get(user.id).token_version == 1
+    assert auth.token_versions.get(user.id) == 1
@@ -0,0 +1,198 @@
+import asyncio
+import random
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+import collaborative
+from collaborative import CoWatchRecommender, merge_interaction
+from history import FlatHistoryStore
+from models import ContentType
+from tests.fakes import fake_database
+
+
+def interaction_pairs(profiles=60, titles=40, per_profile=8, seed=5):
+    rng = random.Random(seed)
+    start = datetime.utcnow() - timedelta(days=30)
+    pairs = {}
+    for profile in range(profiles):
+        for title in rng.sample(range(titles), per_profile):
+            at = start + timedelta(minutes=rng.randrange(40000))
+            merge_interaction(
+                pairs, {"profile_id": f"p{profile}", "content_id": f"c{title}", "content_type": "movie"},
+                at, rng.choice(["added", "watched"])
+            )
+    return pairs
+
+
+def recommender(**settings):
+    model = CoWatchRecommender()
+    # Untruncated lists, so a delta can be compared with a rebuild exactly
+    model.min_cooccurrence, model.top_k, model.row_size, model.batch_size = 1, 1000, 1000, 7
+    for name, value in settings.items():
+        setattr(model, name, value)
+    return model
+
+
+def neighbours_by_id(model, content_id):
+    columns, scores = model.neighbours.get(model.title_index[content_id], ([], []))
+    return {model.title_ids[column]: float(score) for column, score in zip(columns, scores)}
+
+
+def rows_by_id(model, profile_id):
+    return [
+        (seed, reason, sorted(content_id for _, content_id in items))
+        for (_, seed), reason, items in model.recommendations(profile_id)
+    ]
+
+
+def assert_matches_rebuild(model, pairs, profile_id, content_id):
+    fresh = recommender(min_cooccurrence=model.min_cooccurrence)
+    fresh.build(pairs)
+    touched = [content_id] + [content_id for (profile, content_id) in pairs if profile == profile_id]
+    for title in touched:
+        expected, actual = neighbours_by_id(fresh, title), neighbours_by_id(model, title)
+        assert actual.keys() == expected.keys()
+        assert np.allclose([actual[key] for key in expected], list(expected.values()))
+    assert rows_by_id(model, profile_id) == rows_by_id(fresh, profile_id)
+
+
+def test_merge_interaction_keeps_latest_time_and_both_sources():
+    pairs = {}
+    early, late = datetime(2024, 1, 1), datetime(2024, 2, 1)
+    item = {"profile_id": "p", "content_id": "c", "content_type": "movie"}
+    merge_interaction(pairs, item, late, "watched")
+    merge_interaction(pairs, item, early, "added")
+    merge_interaction(pairs, item, early, "watched")
+    assert pairs == {("p", "c"): ("movie", late, True, True)}
+
+
+def test_load_streams_one_pair_per_profile_and_title(monkeypatch):
+    database = fake_database("watchlist", "viewing_history")
+    monkeypatch.setattr(collaborative.db, "database", database)
+    monkeypatch.setattr(collaborative, "history_store", FlatHistoryStore())
+    at = datetime(2024, 3, 1)
+    for content_id in ("a", "b"):
+        database.watchlist.docs.append(
+            {"profile_id": "p", "content_id": content_id, "content_type": "movie", "added_at": at}
+        )
+    for day in range(3):
+        database.viewing_history.docs.append({
+            "profile_id": "p", "content_id": "a", "content_type": "movie", "watched_at": at + timedelta(days=day)
+        })
+
+    pairs = asyncio.run(CoWatchRecommender()._load())
+    assert pairs == {
+        ("p", "a"): ("movie", at + timedelta(days=2), True, True),
+        ("p", "b"): ("movie", at, True, False),
+    }
+
+
+def test_build_prunes_pairs_below_min_cooccurrence():
+    pairs = interaction_pairs()
+    model = recommender(min_cooccurrence=3)
+    model.build(pairs)
+    assert model.cooccurrence.nnz and model.cooccurrence.data.min() >= 3
+    assert not model.cooccurrence.diagonal().any()
+
+    full = recommender()
+    full.build(pairs)
+    assert model.cooccurrence.nnz < full.cooccurrence.nnz
+    assert np.array_equal(model.totals, full.totals)
+    assert model.totals.sum() == len(pairs)
+    # Pruning only drops pairs that could never be scored
+    for content_id in model.title_index:
+        assert neighbours_by_id(model, content_id) == {
+            other: score for other, score in neighbours_by_id(full, content_id).items()
+            if full.cooccurrence[full.title_index[content_id], full.title_index[other]] >= 3
+        }
+
+
+def test_watchlist_add_matches_rebuild():
+    pairs = interaction_pairs()
+    model = recommender()
+    model.build(pairs)
+    profile_titles = {content_id for profile, content_id in pairs if profile == "p0"}
+    content_id = next(f"c{title}" for title in range(40) if f"c{title}" not in profile_titles)
+
+    model.apply_delta("p0", content_id, ContentType.MOVIE, True)
+    at, _, _ = model.profiles["p0"][model.title_index[content_id]]
+    pairs[("p0", content_id)] = ("movie", at, True, False)
+    assert_matches_rebuild(model, pairs, "p0", content_id)
+
+
+def test_watchlist_add_of_a_new_title_matches_rebuild():
+    pairs = interaction_pairs()
+    model = recommender()
+    model.build(pairs)
+    for profile_id in ("p0", "p1"):
+        model.apply_delta(profile_id, "brand-new", ContentType.MOVIE, True)
+        at, _, _ = model.profiles[profile_id][model.title_index["brand-new"]]
+        pairs[(profile_id, "brand-new")] = ("movie", at, True, False)
+    assert model.totals[model.title_index["brand-new"]] == 2
+    assert_matches_rebuild(model, pairs, "p1", "brand-new")
+
+
+def test_watchlist_removal_matches_rebuild():
+    pairs = interaction_pairs()
+    model = recommender()
+    model.build(pairs)
+    (profile_id, content_id), _ = next(
+        (key, value) for key, value in pairs.items() if key[0] == "p3" and value[2] and not value[3]
+    )
+
+    model.apply_delta(profile_id, content_id, None, False)
+    del pairs[(profile_id, content_id)]
+    assert_matches_rebuild(model, pairs, profile_id, content_id)
+
+
+def test_removal_of_a_watched_title_keeps_counts():
+    pairs = interaction_pairs()
+    (profile_id, content_id), (content_type, at, _, _) = next(iter(pairs.items()))
+    pairs[(profile_id, content_id)] = (content_type, at, True, True)
+    model = recommender()
+    model.build(pairs)
+    column = model.title_index[content_id]
+    before = (model.totals[column], neighbours_by_id(model, content_id))
+
+    model.apply_delta(profile_id, content_id, None, False)
+    assert (model.totals[column], neighbours_by_id(model, content_id)) == before
+    assert model.profiles[profile_id][column][1:] == (False, True)
+    assert model.deltas_applied == 0
+
+
+def test_recommendations_exclude_the_profiles_own_titles():
+    pairs = interaction_pairs()
+    model = recommender(seed_count=3, row_size=5)
+    model.build(pairs)
+    rows = model.recommendations("p0")
+    own = {content_id for profile, content_id in pairs if profile == "p0"}
+    assert 0 < len(rows) <= 3
+    for (content_type, seed), reason, items in rows:
+        assert content_type == ContentType.MOVIE and seed in own
+        assert reason == ("added" if pairs[("p0", seed)][2] else "watched")
+        assert 0 < len(items) <= 5 and not own & {content_id for _, content_id in items}
+
+
+@pytest.mark.parametrize("added", [True, False])
+def test_deltas_queue_until_ready(added):
+    model = recommender()
+    model._queue_delta("p0", "c1", ContentType.MOVIE if added else None, added)
+    assert model._deltas == [("p0", "c1", ContentType.MOVIE if added else None, added)]
+
+
+def test_queued_delta_runs_are_kept_until_they_finish():
+    pairs = interaction_pairs()
+    model = recommender()
+    model.build(pairs)
+    model.ready = True
+
+    async def run():
+        model.watchlist_added("p0", "brand-new", ContentType.MOVIE)
+        assert len(model._drains) == 1
+        await asyncio.gather(*model._drains)
+
+    asyncio.run(run())
+    assert not model._drains and not model._deltas
+    assert model.deltas_applied == 1
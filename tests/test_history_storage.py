@@ -0,0 +1,118 @@
+import asyncio
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+import history
+from history import BucketHistoryStore, FlatHistoryStore, _day_start
+from tests.fakes import fake_database
+
+COLLECTIONS = ("viewing_history", "viewing_history_buckets", "viewing_history_archive")
+
+
+@pytest.fixture
+def database(monkeypatch):
+    database = fake_database(*COLLECTIONS)
+    monkeypatch.setattr(history.db, "database", database)
+    return database
+
+
+def heartbeats(profiles=3, titles=12, days=6, per_day=40, seed=3):
+    """Flushed heartbeats in time order, several titles a day per profile"""
+    rng = random.Random(seed)
+    start = _day_start(datetime.utcnow()) - timedelta(days=days)
+    events = []
+    for day in range(days):
+        for profile in range(profiles):
+            moment = start + timedelta(days=day, hours=18 + profile)
+            for n in range(per_day):
+                moment += timedelta(seconds=rng.randint(2, 600))
+                events.append((f"p{profile}", f"c{rng.randrange(titles)}", {
+                    "content_type": rng.choice(["movie", "tv_show"]),
+                    "progress_seconds": n * 2,
+                    "completed": rng.random() < 0.3,
+                    "watched_at": moment.replace(microsecond=(moment.microsecond // 1000) * 1000),
+                }))
+    events.sort(key=lambda item: item[2]["watched_at"])
+    return events
+
+
+def replay(store, events, batch):
+    async def run():
+        for start in range(0, len(events), batch):
+            entries = {}
+            for profile_id, content_id, event in events[start:start + batch]:
+                entries[(profile_id, content_id)] = event
+            await store.write(entries)
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("batch", [1, 7, 500])
+def test_bucket_reads_match_the_flat_layout(database, batch):
+    events = heartbeats()
+    flat, buckets = FlatHistoryStore(), BucketHistoryStore()
+    replay(flat, events, batch)
+    replay(buckets, events, batch)
+
+    for profile in ("p0", "p1", "p2", "nobody"):
+        for limit in (1, 5, 20):
+            assert asyncio.run(buckets.continue_watching(profile, limit)) == asyncio.run(flat.continue_watching(profile, limit))
+        for title in range(13):
+            assert asyncio.run(buckets.resume(profile, f"c{title}")) == asyncio.run(flat.resume(profile, f"c{title}"))
+
+
+def test_a_bucket_keeps_one_event_per_title(database):
+    events = heartbeats(profiles=1, titles=3, days=2, per_day=200)
+    replay(BucketHistoryStore(), events, 1)
+
+    for bucket in database.viewing_history_buckets.docs:
+        titles = [event["c"] for event in bucket["events"]]
+        assert len(titles) == len(set(titles)) <= 3
+
+
+def test_continue_watching_scans_a_bounded_number_of_buckets(database):
+    store = BucketHistoryStore()
+    store.max_scan_buckets = 3
+    start = _day_start(datetime.utcnow()) - timedelta(days=10)
+    replay(store, [
+        ("p", f"c{day}", {
+            "content_type": "movie", "progress_seconds": 10, "completed": False,
+            "watched_at": start + timedelta(days=day, hours=20),
+        })
+        for day in range(10)
+    ], 1)
+
+    rows = asyncio.run(store.continue_watching("p", 20))
+    assert [row["content_id"] for row in rows] == ["c9", "c8", "c7"]
+    assert store.buckets_scanned == 3
+
+
+def test_resume_falls_back_to_archived_buckets(database):
+    store = BucketHistoryStore()
+    store.archive_after_days = 30
+    old = _day_start(datetime.utcnow()) - timedelta(days=45)
+    replay(store, [("p", "c1", {
+        "content_type": "movie", "progress_seconds": 300, "completed": False, "watched_at": old + timedelta(hours=20),
+    })], 1)
+
+    asyncio.run(store.maintain())
+    assert not database.viewing_history_buckets.docs
+    assert len(database.viewing_history_archive.docs) == 1
+    assert asyncio.run(store.resume("p", "c1"))["progress_seconds"] == 300
+
+
+def test_migrate_moves_flat_rows_into_buckets(database):
+    events = heartbeats(profiles=2, days=3)
+    flat = FlatHistoryStore()
+    replay(flat, events, 50)
+    expected = {profile: asyncio.run(flat.continue_watching(profile, 20)) for profile in ("p0", "p1")}
+    flat_rows = len(database.viewing_history.docs)
+
+    store = BucketHistoryStore()
+    store.migration_batch = 5
+    asyncio.run(store.migrate())
+    assert not database.viewing_history.docs
+    assert store.migrated == flat_rows
+    for profile, rows in expected.items():
+        assert asyncio.run(store.continue_watching(profile, 20)) == rows
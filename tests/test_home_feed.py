@@ -0,0 +1,124 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from starlette.requests import Request
+
+import feeds
+from http_cache import make_etag, not_modified_response, PRIVATE_CACHE_CONTROL
+from models import Movie
+from tests.fakes import FakeCollection, fake_database
+
+
+def request_with(headers):
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/",
+        "headers": [(name.lower().encode(), value.encode()) for name, value in headers.items()],
+    })
+
+
+def stub_rows(monkeypatch, watchlist=b"[]", fail=None):
+    calls = []
+
+    def loader(name, body):
+        async def load(*args):
+            calls.append(name)
+            if name == fail:
+                raise RuntimeError("upstream down")
+            return body
+        return load
+
+    monkeypatch.setattr(feeds, "trending_json", loader("trending", b"[1]"))
+    monkeypatch.setattr(feeds, "popular_movies_json", loader("popular_movies", b"[2]"))
+    monkeypatch.setattr(feeds, "popular_tv_json", loader("popular_tv_shows", b"[3]"))
+    monkeypatch.setattr(feeds, "watchlist_json", loader("watchlist", watchlist))
+    return calls
+
+
+def test_make_etag_is_stable_and_quoted():
+    assert make_etag("a", 1) == make_etag("a", 1)
+    assert make_etag("a", 1) != make_etag("a", 2)
+    assert make_etag(b"body").startswith('"') and make_etag(b"body").endswith('"')
+
+
+def test_not_modified_matches_weak_and_listed_tags():
+    etag = make_etag("v1")
+    assert not_modified_response(request_with({"If-None-Match": etag}), etag, PRIVATE_CACHE_CONTROL).status_code == 304
+    assert not_modified_response(request_with({"If-None-Match": f'"other", W/{etag}'}), etag, PRIVATE_CACHE_CONTROL)
+    assert not_modified_response(request_with({"If-None-Match": '"other"'}), etag, PRIVATE_CACHE_CONTROL) is None
+    assert not_modified_response(request_with({}), etag, PRIVATE_CACHE_CONTROL) is None
+
+
+def test_render_reuses_body_only_under_the_same_etag(monkeypatch):
+    home = feeds.HomeFeed()
+    calls = stub_rows(monkeypatch, watchlist=b'["a"]')
+
+    body, complete = asyncio.run(home.render("p1", '"v1"'))
+    assert complete
+    assert body == b'{"trending":[1],"popular_movies":[2],"popular_tv_shows":[3],"watchlist":["a"]}'
+    assert asyncio.run(home.render("p1", '"v1"')) == (body, True)
+    assert len(calls) == 4
+
+    # A version change seen by another worker never serves the body cached for the old ETag
+    stub_rows(monkeypatch, watchlist=b'["a","b"]')
+    body, _ = asyncio.run(home.render("p1", '"v2"'))
+    assert body.endswith(b'"watchlist":["a","b"]}')
+
+
+def test_render_does_not_cache_failed_rows(monkeypatch):
+    home = feeds.HomeFeed()
+    stub_rows(monkeypatch, fail="trending")
+    body, complete = asyncio.run(home.render("p1", '"v1"'))
+    assert not complete
+    assert body.startswith(b'{"trending":[],')
+
+    calls = stub_rows(monkeypatch)
+    body, complete = asyncio.run(home.render("p1", '"v1"'))
+    assert complete and body.startswith(b'{"trending":[1],')
+    assert len(calls) == 4
+
+
+def test_render_without_etag_skips_the_cache(monkeypatch):
+    home = feeds.HomeFeed()
+    calls = stub_rows(monkeypatch)
+    asyncio.run(home.render("p1"))
+    asyncio.run(home.render("p1"))
+    assert len(calls) == 8
+    assert len(home.cache) == 0
+
+
+def test_watchlist_row_holds_the_whole_list(monkeypatch):
+    start = datetime(2024, 1, 1)
+    watchlist = FakeCollection([
+        {"profile_id": "p1", "id": f"w{n}", "content_id": f"c{n}", "content_type": "movie", "added_at": start + timedelta(minutes=n)}
+        for n in range(feeds.WATCHLIST_PAGE_SIZE + 10)
+    ])
+    monkeypatch.setattr(feeds.db, "database", SimpleNamespace(watchlist=watchlist))
+
+    async def load_card_json(refs):
+        return [f'"{content_id}"'.encode() for _, content_id in refs]
+
+    monkeypatch.setattr(feeds.catalog, "load_card_json", load_card_json)
+    body = asyncio.run(feeds.watchlist_json("p1"))
+    assert json.loads(body) == [f"c{n}" for n in range(feeds.WATCHLIST_PAGE_SIZE + 10)]
+
+
+def test_snapshot_etag_changes_when_titles_are_stored(monkeypatch):
+    database = fake_database("movies", "tv_shows", "catalog_versions", "catalog_snapshots")
+    monkeypatch.setattr(feeds.db, "database", database)
+    monkeypatch.setattr(feeds.catalog, "_upsert_listeners", [])
+    database.catalog_snapshots.docs.append({"name": "trending", "version": 1, "updated_at": datetime.utcnow()})
+    movie = Movie(tmdb_id=1, title="Heat", overview="", original_language="en", original_title="Heat")
+
+    before, _ = asyncio.run(feeds.snapshot_validators(["trending"]))
+    assert asyncio.run(feeds.snapshot_validators(["trending"]))[0] == before
+
+    # A background refresh rewrites the card without touching the snapshot listing it
+    asyncio.run(feeds.catalog.store_titles([movie]))
+    after, modified = asyncio.run(feeds.snapshot_validators(["trending"]))
+    assert after != before
+    assert modified == database.catalog_versions.docs[0]["updated_at"]
+    assert asyncio.run(feeds.catalog.version())["version"] == 1
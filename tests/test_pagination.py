@@ -0,0 +1,88 @@
+import asyncio
+import base64
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from pagination import decode_cursor, encode_cursor, fetch_page, keyset_filter
+from tests.fakes import FakeCollection
+
+WATCHLIST_SORT = [("added_at", 1, datetime), ("id", 1, str)]
+BROWSE_SORT = [("popularity", -1, float), ("id", 1, str)]
+
+
+def raw_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+
+def test_cursor_round_trips_datetimes_and_scalars():
+    added_at = datetime(2024, 5, 1, 12, 30, 15, 123000)
+    cursor = encode_cursor(WATCHLIST_SORT, {"added_at": added_at, "id": "a1", "ignored": 1})
+    assert "=" not in cursor
+    assert decode_cursor(WATCHLIST_SORT, cursor) == [added_at, "a1"]
+    assert decode_cursor(BROWSE_SORT, encode_cursor(BROWSE_SORT, {"popularity": 12.5, "id": "b"})) == [12.5, "b"]
+
+
+@pytest.mark.parametrize("cursor", [
+    "not base64!",
+    raw_cursor({"added_at": 1}),
+    raw_cursor(["2024-01-01", "a"]),
+    raw_cursor([{"$date": "2024-01-01T00:00:00"}]),
+    raw_cursor([{"$date": "yesterday"}, "a"]),
+    raw_cursor([{"$date": "2024-01-01T00:00:00"}, {"$gt": ""}]),
+    raw_cursor([{"$date": "2024-01-01T00:00:00"}, ["a"]]),
+    raw_cursor([{"$date": "2024-01-01T00:00:00"}, None]),
+])
+def test_decode_rejects_malformed_and_non_scalar_cursors(cursor):
+    with pytest.raises(HTTPException) as raised:
+        decode_cursor(WATCHLIST_SORT, cursor)
+    assert raised.value.status_code == 400
+
+
+@pytest.mark.parametrize("values", [[True, "a"], ["12", "a"], [1.5, 2]])
+def test_decode_checks_each_key_type(values):
+    with pytest.raises(HTTPException):
+        decode_cursor(BROWSE_SORT, raw_cursor(values))
+
+
+def test_decode_accepts_whole_numbers_for_float_keys():
+    assert decode_cursor(BROWSE_SORT, raw_cursor([12, "a"])) == [12, "a"]
+
+
+def test_keyset_filter_matches_strictly_after_in_sort_order():
+    assert keyset_filter(BROWSE_SORT[:1], [5.0]) == {"popularity": {"$lt": 5.0}}
+    assert keyset_filter(BROWSE_SORT, [5.0, "m"]) == {"$or": [
+        {"popularity": {"$lt": 5.0}},
+        {"popularity": 5.0, "id": {"$gt": "m"}},
+    ]}
+
+
+def test_fetch_page_walks_every_document_once_with_ties():
+    start = datetime(2024, 1, 1)
+    docs = [
+        {"profile_id": "p", "id": f"item-{n:02d}", "added_at": start + timedelta(minutes=n // 3)}
+        for n in range(25)
+    ] + [{"profile_id": "other", "id": "x", "added_at": start}]
+    collection = FakeCollection(docs)
+
+    async def walk():
+        seen, cursor, pages = [], None, 0
+        while True:
+            page, cursor = await fetch_page(collection, {"profile_id": "p"}, WATCHLIST_SORT, 7, cursor, {"_id": 0})
+            seen.extend(doc["id"] for doc in page)
+            pages += 1
+            if cursor is None:
+                return seen, pages
+
+    seen, pages = asyncio.run(walk())
+    assert seen == [f"item-{n:02d}" for n in range(25)]
+    assert pages == 4
+
+
+def test_fetch_page_has_no_cursor_on_an_exact_last_page():
+    collection = FakeCollection([{"id": str(n), "popularity": float(n)} for n in range(4)])
+    page, cursor = asyncio.run(fetch_page(collection, {}, BROWSE_SORT, 4))
+    assert [doc["id"] for doc in page] == ["3", "2", "1", "0"]
+    assert cursor is None
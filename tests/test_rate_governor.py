@@ -0,0 +1,43 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import HTTPException
+
+from auth import get_current_admin_user
+from models import SubscriptionPlan, UserInDB, UserRole
+from rate_governor import RateGovernor
+
+KEYS = ["0123456789abcdef0123456789abcdef", "fedcba9876543210fedcba9876543210"]
+
+
+def test_stats_identify_keys_without_revealing_them():
+    governor = RateGovernor(KEYS, rate=10, burst=10, max_wait=1)
+    stats = governor.stats()
+    assert [key["index"] for key in stats["keys"]] == [0, 1]
+    assert len({key["fingerprint"] for key in stats["keys"]}) == 2
+
+    published = json.dumps(stats)
+    for key in KEYS:
+        assert key[:4] not in published and key[-4:] not in published
+
+
+def test_waits_out_cooldowns_longer_than_max_wait_until_the_deadline():
+    governor = RateGovernor(KEYS[:1], rate=10, burst=1, max_wait=0.05)
+    governor.throttle(KEYS[0], retry_after=60, attempt=0)
+    assert asyncio.run(governor.acquire()) is None
+    assert governor.waits == 1 and governor.exhausted == 1
+
+
+@pytest.mark.parametrize("role", [UserRole.USER, UserRole.ADMIN])
+def test_stats_require_an_admin(role):
+    user = UserInDB(
+        email="a@example.com", first_name="A", last_name="B",
+        subscription_plan=SubscriptionPlan.BASIC, role=role, hashed_password="x"
+    )
+    if role == UserRole.ADMIN:
+        assert asyncio.run(get_current_admin_user(user)) is user
+    else:
+        with pytest.raises(HTTPException) as raised:
+            asyncio.run(get_current_admin_user(user))
+        assert raised.value.status_code == 403
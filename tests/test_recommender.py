@@ -0,0 +1,57 @@
+import asyncio
+
+import recommender
+from models import ContentType, Movie
+from recommender import SimilarTitles
+
+
+def feature_doc(n, genre):
+    return {
+        "id": f"m{n}", "content_type": ContentType.MOVIE.value, "genres": [{"id": genre, "name": str(genre)}],
+        "original_language": "en", "vote_average": 5.0 + n % 5, "popularity": float(n),
+    }
+
+
+def test_startup_build_retries_after_a_failure(monkeypatch):
+    titles = SimilarTitles()
+    titles.retry_interval, titles.refresh_interval = 0, 3600
+    monkeypatch.setattr(recommender.db, "database", object())
+    attempts = []
+
+    async def load():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("mongo unavailable")
+        return [feature_doc(n, n % 3) for n in range(12)]
+
+    monkeypatch.setattr(titles, "_load", load)
+
+    async def run():
+        await titles.start()
+        while not titles.ready:
+            await asyncio.sleep(0.01)
+        await titles.stop()
+
+    asyncio.run(asyncio.wait_for(run(), 5))
+    assert len(attempts) == 2
+    assert (titles.failures, titles.rebuilds, titles.size) == (1, 1, 12)
+    assert titles.similar("m0", 3)
+
+
+def test_rebuild_keeps_upserts_patched_in_while_it_ran(monkeypatch):
+    titles = SimilarTitles()
+    titles.build([feature_doc(n, n % 3) for n in range(6)])
+    titles.ready = True
+    late = Movie(tmdb_id=99, title="Late", overview="", original_language="en", original_title="Late")
+
+    async def load():
+        # A catalog upsert lands after the reload read its snapshot
+        titles.add_titles([late])
+        await asyncio.sleep(0)
+        await asyncio.gather(*titles._patches)
+        return [feature_doc(n, n % 3) for n in range(6)]
+
+    monkeypatch.setattr(titles, "_load", load)
+    asyncio.run(titles.rebuild())
+    assert late.id in titles.rows and titles.size == 7
+    assert not titles._patches
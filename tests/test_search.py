@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+import search
+from models import Movie, ContentType
+from search import CatalogSearch, canonical_query
+
+
+def movie(tmdb_id):
+    return Movie(
+        tmdb_id=tmdb_id, title=f"Movie {tmdb_id}", overview="", original_language="en", original_title=f"Movie {tmdb_id}"
+    )
+
+
+@pytest.fixture
+def catalog_store(monkeypatch):
+    stored = {}
+
+    async def load_titles(items):
+        return {item: stored[item] for item in items if item in stored}
+
+    monkeypatch.setattr(search.catalog, "load_titles", load_titles)
+    return stored
+
+
+@pytest.fixture
+def executed(monkeypatch):
+    calls = []
+
+    async def execute(self, query, page):
+        calls.append((query, page))
+        movies = [movie(1), movie(2)]
+        return {"movies": movies, "tv_shows": [], "total_results": len(movies)}
+
+    monkeypatch.setattr(CatalogSearch, "_execute", execute)
+    return calls
+
+
+@pytest.mark.parametrize("query", ["Batman", " batman ", "BATMAN", "\tBatman\n", "Ｂａｔｍａｎ"])
+def test_canonical_query_folds_case_width_and_spacing(query):
+    assert canonical_query(query) == "batman"
+
+
+def test_canonical_query_collapses_inner_whitespace():
+    assert canonical_query("the   dark\tknight") == "the dark knight"
+    assert canonical_query("Straße") == canonical_query("STRASSE")
+
+
+def test_equivalent_queries_share_one_cache_entry(catalog_store, executed):
+    catalog_store.update({(ContentType.MOVIE, 1): movie(1), (ContentType.MOVIE, 2): movie(2)})
+    engine = CatalogSearch()
+
+    first = asyncio.run(engine.search("The Matrix"))
+    again = asyncio.run(engine.search("  the   MATRIX "))
+    assert executed == [("the matrix", 1)]
+    assert [title.tmdb_id for title in again["movies"]] == [title.tmdb_id for title in first["movies"]] == [1, 2]
+    assert engine.query_counts[("the matrix", 1)] == 2
+
+    asyncio.run(engine.search("the matrix", page=2))
+    assert executed == [("the matrix", 1), ("the matrix", 2)]
+
+
+def test_cached_page_missing_a_title_is_recomputed(catalog_store, executed):
+    catalog_store.update({(ContentType.MOVIE, 1): movie(1), (ContentType.MOVIE, 2): movie(2)})
+    engine = CatalogSearch()
+    asyncio.run(engine.search("matrix"))
+
+    del catalog_store[(ContentType.MOVIE, 2)]
+    asyncio.run(engine.search("matrix"))
+    assert len(executed) == 2
+
+
+def test_precompute_refreshes_popular_queries_and_decays_counts(catalog_store, executed):
+    engine = CatalogSearch()
+    engine.precompute_count = 1
+    engine.query_counts.update({("matrix", 1): 4, ("alien", 1): 1})
+
+    asyncio.run(engine.precompute_popular())
+    assert executed == [("matrix", 1)]
+    assert ("matrix", 1) in engine.results
+    assert dict(engine.query_counts) == {("matrix", 1): 2}
@@ -0,0 +1,67 @@
+import suggest
+from models import ContentType
+from suggest import SuggestIndex, normalize_title
+
+
+def build(titles):
+    index = SuggestIndex()
+    for n, (title, popularity) in enumerate(titles):
+        index.add(f"id-{n}", n, title, ContentType.MOVIE, popularity, None, "1999-03-31")
+    return index
+
+
+def titles(results):
+    return [result["title"] for result in results]
+
+
+def test_normalize_title_strips_case_accents_and_punctuation():
+    assert normalize_title("  Amélie:  The  MOVIE! ") == "amelie the movie"
+
+
+def test_prefix_matches_rank_by_popularity():
+    index = build([("The Matrix", 50.0), ("The Matrix Reloaded", 80.0), ("Mad Max", 90.0), ("Heat", 99.0)])
+    assert titles(index.suggest("mat")) == ["The Matrix Reloaded", "The Matrix"]
+    assert titles(index.suggest("ma")) == ["Mad Max", "The Matrix Reloaded", "The Matrix"]
+
+
+def test_every_query_token_must_prefix_a_title_token():
+    index = build([("The Matrix", 50.0), ("The Thing", 60.0)])
+    assert titles(index.suggest("the mat")) == ["The Matrix"]
+
+
+def test_typos_fall_back_to_fuzzy_matches_after_prefix_hits():
+    index = build([("Interstellar", 70.0), ("Inception", 90.0)])
+    assert titles(index.suggest("intersteller")) == ["Interstellar"]
+    # Short queries get no typo budget
+    assert index.suggest("incp") == []
+
+
+def test_short_prefix_memo_follows_popularity_updates():
+    index = build([("Alien", 10.0), ("Aliens", 20.0)])
+    assert titles(index.suggest("al")) == ["Aliens", "Alien"]
+    index.add("id-0", 0, "Alien", ContentType.MOVIE, 30.0, None, "1979-05-25")
+    assert titles(index.suggest("al")) == ["Alien", "Aliens"]
+
+
+def test_renamed_and_removed_titles_leave_the_index():
+    index = build([("Alien", 10.0)])
+    index.add("id-0", 0, "Predator", ContentType.MOVIE, 10.0, None, None)
+    assert index.suggest("alien") == []
+    assert titles(index.suggest("pred")) == ["Predator"]
+    index.remove("id-0")
+    assert index.suggest("pred") == []
+    assert index.stats()["tokens"] == 0
+
+
+def test_repeated_letter_queries_only_check_a_bounded_candidate_set(monkeypatch):
+    index = build([(f"Aaaa {n}", float(n)) for n in range(500)] + [("Aaaaaa", 1000.0)])
+    assert titles(index.suggest("aaaaaaa"))[0] == "Aaaaaa"
+
+    checked = []
+    distance = suggest._prefix_distance
+    monkeypatch.setattr(suggest, "_prefix_distance", lambda *args: checked.append(args[1]) or distance(*args))
+    index.max_posting_candidates = 50
+    index.max_fuzzy_checks = 20
+    index.suggest("aaaaaaaa")
+    # Every candidate title has at most two word starts to check
+    assert 0 < len(checked) <= 2 * index.max_fuzzy_checks
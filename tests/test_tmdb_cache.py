@@ -0,0 +1,37 @@
+import asyncio
+
+import cache
+import tmdb_service as tmdb_module
+from tests.fakes import fake_database
+
+
+def service_with_fetch(monkeypatch, payloads):
+    service = tmdb_module.TMDBService()
+    monkeypatch.setattr(cache.db, "database", fake_database("tmdb_cache"))
+    fetched = []
+
+    async def fetch(endpoint, params):
+        fetched.append(endpoint)
+        return payloads[len(fetched) - 1]
+
+    monkeypatch.setattr(service, "_fetch", fetch)
+    return service, fetched
+
+
+def test_cached_requests_reuse_the_stored_response(monkeypatch):
+    service, fetched = service_with_fetch(monkeypatch, [{"v": 1}, {"v": 2}])
+    assert asyncio.run(service._make_request("/movie/1")) == {"v": 1}
+    assert asyncio.run(service._make_request("/movie/1")) == {"v": 1}
+    assert fetched == ["/movie/1"]
+
+
+def test_uncached_requests_reach_tmdb_and_replace_the_cached_response(monkeypatch):
+    service, fetched = service_with_fetch(monkeypatch, [{"v": 1}, {"v": 2}])
+    asyncio.run(service._make_request("/movie/1"))
+    assert asyncio.run(service._make_request("/movie/1", use_cache=False)) == {"v": 2}
+    assert fetched == ["/movie/1", "/movie/1"]
+
+    # Both tiers now hold the fresh payload
+    key = service.cache.make_key("/movie/1", {})
+    assert service.cache.get_local(key) == {"v": 2}
+    assert cache.db.database.tmdb_cache.docs[0]["data"] == {"v": 2}